@@ -191,6 +191,12 @@ const AgenticDashboard = () => {
         onStream: (data) => {
           setRunOutput((prev) => prev + data.content);
         },
+        onStreamReset: (data) => {
+          setRunOutput('');
+          setSteps((prev) =>
+            prev.filter((s) => !(s.type === 'final_answer_start' && s.data.iteration === data.iteration)),
+          );
+        },
         onAgentDone: (data) => {
           setDoneInfo(data);
           setSteps((prev) => [
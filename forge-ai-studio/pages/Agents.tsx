@@ -187,6 +187,10 @@ const Agents = () => {
         onStream: (data) => {
           setRunOutput(prev => prev + data.content);
         },
+        onStreamReset: (data) => {
+          setRunOutput('');
+          setSteps(prev => prev.filter(s => !(s.type === 'final_answer_start' && s.data.iteration === data.iteration)));
+        },
         onAgentDone: (data) => {
           setDoneInfo(data);
           setSteps(prev => [...prev, { type: 'agent_done' as const, data, timestamp: Date.now() }]);
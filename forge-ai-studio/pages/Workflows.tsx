@@ -481,6 +481,9 @@ const Workflows = () => {
           [data.step_id]: (prev[data.step_id] || '') + data.content,
         }));
       },
+      onStepStreamReset: (data) => {
+        setPipeStepOutputs((prev) => ({ ...prev, [data.step_id]: '' }));
+      },
       onStepDone: (data) => {
         setPipeStepStates((prev) => ({ ...prev, [data.step_id]: 'done' }));
         setPipeStepOutputs((prev) => ({
@@ -630,6 +633,10 @@ const Workflows = () => {
             setWsSteps((p) => [...p, { type: 'final_answer_start' as const, data: d, timestamp: Date.now() }]);
           },
           onStream: (d) => { setWsOutput((prev) => prev + d.content); },
+          onStreamReset: (d) => {
+            setWsOutput('');
+            setWsSteps((p) => p.filter((s) => !(s.type === 'final_answer_start' && s.data.iteration === d.iteration)));
+          },
           onAgentDone: (d) => {
             setWsDoneInfo(d);
             setWsSteps((p) => [...p, { type: 'agent_done' as const, data: d, timestamp: Date.now() }]);
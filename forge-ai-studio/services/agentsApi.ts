@@ -36,6 +36,9 @@ export interface AgentConfig {
   agentMode: 'simple' | 'react' | 'plan-execute';
   enabledTools: string[];
   maxIterations: number;
+  toolRouterTopK?: number;
+  maxParallelTools?: number;
+  historyWindow?: number;
 }
 
 export interface Agent {
@@ -73,6 +76,7 @@ export type AgentStepType =
   | 'tool_result'
   | 'final_answer_start'
   | 'stream'
+  | 'stream_reset'
   | 'agent_done'
   | 'error';
 
@@ -219,6 +223,8 @@ export interface AgentRunCallbacks {
   onToolResult?: (data: { iteration: number; tool: string; call_id: string; result: string }) => void;
   onFinalAnswerStart?: (data: { iteration: number }) => void;
   onStream?: (data: { content: string }) => void;
+  // Text streamed for this iteration turned out to be a tool-call preamble: drop it
+  onStreamReset?: (data: { iteration: number }) => void;
   onAgentDone?: (data: { iterations: number; tools_used: string[]; total_tool_calls: number }) => void;
   onError?: (data: { message: string }) => void;
   // Fallback for simple mode chunks
@@ -308,6 +314,9 @@ export async function runAgentAgentic(
               case 'stream':
                 callbacks.onStream?.(parsed);
                 break;
+              case 'stream_reset':
+                callbacks.onStreamReset?.(parsed);
+                break;
               case 'agent_done':
                 callbacks.onAgentDone?.(parsed);
                 break;
@@ -684,6 +684,7 @@ export const ENDPOINTS: EndpointDef[] = [
       { event: 'tool_result', description: 'Tool returned a result', dataShape: '{ iteration, tool, call_id, result }' },
       { event: 'final_answer_start', description: 'Agent producing final answer', dataShape: '{ iteration }' },
       { event: 'stream', description: 'Streaming text content', dataShape: '{ content }' },
+      { event: 'stream_reset', description: 'Text streamed in this iteration was a tool-call preamble — discard it', dataShape: '{ iteration }' },
       { event: 'agent_done', description: 'Agent completed', dataShape: '{ iterations, tools_used[], total_tool_calls }' },
       { event: 'error', description: 'Error occurred', dataShape: '{ message }' },
     ],
@@ -809,6 +810,7 @@ export const ENDPOINTS: EndpointDef[] = [
     sseEvents: [
       { event: 'step_start', description: 'Pipeline step started (agent is executing)', dataShape: '{ step_id, index, agent_name, agent_id }' },
       { event: 'step_stream', description: 'Step streaming content chunk', dataShape: '{ step_id, index, content }' },
+      { event: 'step_stream_reset', description: 'Step streamed a tool-call preamble — discard its streamed content', dataShape: '{ step_id, index, iteration }' },
       { event: 'step_done', description: 'Step completed successfully', dataShape: '{ step_id, index, output_preview, output_length }' },
       { event: 'step_error', description: 'Step failed with error', dataShape: '{ step_id, index, error }' },
       { event: 'step_skip', description: 'Step skipped (condition evaluated to false) — defaultOutput stored as output', dataShape: '{ step_id, index, default_output }' },
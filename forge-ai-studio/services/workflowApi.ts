@@ -90,6 +90,7 @@ export async function deleteWorkflow(id: string): Promise<void> {
 export interface WorkflowRunCallbacks {
   onStepStart?: (data: { step_id: string; index: number; agent_name: string; agent_id: string }) => void;
   onStepStream?: (data: { step_id: string; index: number; content: string }) => void;
+  onStepStreamReset?: (data: { step_id: string; index: number; iteration: number }) => void;
   onStepDone?: (data: { step_id: string; index: number; output_preview: string; output_length: number }) => void;
   onStepError?: (data: { step_id: string; index: number; error: string }) => void;
   onStepSkip?: (data: { step_id: string; index: number; default_output: string }) => void;
@@ -164,6 +165,9 @@ export async function runWorkflow(
               case 'step_stream':
                 callbacks.onStepStream?.(parsed);
                 break;
+              case 'step_stream_reset':
+                callbacks.onStepStreamReset?.(parsed);
+                break;
               case 'step_done':
                 callbacks.onStepDone?.(parsed);
                 break;
@@ -1,34 +1,68 @@
 #!/usr/bin/env python3
 """Quick test to verify vLLM backend connectivity from this machine."""
-import urllib.request
+import http.client
 import json
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
 
 CHAT_URL = "http://192.168.1.8:8010/v1"
 EMBED_URL = "http://192.168.1.8:8011/v1"
 
-def test_endpoint(name, url, path="/models"):
+# One keep-alive connection per host and thread; probes run in parallel
+_local = threading.local()
+
+
+def request_json(url, body=None, timeout=5):
+    """GET (or POST when body is given) url over a reused connection; returns (status, json)."""
+    parts = urlsplit(url)
+    conns = _local.__dict__.setdefault("conns", {})
+    conn = conns.get(parts.netloc)
+    if conn is None:
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+        conns[parts.netloc] = conn
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+    try:
+        conn.request(
+            "POST" if body is not None else "GET",
+            parts.path,
+            body=body,
+            headers={"Content-Type": "application/json"},
+        )
+        resp = conn.getresponse()
+        data = resp.read()
+    except Exception:
+        conn.close()
+        conns.pop(parts.netloc, None)
+        raise
+    if resp.status >= 400:
+        raise RuntimeError(f"HTTP Error {resp.status}: {resp.reason}")
+    return resp.status, json.loads(data.decode())
+
+
+def test_endpoint(name, url, path="/models", log=print):
     full_url = f"{url}{path}"
-    print(f"\n{'='*50}")
-    print(f"Testing {name}: {full_url}")
-    print(f"{'='*50}")
+    log(f"\n{'='*50}")
+    log(f"Testing {name}: {full_url}")
+    log(f"{'='*50}")
     try:
-        req = urllib.request.Request(full_url, headers={"Content-Type": "application/json"})
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            data = json.loads(resp.read().decode())
-            if "data" in data:
-                for m in data["data"]:
-                    print(f"  Model: {m['id']}")
-            print(f"  Status: OK ({resp.status})")
-            return True
+        status, data = request_json(full_url, timeout=5)
+        if "data" in data:
+            for m in data["data"]:
+                log(f"  Model: {m['id']}")
+        log(f"  Status: OK ({status})")
+        return True
     except Exception as e:
-        print(f"  FAILED: {e}")
+        log(f"  FAILED: {e}")
         return False
 
-def test_chat():
-    print(f"\n{'='*50}")
-    print(f"Testing Chat Completion: {CHAT_URL}/chat/completions")
-    print(f"{'='*50}")
+def test_chat(log=print):
+    log(f"\n{'='*50}")
+    log(f"Testing Chat Completion: {CHAT_URL}/chat/completions")
+    log(f"{'='*50}")
     try:
         body = json.dumps({
             "model": "Qwen/Qwen3-4B",
@@ -36,56 +70,58 @@ def test_chat():
             "max_tokens": 32,
             "temperature": 0.1,
         }).encode()
-        req = urllib.request.Request(
-            f"{CHAT_URL}/chat/completions",
-            data=body,
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
-        with urllib.request.urlopen(req, timeout=30) as resp:
-            data = json.loads(resp.read().decode())
-            content = data["choices"][0]["message"]["content"]
-            print(f"  Response: {content[:100]}")
-            print(f"  Tokens: {data.get('usage', {})}")
-            print(f"  Status: OK")
-            return True
+        _, data = request_json(f"{CHAT_URL}/chat/completions", body=body, timeout=30)
+        content = data["choices"][0]["message"]["content"]
+        log(f"  Response: {content[:100]}")
+        log(f"  Tokens: {data.get('usage', {})}")
+        log(f"  Status: OK")
+        return True
     except Exception as e:
-        print(f"  FAILED: {e}")
+        log(f"  FAILED: {e}")
         return False
 
-def test_embedding():
-    print(f"\n{'='*50}")
-    print(f"Testing Embeddings: {EMBED_URL}/embeddings")
-    print(f"{'='*50}")
+def test_embedding(log=print):
+    log(f"\n{'='*50}")
+    log(f"Testing Embeddings: {EMBED_URL}/embeddings")
+    log(f"{'='*50}")
     try:
         body = json.dumps({
             "model": "nomic-ai/nomic-embed-text-v1.5",
             "input": ["Hello world"],
         }).encode()
-        req = urllib.request.Request(
-            f"{EMBED_URL}/embeddings",
-            data=body,
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            data = json.loads(resp.read().decode())
-            emb = data["data"][0]["embedding"]
-            print(f"  Dimensions: {len(emb)}")
-            print(f"  First 5 values: {emb[:5]}")
-            print(f"  Tokens: {data.get('usage', {})}")
-            print(f"  Status: OK")
-            return True
+        _, data = request_json(f"{EMBED_URL}/embeddings", body=body, timeout=15)
+        emb = data["data"][0]["embedding"]
+        log(f"  Dimensions: {len(emb)}")
+        log(f"  First 5 values: {emb[:5]}")
+        log(f"  Tokens: {data.get('usage', {})}")
+        log(f"  Status: OK")
+        return True
     except Exception as e:
-        print(f"  FAILED: {e}")
+        log(f"  FAILED: {e}")
         return False
 
 if __name__ == "__main__":
-    results = []
-    results.append(("Chat Models", test_endpoint("Chat Server", CHAT_URL)))
-    results.append(("Embed Models", test_endpoint("Embed Server", EMBED_URL)))
-    results.append(("Chat Completion", test_chat()))
-    results.append(("Embeddings", test_embedding()))
+    probes = [
+        ("Chat Models", lambda log: test_endpoint("Chat Server", CHAT_URL, log=log)),
+        ("Embed Models", lambda log: test_endpoint("Embed Server", EMBED_URL, log=log)),
+        ("Chat Completion", test_chat),
+        ("Embeddings", test_embedding),
+    ]
+
+    # Probes are independent and I/O-bound: run them concurrently, buffer each
+    # probe's output and print it in the original order afterwards
+    def run_probe(fn):
+        lines = []
+        ok = fn(lambda *args: lines.append(" ".join(str(a) for a in args)))
+        return ok, lines
+
+    with ThreadPoolExecutor(max_workers=len(probes)) as ex:
+        futures = [(name, ex.submit(run_probe, fn)) for name, fn in probes]
+        results = []
+        for name, fut in futures:
+            ok, lines = fut.result()
+            print("\n".join(lines))
+            results.append((name, ok))
 
     print(f"\n{'='*50}")
     print("SUMMARY")
@@ -2,85 +2,259 @@
 """
 ITSM Chatbot Test Runner — 25 Son Kullanıcı Senaryosu
 Workflow "ITSM Destek Hattı" üzerinden test eder.
-Çıktı: itsm-chatbot-test-results.json + terminale özet
+Çıktı: itsm-chatbot-test-results.json (özet) + itsm-chatbot-test-results.ndjson
+       (senaryo sonuçları, tamamlandıkça yazılır) + terminale özet
+
+Kullanım:
+  python3 itsm-chatbot-test-runner.py                  # cache açık (exact)
+  python3 itsm-chatbot-test-runner.py --no-cache       # tüm senaryolar workflow'a gider
+  python3 itsm-chatbot-test-runner.py --cache-semantic # benzer sorular da cache'ten (hızlı, otoriter değil)
 """
 
-import urllib.request
+import http.client
+import hashlib
 import json
 import re
 import time
+import shutil
+import statistics
 import sys
 import os
+import threading
 import unicodedata
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urlsplit
+
+try:
+    import numpy as np  # semantic cache tier için opsiyonel
+except ImportError:
+    np = None
+
+try:
+    import orjson  # SSE parse + sonuç yazımı için hızlı JSON, opsiyonel
+except ImportError:
+    orjson = None
+
+try:
+    import ahocorasick  # pyahocorasick — tek geçişte keyword tarama, opsiyonel
+except ImportError:
+    ahocorasick = None
 
 # ─── Config ────────────────────────────────────────────────────────────────
 BASE         = "http://localhost:8833"
 WORKFLOW_ID  = "cc736a1d-d7a5-4a5d-a9a1-81415f26b235"  # ITSM Destek Hattı
 SCENARIOS_F  = os.path.join(os.path.dirname(__file__), "itsm-chatbot-scenarios.json")
 RESULTS_F    = os.path.join(os.path.dirname(__file__), "itsm-chatbot-test-results.json")
+RESULTS_ND_F = os.path.join(os.path.dirname(__file__), "itsm-chatbot-test-results.ndjson")  # senaryo başına 1 satır
 TIMEOUT      = 120   # saniye / istek (workflow 2 step, daha uzun sürebilir)
-DELAY        = 1.0   # istek arası bekleme
+DELAY        = 1.0   # token bucket: RATE_BURST istek / DELAY saniye
+CONCURRENCY  = 4     # aynı anda çalışan workflow sayısı
+RATE_BURST   = 4     # token bucket kapasitesi (art arda gönderilebilecek istek)
+
+# Response cache: exact (workflow + agent config hash'i, normalize edilmiş soru) +
+# opsiyonel semantic (cosine ≥ CACHE_SIM, sadece --cache-semantic ile)
+CACHE_F      = os.path.join(os.path.dirname(__file__), "itsm-chatbot-cache.json")
+CACHE_EMB_F  = os.path.join(os.path.dirname(__file__), "itsm-chatbot-cache.npy")   # (N, D) float16
+CACHE_SIM    = 0.95
+EMBED_URL    = f"{BASE}/api/embed"   # KB reverse proxy → vLLM embed
+EMBED_MODEL  = "nomic-ai/nomic-embed-text-v1.5"
+
+# ─── JSON helpers ──────────────────────────────────────────────────────────
+def json_loads(data: str | bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def json_dump_bytes(obj) -> bytes:
+    """Pretty-printed UTF-8 JSON (ensure_ascii=False, indent=2 eşdeğeri)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def json_line_bytes(obj) -> bytes:
+    """Tek satır UTF-8 JSON + newline (NDJSON kaydı)."""
+    if orjson is not None:
+        return orjson.dumps(obj) + b"\n"
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    """dst'yi src'ye hardlink yapar; desteklenmiyorsa (Windows / farklı fs) kopyalar."""
+    try:
+        os.unlink(dst)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
 
 # ─── Turkish normalization for fuzzy matching ─────────────────────────────────
+def _build_tr_table() -> dict[int, str]:
+    """
+    Türkçe harfler + Latin-1/Latin Extended-A aksanlı harfler → ASCII küçük harf.
+    Tek bir str.translate ile lower + aksan temizliğinin büyük kısmı yapılır.
+    """
+    table = {ord("ı"): "i", ord("I"): "i"}
+    for cp in range(0xC0, 0x180):
+        ch = chr(cp)
+        base = "".join(c for c in unicodedata.normalize("NFKD", ch) if not unicodedata.combining(c))
+        if len(base) == 1 and base.isascii() and base.isalpha():
+            table[cp] = base.lower()
+    return table
+
+
+_TR_TABLE = _build_tr_table()
+
+
+@lru_cache(maxsize=4096)
 def normalize_turkish(text: str) -> str:
     """Normalize Turkish text: lowercase + strip accents for fuzzy comparison."""
-    text = text.lower()
-    # Turkish-specific: ı→i, ş→s, ç→c, ğ→g, ö→o, ü→u, İ→i
-    tr_map = str.maketrans("ıİşŞçÇğĞöÖüÜ", "iisscccgoouU")
-    text = text.translate(tr_map)
-    # Strip remaining unicode accents
+    # Translate önce: İ.lower() birleşik nokta (U+0307) üretir, tablo bunu önler
+    text = text.translate(_TR_TABLE).lower()
+    if text.isascii():
+        return text
+    # Tabloda olmayan aksanlar için NFKD fallback
     nfkd = unicodedata.normalize("NFKD", text)
     return "".join(c for c in nfkd if not unicodedata.combining(c))
 
 
 # ─── Check fonksiyonları ────────────────────────────────────────────────────
-CHECKS = {
-    "no_email": lambda t: not bool(
-        re.search(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', t)
-    ),
-    "no_chinese": lambda t: not bool(
-        re.search(r'[\u4e00-\u9fff\u3400-\u4dbf\U00020000-\U0002a6df]', t)
-    ),
-    "has_turkish": lambda t: bool(
-        re.search(r'[ğüşöçıİĞÜŞÖÇ]', t)
-    ),
-    "has_content": lambda t: len(t.strip()) > 50,
-    "has_form_reference": lambda t: bool(
-        re.search(r'(?i)(form|formu|formuler|şablon)', t)
-    ),
-    "is_out_of_scope": lambda t: any(k in t.lower() for k in [
-        "bilgi tabanımda", "bulamadım", "yeterli bilgi",
-        "kapsam", "it destek", "ilgili değil", "bu konuda"
-    ]),
-}
+# Pattern'ler modül yüklenirken bir kez derlenir; check'ler doğrudan .search çağırır
+_EMAIL_RE   = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+_CJK_RE     = re.compile(r'[\u4e00-\u9fff\u3400-\u4dbf\U00020000-\U0002a6df]')
+_TR_RE      = re.compile(r'[ğüşöçıİĞÜŞÖÇ]')
+_FORM_RE    = re.compile(r'(form|formu|formuler|şablon)', re.IGNORECASE)
+
+# "Kapsam dışı" ifadeleri tek alternation regex'te; ham yanıt üzerinde IGNORECASE
+# arama .lower() kopyası gerektirmez ve Türkçe I/ı/İ/i varyantlarını da eşler
+# ("BULAMADIM", "İT destek" gibi — str.lower() bunları kaçırır).
+OUT_OF_SCOPE_PHRASES = (
+    "bilgi tabanımda", "bulamadım", "yeterli bilgi",
+    "kapsam", "it destek", "ilgili değil", "bu konuda",
+)
+_OOS_RE     = re.compile("|".join(map(re.escape, OUT_OF_SCOPE_PHRASES)), re.IGNORECASE)
 
 # Parametric checks (need extra data from scenario)
-def check_form_match(answer: str, expected_form: str | None) -> bool:
-    """Fuzzy match: expected_form must appear in answer (Turkish-normalized)."""
+def check_form_match(answer: str, expected_form: str | None, norm_form: str | None = None,
+                     answer_lower: str | None = None) -> bool:
+    """Fuzzy match: expected_form must appear in answer (Turkish-normalized).
+    norm_form: senaryo yüklenirken önceden normalize edilmiş expected_form.
+    answer_lower: senaryo başına bir kez hesaplanmış answer.lower()."""
     if expected_form is None:
         return True
-    norm_answer = normalize_turkish(answer)
-    norm_form = normalize_turkish(expected_form)
-    return norm_form in norm_answer
+    if answer_lower is None:
+        answer_lower = answer.lower()
+    # ASCII fast path: tek C-level substring taraması, normalize kopyası üretmeden
+    if expected_form.isascii() and expected_form.lower() in answer_lower:
+        return True
+    if norm_form is None:
+        norm_form = normalize_turkish(expected_form)
+    return norm_form in normalize_turkish(answer)
+
+
+@lru_cache(maxsize=256)
+def _build_ac(keywords: tuple):
+    """Lowercase keyword tuple'ı için finalize edilmiş Aho-Corasick automaton."""
+    automaton = ahocorasick.Automaton()
+    for kw in keywords:
+        automaton.add_word(kw, kw)
+    automaton.make_automaton()
+    return automaton
+
+
+def match_keywords(answer_lower: str, kws_lower: tuple) -> set[str]:
+    """Return the set of lowercased keywords present in answer_lower (single pass)."""
+    if not kws_lower:
+        return set()
+    if ahocorasick is not None:
+        return {v for _, v in _build_ac(kws_lower).iter(answer_lower)}
+    return {kw for kw in kws_lower if kw in answer_lower}
 
 
-def check_has_keywords(answer: str, expected_keywords: list, min_ratio: float = 0.5) -> bool:
+def check_has_keywords(answer_lower: str, kws_lower: tuple, min_ratio: float = 0.5,
+                       matches: set[str] | None = None) -> bool:
     """At least 50% of expected keywords must appear in answer."""
-    if not expected_keywords:
-        return True
-    answer_lower = answer.lower()
-    found = sum(1 for kw in expected_keywords if kw.lower() in answer_lower)
-    return found / len(expected_keywords) >= min_ratio
+    return keyword_ratio(answer_lower, kws_lower, matches) >= min_ratio
 
 
-def keyword_ratio(answer: str, expected_keywords: list) -> float:
+def keyword_ratio(answer_lower: str, kws_lower: tuple, matches: set[str] | None = None) -> float:
     """Return the ratio of found keywords (0.0–1.0)."""
-    if not expected_keywords:
+    if not kws_lower:
         return 1.0
-    answer_lower = answer.lower()
-    found = sum(1 for kw in expected_keywords if kw.lower() in answer_lower)
-    return found / len(expected_keywords)
+    if matches is None:
+        matches = match_keywords(answer_lower, kws_lower)
+    found = sum(1 for kw in kws_lower if kw in matches)
+    return found / len(kws_lower)
+
+
+def prepare_scenario(sc: dict) -> dict:
+    """Senaryonun sabit tarafını (expected_form / keywords) bir kez normalize eder."""
+    exp_form = sc.get("expected_form")
+    sc["_norm_form"] = normalize_turkish(exp_form) if exp_form else None
+    sc["_kw_lower"] = tuple(kw.lower() for kw in sc.get("expected_keywords", []))
+    return sc
+
+
+# Tüm check'ler (parametrik olanlar dahil) tek imza ile:
+#   (answer, answer_lower, scenario, kw_matches) -> bool
+# answer_lower ve kw_matches senaryo başına bir kez hesaplanıp paylaşılır.
+CHECK_FNS = {
+    "has_content":        lambda a, al, sc, km: len(a.strip()) > 50,
+    "has_turkish":        lambda a, al, sc, km: _TR_RE.search(a) is not None,
+    "no_email":           lambda a, al, sc, km: _EMAIL_RE.search(a) is None,
+    "no_chinese":         lambda a, al, sc, km: _CJK_RE.search(a) is None,
+    "has_form_reference": lambda a, al, sc, km: _FORM_RE.search(a) is not None,
+    "is_out_of_scope":    lambda a, al, sc, km: _OOS_RE.search(a) is not None,
+    "form_match":         lambda a, al, sc, km: check_form_match(a, sc.get("expected_form"), sc["_norm_form"], al),
+    "has_keywords":       lambda a, al, sc, km: check_has_keywords(al, sc["_kw_lower"], matches=km),
+}
+
+# Artan maliyet sırası: ucuz check'ler önce koşar
+CHECK_ORDER = tuple(CHECK_FNS)
+_CHECK_RANK = {ck: n for n, ck in enumerate(CHECK_ORDER)}
+
+
+@lru_cache(maxsize=64)
+def _compile_checks(checks: tuple):
+    """
+    Senaryonun sabit check tuple'ı için tek bir fused fonksiyon üretir (exec ile).
+    Üretilen fonksiyon check'leri maliyet sırasıyla doğrudan çağırır — dict lookup
+    ve Python döngüsü yok. Aynı check setini paylaşan senaryolar aynı fonksiyonu kullanır.
+    """
+    checks = tuple(dict.fromkeys(checks))
+    ns = {}
+    body = ["def _fused(a, al, sc, km):"]
+    for ck in sorted(checks, key=lambda c: _CHECK_RANK.get(c, len(CHECK_ORDER))):
+        n = checks.index(ck)
+        if ck in CHECK_FNS:
+            ns[f"_f{n}"] = CHECK_FNS[ck]
+            body.append(f"    c{n} = _f{n}(a, al, sc, km)")
+        else:
+            body.append(f"    c{n} = None")
+    results = ", ".join(f"{ck!r}: c{n}" for n, ck in enumerate(checks))
+    body.append(f"    cr = {{{results}}}")
+    body.append("    ff = []")
+    for n, ck in enumerate(checks):
+        body.append(f"    if c{n} is False: ff.append({ck!r})")
+    body.append("    return cr, ff")
+    exec("\n".join(body), ns)
+    return ns["_fused"]
+
+
+def evaluate_checks(checks: list, answer: str, answer_lower: str, sc: dict,
+                    kw_matches: set[str]) -> tuple[dict, list]:
+    """
+    Senaryonun check'lerini maliyet sırasıyla çalıştırır.
+    Returns: (check_results, failed_checks) — ikisi de senaryodaki check sırasıyla.
+    Bilinmeyen check'ler None olarak işaretlenir.
+    """
+    return _compile_checks(tuple(checks))(answer, answer_lower, sc, kw_matches)
 
 
 CHECK_LABELS = {
@@ -94,7 +268,82 @@ CHECK_LABELS = {
     "has_keywords":      "Anahtar kelimeler",
 }
 
+# ─── HTTP (keep-alive) ─────────────────────────────────────────────────────
+# Her worker thread'i BASE'e tek bir kalıcı bağlantı tutar; senaryo başına
+# yeni TCP bağlantısı açılmaz.
+_BASE_URL = urlsplit(BASE)
+_conn_local = threading.local()
+
+
+def _get_conn() -> http.client.HTTPConnection:
+    conn = getattr(_conn_local, "conn", None)
+    if conn is None:
+        conn = http.client.HTTPConnection(_BASE_URL.hostname, _BASE_URL.port, timeout=TIMEOUT)
+        _conn_local.conn = conn
+    return conn
+
+
+def _drop_conn() -> None:
+    conn = getattr(_conn_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _conn_local.conn = None
+
+
+def http_post(path: str, payload: bytes, headers: dict) -> http.client.HTTPResponse:
+    """
+    Thread'in kalıcı bağlantısı üzerinden POST atar.
+    Sunucu boşta bağlantıyı kapattıysa bir kez yeniden bağlanır.
+    Yanıt tamamen okunmalı (veya _drop_conn çağrılmalı) ki bağlantı tekrar kullanılabilsin.
+    """
+    return _request("POST", path, payload, {"Content-Type": "application/json", **headers})
+
+
+def http_get_json(path: str):
+    """Kalıcı bağlantı üzerinden GET; JSON gövdeyi parse edip döner."""
+    return json_loads(_request("GET", path, None, {}).read())
+
+
+def _request(method: str, path: str, payload: bytes | None, headers: dict) -> http.client.HTTPResponse:
+    for attempt in range(2):
+        conn = _get_conn()
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            resp = conn.getresponse()
+        except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                ConnectionResetError, BrokenPipeError):
+            _drop_conn()
+            if attempt == 1:
+                raise
+            continue
+        if resp.status >= 400:
+            body = resp.read()[:200].decode("utf-8", "replace")
+            raise RuntimeError(f"HTTP {resp.status}: {body}")
+        return resp
+
+
 # ─── SSE Workflow Runner ───────────────────────────────────────────────────
+SSE_READ_SIZE = 65536  # tek read'de alınacak maksimum byte
+
+
+def iter_sse_lines(resp):
+    """
+    SSE yanıtını büyük buffer'larla okuyup satır satır (decoded, strip edilmiş) döner.
+    http.client'ın satır başına readline'ı yerine read1 ile mevcut tüm byte'lar alınır.
+    """
+    buf = b""
+    while True:
+        chunk = resp.read1(SSE_READ_SIZE)
+        if not chunk:
+            break
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").strip()
+    if buf:
+        yield buf.decode("utf-8").strip()
+
+
 def run_workflow(question: str) -> dict:
     """
     Workflow'u çalıştırır, step çıktılarını ve final yanıtı döner.
@@ -104,53 +353,53 @@ def run_workflow(question: str) -> dict:
         "variables": {"soru": question}
     }).encode()
 
-    req = urllib.request.Request(
-        f"{BASE}/api/kb/workflows/{WORKFLOW_ID}/run",
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "Accept": "text/event-stream"
-        },
-        method="POST"
-    )
-
     steps = []
     current_step_id = None
-    current_step_text = ""
+    step_parts: list[str] = []   # aktif step'in stream parçaları, step_done'da join edilir
     final_output = ""
     t0 = time.time()
 
+    done = False
     try:
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
+        r = http_post(
+            f"{_BASE_URL.path}/api/kb/workflows/{WORKFLOW_ID}/run",
+            payload,
+            {"Accept": "text/event-stream"},
+        )
+        try:
             current_event = None
-            for line in r:
-                decoded = line.decode("utf-8").strip()
+            for decoded in iter_sse_lines(r):
                 if decoded.startswith("event: "):
                     current_event = decoded[7:]
                 elif decoded.startswith("data: "):
                     chunk = decoded[6:]
                     if chunk == "[DONE]":
+                        done = True
                         break
                     try:
-                        obj = json.loads(chunk)
+                        obj = json_loads(chunk)
 
                         if current_event == "step_start":
                             current_step_id = obj.get("step_id", "")
-                            current_step_text = ""
+                            step_parts = []
 
                         elif current_event == "stream":
-                            content = obj.get("content", "")
-                            current_step_text += content
-                            final_output = current_step_text  # son step'in çıktısı = final
+                            step_parts.append(obj.get("content", ""))
+
+                        elif current_event in ("stream_reset", "step_stream_reset"):
+                            step_parts = []  # tool-call preamble, not the step's answer
 
                         elif current_event == "step_done":
-                            step_output = obj.get("output_preview", current_step_text)
+                            step_text = "".join(step_parts)
+                            if step_text:
+                                final_output = step_text  # son step'in çıktısı = final
+                            step_output = obj.get("output_preview") or step_text
                             steps.append({
                                 "step_id": current_step_id or obj.get("step_id", ""),
                                 "output": step_output,
                                 "output_len": len(step_output),
                             })
-                            current_step_text = ""
+                            step_parts = []
 
                         elif current_event == "error":
                             return {
@@ -162,7 +411,14 @@ def run_workflow(question: str) -> dict:
 
                     except Exception:
                         pass
+        finally:
+            # Stream sonuna kadar okunmadıysa bağlantı tekrar kullanılamaz
+            if done:
+                r.read()
+            if not r.isclosed():
+                _drop_conn()
     except Exception as e:
+        _drop_conn()
         return {
             "steps": steps,
             "final_output": f"[NETWORK_ERROR: {e}]",
@@ -170,6 +426,10 @@ def run_workflow(question: str) -> dict:
             "error": True,
         }
 
+    # step_done gelmeden biten stream: biriken parçalar son step'in çıktısıdır
+    if step_parts:
+        final_output = "".join(step_parts)
+
     # Eğer step_done event'lerinden son step'in çıktısını alamadıysak,
     # stream'den biriken text'i kullan
     if not final_output and steps:
@@ -183,159 +443,456 @@ def run_workflow(question: str) -> dict:
     }
 
 
+# ─── Response cache ──────────────────────────────────────────────────────────
+def embed_texts(texts: list[str]) -> list[list[float]]:
+    """Embed API'ye tek batch istekle metinlerin embedding'lerini döner (EMBED_URL, BASE ile aynı host)."""
+    payload = json.dumps({"model": EMBED_MODEL, "input": texts}).encode()
+    r = http_post(f"{urlsplit(EMBED_URL).path}/embeddings", payload, {})
+    data = sorted(json_loads(r.read())["data"], key=lambda d: d.get("index", 0))
+    return [d["embedding"] for d in data]
+
+
+def workflow_config_hash() -> str | None:
+    """
+    Workflow tanımı + step agent'larının config'lerinin hash'i; alınamazsa None
+    (cache devre dışı kalır). itsm-improve.py config'leri değiştirince anahtar değişir.
+    """
+    try:
+        wf = http_get_json(f"{_BASE_URL.path}/api/kb/workflows/{WORKFLOW_ID}")
+        steps = wf.get("steps", [])
+        agents = {}
+        for step in steps:
+            agent_id = step.get("agentId")
+            if agent_id and agent_id not in agents:
+                agent = http_get_json(f"{_BASE_URL.path}/api/kb/agents/{agent_id}")
+                agents[agent_id] = agent.get("config", {})
+    except Exception:
+        return None
+    cfg = json.dumps({"steps": steps, "agents": agents}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(cfg.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    İki katmanlı workflow yanıt cache'i.
+    1. Exact: sha256(config hash | normalize_turkish(soru)) → kayıt (dict lookup)
+    2. Semantic (semantic=True, --cache-semantic): soru embedding'i ile aynı config'in
+       cache satırları arasında cosine ≥ CACHE_SIM. Başka bir senaryonun yanıtı
+       dönebileceği için varsayılan koşuda kapalıdır.
+    Semantic katman numpy veya embed API yoksa sessizce devre dışı kalır.
+
+    Kayıtlar (meta) JSON'da, embedding'ler ayrı bir float16 .npy matrisinde tutulur;
+    matris mmap ile açılır, kayıt "row" alanı matristeki satırı gösterir.
+    Yeni embedding'ler bellekte biriktirilir ve save() ile matrise eklenir.
+    Kayıt: {question, cfg, final_output, steps, row}
+    """
+
+    def __init__(self, path: str, emb_path: str, cfg_hash: str, semantic: bool = False):
+        self.path = path
+        self.emb_path = emb_path
+        self.cfg_hash = cfg_hash
+        self.semantic = semantic and np is not None
+        self.lock = threading.Lock()
+        self.entries: dict[str, dict] = {}
+        self.dirty = False
+        self._emb = None                  # mmap (N, D) float16 — diskteki satırlar
+        self._row_keys: list[str] = []    # satır → kayıt anahtarı (disk + pending)
+        self._row_ok: list[bool] = []     # satır bu koşunun config'ine mi ait
+        self._pending: list = []          # henüz diske yazılmamış float32 vektörler
+        self._qvecs: dict[str, object] = {}  # prime() ile önceden embed edilmiş sorular
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        if self.semantic and os.path.exists(emb_path):
+            self._emb = np.load(emb_path, mmap_mode="r")
+        n_rows = len(self._emb) if self._emb is not None else 0
+        self._row_keys = [None] * n_rows
+        for k, e in self.entries.items():
+            row = e.get("row")
+            if row is not None and row < n_rows:
+                self._row_keys[row] = k
+            elif self.semantic:
+                e["row"] = None
+        self._row_ok = [k is not None and self.entries[k].get("cfg") == cfg_hash for k in self._row_keys]
+
+    def key(self, question: str) -> str:
+        return hashlib.sha256(f"{self.cfg_hash}|{normalize_turkish(question)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _unit(vecs):
+        """(N, D) float32, satır bazında unit-normalized; sıfır vektörler None olur."""
+        mat = np.asarray(vecs, dtype=np.float32)
+        norms = np.linalg.norm(mat, axis=1, keepdims=True)
+        return [v / n[0] if n[0] > 0 else None for v, n in zip(mat, norms)]
+
+    def prime(self, questions: list[str]) -> int:
+        """
+        Exact cache'te olmayan tüm soruları tek batch istekle embed eder;
+        get() sonrasında tek tek embed isteği atmaz. Returns: embed edilen soru sayısı.
+        """
+        if not self.semantic:
+            return 0
+        todo = list(dict.fromkeys(q for q in questions if self.key(q) not in self.entries))
+        if not todo:
+            return 0
+        try:
+            vecs = self._unit(embed_texts(todo))
+        except Exception:
+            return 0
+        for q, v in zip(todo, vecs):
+            if v is not None:
+                self._qvecs[self.key(q)] = v
+        return len(todo)
+
+    def _embed(self, question: str):
+        if not self.semantic:
+            return None
+        primed = self._qvecs.get(self.key(question))
+        if primed is not None:
+            return primed
+        try:
+            return self._unit(embed_texts([question]))[0]
+        except Exception:
+            return None
+
+    def _similarities(self, q_vec):
+        """Tüm satırlar (disk + pending) için cosine benzerlikleri; vektörler unit-normalized."""
+        parts = []
+        if self._emb is not None and len(self._emb) and self._emb.shape[1] == q_vec.shape[0]:
+            parts.append(self._emb.astype(np.float32) @ q_vec)
+        elif self._emb is not None:
+            parts.append(np.full(len(self._emb), -1.0, dtype=np.float32))
+        if self._pending:
+            pend = [v if v.shape == q_vec.shape else np.zeros_like(q_vec) for v in self._pending]
+            parts.append(np.stack(pend) @ q_vec)
+        return np.concatenate(parts) if parts else None
+
+    def get(self, question: str) -> tuple[dict | None, str | None, object]:
+        """Returns: (kayıt, hit türü "exact"/"semantic", soru embedding'i)"""
+        k = self.key(question)
+        with self.lock:
+            hit = self.entries.get(k)
+        if hit is not None:
+            return hit, "exact", None
+
+        q_vec = self._embed(question)
+        if q_vec is None:
+            return None, None, None
+        with self.lock:
+            sims = self._similarities(q_vec)
+            if sims is None or not len(sims):
+                return None, None, q_vec
+            # Başka config'le üretilmiş satırlar eşleşmez
+            sims = np.where(np.asarray(self._row_ok, dtype=bool), sims, -1.0)
+            best = int(sims.argmax())
+            best_key = self._row_keys[best]
+            if sims[best] >= CACHE_SIM and best_key is not None:
+                return self.entries[best_key], "semantic", q_vec
+        return None, None, q_vec
+
+    def put(self, question: str, result: dict, q_vec=None) -> None:
+        entry = {
+            "question": question,
+            "cfg": self.cfg_hash,
+            "final_output": result["final_output"],
+            "steps": [{"step_id": s["step_id"], "output_len": s["output_len"]} for s in result["steps"]],
+            "row": None,
+        }
+        k = self.key(question)
+        with self.lock:
+            if q_vec is not None:
+                entry["row"] = len(self._row_keys)
+                self._row_keys.append(k)
+                self._row_ok.append(True)
+                self._pending.append(q_vec.astype(np.float32))
+            self.entries[k] = entry
+            self.dirty = True
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        with self.lock:
+            if self._pending:
+                new = np.stack(self._pending).astype(np.float16)
+                old_n = len(self._emb) if self._emb is not None else 0
+                if old_n and self._emb.shape[1] == new.shape[1]:
+                    new = np.concatenate([np.asarray(self._emb, dtype=np.float16), new])
+                elif old_n:
+                    # Boyut değişti (ör. farklı embed modeli): eski satırlar atılır
+                    for e in self.entries.values():
+                        if e["row"] is not None:
+                            e["row"] = e["row"] - old_n if e["row"] >= old_n else None
+                    self._row_keys = self._row_keys[old_n:]
+                    self._row_ok = self._row_ok[old_n:]
+                tmp = self.emb_path + ".tmp.npy"
+                np.save(tmp, new)
+                os.replace(tmp, self.emb_path)
+                self._emb = np.load(self.emb_path, mmap_mode="r")
+                self._pending = []
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self.dirty = False
+
+
+# ─── Rate limit ──────────────────────────────────────────────────────────────
+class TokenBucket:
+    """
+    Thread-safe token bucket: capacity kadar istek art arda geçer,
+    sonra saniyede rate token dolar. Sabit sleep'in aksine hızlı biten
+    istekler boşuna beklemez.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+                self.ts = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def run_workflow_cached(question: str, cache: "ResponseCache | None",
+                        limiter: TokenBucket | None = None) -> dict:
+    """run_workflow'un önüne cache ve rate limit koyar; hatalı sonuçlar cache'lenmez."""
+    if cache is None:
+        if limiter:
+            limiter.acquire()
+        return run_workflow(question)
+
+    t0 = time.time()
+    hit, kind, q_vec = cache.get(question)
+    if hit is not None:
+        return {
+            "steps": hit["steps"],
+            "final_output": hit["final_output"],
+            "total_elapsed": time.time() - t0,
+            "error": False,
+            "cached": kind,
+        }
+
+    if limiter:
+        limiter.acquire()
+    result = run_workflow(question)
+    if not result["error"]:
+        cache.put(question, result, q_vec)
+    return result
+
+
+# ─── Tek senaryo ─────────────────────────────────────────────────────────────
+def run_scenario(i: int, total: int, sc: dict, cache: ResponseCache | None = None,
+                 limiter: TokenBucket | None = None) -> tuple[dict, list[str]]:
+    """
+    Tek senaryoyu çalıştırır ve check'leri uygular.
+    Returns: (result kaydı, terminale basılacak satırlar)
+    Satırlar toplu döner ki paralel worker'ların çıktısı birbirine karışmasın.
+    """
+    sid       = sc["id"]
+    cat       = sc["category"]
+    diff      = sc["difficulty"]
+    tone      = sc["user_tone"]
+    question  = sc["question"]
+    checks    = sc["checks"]
+    exp_form  = sc.get("expected_form")
+    exp_kw    = sc.get("expected_keywords", [])
+    kw_lower  = sc["_kw_lower"]
+
+    lines = [
+        f"[{i:02d}/{total}] {sid} — {cat} ({diff}/{tone})",
+        f"  Soru: {question[:90]}{'...' if len(question) > 90 else ''}",
+    ]
+
+    result = run_workflow_cached(question, cache, limiter)
+    answer = result["final_output"]
+    elapsed = result["total_elapsed"]
+    step_count = len(result["steps"])
+
+    # Keyword'ler tek geçişte taranır; check'ler ve detay takibi aynı sonucu kullanır
+    answer_lower = answer.lower()
+    kw_matches = match_keywords(answer_lower, kw_lower)
+
+    # Check'leri uygula
+    check_results, failed_checks = evaluate_checks(checks, answer, answer_lower, sc, kw_matches)
+
+    # Keyword detail tracking
+    kw_ratio = keyword_ratio(answer_lower, kw_lower, kw_matches)
+    kw_found = [kw for kw, kl in zip(exp_kw, kw_lower) if kl in kw_matches]
+    kw_missing = [kw for kw, kl in zip(exp_kw, kw_lower) if kl not in kw_matches]
+
+    scenario_pass = len(failed_checks) == 0 and not result.get("error")
+    status = "✅ PASS" if scenario_pass else "❌ FAIL"
+
+    # Terminale özet
+    check_str = "  ".join(
+        f"{'✓' if v else '✗'} {CHECK_LABELS.get(k, k)}"
+        for k, v in check_results.items()
+        if v is not None
+    )
+    cached = result.get("cached")
+    cache_tag = f", cache:{cached}" if cached else ""
+    lines.append(f"  {status}  ({elapsed:.1f}s, {step_count} step{cache_tag})  {check_str}")
+
+    if exp_form and "form_match" in check_results:
+        fm_ok = check_results["form_match"]
+        lines.append(f"  {'✓' if fm_ok else '✗'} Form: {exp_form}")
+
+    if kw_found:
+        lines.append(f"  🔑 Bulunan: {kw_found}  ({kw_ratio:.0%})")
+    if kw_missing:
+        lines.append(f"  ⚠️  Eksik keyword: {kw_missing}")
+
+    if not scenario_pass:
+        if failed_checks:
+            lines.append(f"  ❌ Başarısız check: {failed_checks}")
+        snippet = answer[:250].replace("\n", " ")
+        lines.append(f"  Yanıt: {snippet}{'...' if len(answer) > 250 else ''}")
+
+    record = {
+        "id":             sid,
+        "category":       cat,
+        "difficulty":     diff,
+        "user_tone":      tone,
+        "question":       question,
+        "expected_form":  exp_form,
+        "answer":         answer,
+        "answer_len":     len(answer),
+        "elapsed_sec":    round(elapsed, 2),
+        "step_count":     step_count,
+        "step_details":   [{"step_id": s["step_id"], "output_len": s["output_len"]} for s in result["steps"]],
+        "checks":         check_results,
+        "failed_checks":  failed_checks,
+        "keywords_found": kw_found,
+        "keywords_missing": kw_missing,
+        "keyword_ratio":  round(kw_ratio, 2),
+        "form_match":     check_results.get("form_match"),
+        "pass":           scenario_pass,
+        "error":          result.get("error", False),
+        "cached":         cached,
+    }
+    return record, lines
+
+
 # ─── Ana test döngüsü ────────────────────────────────────────────────────────
-def run_all():
+def run_all(use_cache: bool = True, semantic: bool = False):
     with open(SCENARIOS_F, encoding="utf-8") as f:
-        scenarios = json.load(f)
+        scenarios = [prepare_scenario(sc) for sc in json.load(f)]
+
+    cfg_hash = workflow_config_hash() if use_cache else None
+    cache = ResponseCache(CACHE_F, CACHE_EMB_F, cfg_hash, semantic) if cfg_hash else None
+    # Tüm sorular tek batch istekle embed edilir; lookup'lar ağ beklemez
+    primed = cache.prime([sc["question"] for sc in scenarios]) if cache else 0
 
     print(f"\n{'='*74}")
     print(f"  ITSM Chatbot Test Runner — {len(scenarios)} senaryo")
     print(f"  Workflow : ITSM Destek Hattı ({WORKFLOW_ID[:8]}...)")
+    print(f"  Paralel  : {CONCURRENCY} worker")
+    print(f"  Cache    : {'açık' if cache else 'kapalı'}"
+          f"{'' if cache or not use_cache else ' (workflow/agent config alınamadı)'}"
+          f"{' (semantic)' if cache and cache.semantic else ''}"
+          f"{' (numpy yok, sadece exact)' if cache and semantic and np is None else ''}"
+          f"{f' ({primed} soru batch embed edildi)' if primed else ''}")
     print(f"  Başlangıç: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"{'='*74}\n")
 
-    results = []
     passed = 0
     failed = 0
 
-    for i, sc in enumerate(scenarios, 1):
-        sid       = sc["id"]
-        cat       = sc["category"]
-        diff      = sc["difficulty"]
-        tone      = sc["user_tone"]
-        question  = sc["question"]
-        checks    = sc["checks"]
-        exp_form  = sc.get("expected_form")
-        exp_kw    = sc.get("expected_keywords", [])
-
-        print(f"[{i:02d}/{len(scenarios)}] {sid} — {cat} ({diff}/{tone})")
-        print(f"  Soru: {question[:90]}{'...' if len(question) > 90 else ''}")
-
-        result = run_workflow(question)
-        answer = result["final_output"]
-        elapsed = result["total_elapsed"]
-        step_count = len(result["steps"])
-
-        # Check'leri uygula
-        check_results = {}
-        failed_checks = []
-        for ck in checks:
-            # Parametric checks
-            if ck == "form_match":
-                ok = check_form_match(answer, exp_form)
-                check_results[ck] = ok
-                if not ok:
-                    failed_checks.append(ck)
-                continue
-            if ck == "has_keywords":
-                ok = check_has_keywords(answer, exp_kw)
-                check_results[ck] = ok
-                if not ok:
-                    failed_checks.append(ck)
-                continue
-            # Standard checks
-            fn = CHECKS.get(ck)
-            if fn is None:
-                check_results[ck] = None
-                continue
-            ok = fn(answer)
-            check_results[ck] = ok
-            if not ok:
-                failed_checks.append(ck)
-
-        # Keyword detail tracking
-        kw_ratio = keyword_ratio(answer, exp_kw)
-        kw_found = []
-        kw_missing = []
-        answer_lower = answer.lower()
-        for kw in exp_kw:
-            if kw.lower() in answer_lower:
-                kw_found.append(kw)
+    # Sonuçlar bellekte biriktirilmez: her senaryo tamamlanınca NDJSON'a bir satır
+    # yazılır (crash'te kısmi sonuçlar korunur), özet için sadece sayaçlar tutulur.
+    elapsed_arr = array("d")
+    length_arr  = array("l")
+    kw_arr      = array("d")
+    total_with_forms = 0
+    correct_forms = 0
+    cat_pass, cat_fail, cat_time = Counter(), Counter(), Counter()
+    diff_pass, diff_fail = Counter(), Counter()
+    failures: list[tuple] = []   # (id, category, difficulty, failed_checks)
+
+    limiter = TokenBucket(rate=RATE_BURST / DELAY, capacity=RATE_BURST) if DELAY > 0 else None
+
+    # Önceki koşunun NDJSON'u timestamped kopyaya hardlink olabilir: truncate etmek
+    # yerine unlink edip yeni inode'a yazılır
+    try:
+        os.unlink(RESULTS_ND_F)
+    except FileNotFoundError:
+        pass
+
+    # Senaryolar bounded pool'da paralel koşar; çıktı tamamlanma sırasıyla basılır
+    with open(RESULTS_ND_F, "wb") as nd, ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        futures = [
+            pool.submit(run_scenario, i, len(scenarios), sc, cache, limiter)
+            for i, sc in enumerate(scenarios, 1)
+        ]
+        for fut in as_completed(futures):
+            record, lines = fut.result()
+            print("\n".join(lines))
+            print()
+            nd.write(json_line_bytes(record))
+            nd.flush()
+
+            c, d = record["category"], record["difficulty"]
+            if record["pass"]:
+                passed += 1
+                cat_pass[c] += 1
+                diff_pass[d] += 1
             else:
-                kw_missing.append(kw)
-
-        scenario_pass = len(failed_checks) == 0 and not result.get("error")
-
-        if scenario_pass:
-            passed += 1
-            status = "✅ PASS"
-        else:
-            failed += 1
-            status = "❌ FAIL"
-
-        # Terminale özet
-        check_str = "  ".join(
-            f"{'✓' if v else '✗'} {CHECK_LABELS.get(k, k)}"
-            for k, v in check_results.items()
-            if v is not None
-        )
-        print(f"  {status}  ({elapsed:.1f}s, {step_count} step)  {check_str}")
-
-        if exp_form and "form_match" in check_results:
-            fm_ok = check_results["form_match"]
-            print(f"  {'✓' if fm_ok else '✗'} Form: {exp_form}")
-
-        if kw_found:
-            print(f"  🔑 Bulunan: {kw_found}  ({kw_ratio:.0%})")
-        if kw_missing:
-            print(f"  ⚠️  Eksik keyword: {kw_missing}")
-
-        if not scenario_pass:
-            if failed_checks:
-                print(f"  ❌ Başarısız check: {failed_checks}")
-            snippet = answer[:250].replace("\n", " ")
-            print(f"  Yanıt: {snippet}{'...' if len(answer) > 250 else ''}")
-
-        print()
-
-        # Sonucu kaydet
-        results.append({
-            "id":             sid,
-            "category":       cat,
-            "difficulty":     diff,
-            "user_tone":      tone,
-            "question":       question,
-            "expected_form":  exp_form,
-            "answer":         answer,
-            "answer_len":     len(answer),
-            "elapsed_sec":    round(elapsed, 2),
-            "step_count":     step_count,
-            "step_details":   [{"step_id": s["step_id"], "output_len": s["output_len"]} for s in result["steps"]],
-            "checks":         check_results,
-            "failed_checks":  failed_checks,
-            "keywords_found": kw_found,
-            "keywords_missing": kw_missing,
-            "keyword_ratio":  round(kw_ratio, 2),
-            "form_match":     check_results.get("form_match"),
-            "pass":           scenario_pass,
-            "error":          result.get("error", False),
-        })
-
-        time.sleep(DELAY)
+                failed += 1
+                cat_fail[c] += 1
+                diff_fail[d] += 1
+                failures.append((record["id"], c, d, record["failed_checks"]))
+            cat_time[c] += record["elapsed_sec"]
+            if record["expected_form"] is not None:
+                total_with_forms += 1
+                correct_forms += record["form_match"] is True
+            elapsed_arr.append(record["elapsed_sec"])
+            length_arr.append(record["answer_len"])
+            kw_arr.append(record["keyword_ratio"])
+
+    if cache:
+        cache.save()
+
+    # Rapor senaryo sırasını korusun
+    order = {sc["id"]: n for n, sc in enumerate(scenarios)}
+    failures.sort(key=lambda f: order[f[0]])
+    cat_order = dict.fromkeys(sc["category"] for sc in scenarios)
+    diff_order = dict.fromkeys(sc["difficulty"] for sc in scenarios)
 
     # ─── Özet ──────────────────────────────────────────────────────────────
     total = len(scenarios)
     pct = 100 * passed // total if total > 0 else 0
 
     # Quality score calculation
-    form_results = [r for r in results if r["expected_form"] is not None]
-    correct_forms = sum(1 for r in form_results if r.get("form_match") is True)
-    total_with_forms = len(form_results)
     form_accuracy = correct_forms / total_with_forms if total_with_forms > 0 else 0
 
-    all_kw_ratios = [r["keyword_ratio"] for r in results if r.get("keyword_ratio") is not None]
-    avg_kw_ratio = sum(all_kw_ratios) / len(all_kw_ratios) if all_kw_ratios else 0
-
-    all_elapsed = [r["elapsed_sec"] for r in results]
-    avg_elapsed = sum(all_elapsed) / len(all_elapsed) if all_elapsed else 0
+    avg_kw_ratio = statistics.fmean(kw_arr) if kw_arr else 0
+    avg_elapsed = statistics.fmean(elapsed_arr) if elapsed_arr else 0
+    avg_length = statistics.fmean(length_arr) if length_arr else 0
 
-    all_lengths = [r["answer_len"] for r in results]
-    avg_length = sum(all_lengths) / len(all_lengths) if all_lengths else 0
+    # Latency yüzdelikleri (n=20 → index 9 = p50, index 18 = p95)
+    if len(elapsed_arr) >= 2:
+        q = statistics.quantiles(elapsed_arr, n=20, method="inclusive")
+        p50_elapsed, p95_elapsed = q[9], q[18]
+    else:
+        p50_elapsed = p95_elapsed = avg_elapsed
 
     quality_score = {
         "form_accuracy": round(form_accuracy, 2),
         "keyword_coverage": round(avg_kw_ratio, 2),
         "avg_response_time": round(avg_elapsed, 1),
+        "p50_response_time": round(p50_elapsed, 1),
+        "p95_response_time": round(p95_elapsed, 1),
         "avg_response_length": round(avg_length),
     }
 
@@ -351,40 +908,21 @@ def run_all():
     print("  Kalite Metrikleri:")
     print(f"    Form Doğruluğu     : {correct_forms}/{total_with_forms}  ({form_accuracy:.0%})")
     print(f"    Keyword Kapsama    : {avg_kw_ratio:.0%}")
-    print(f"    Ort. Yanıt Süresi  : {avg_elapsed:.1f}s")
+    print(f"    Ort. Yanıt Süresi  : {avg_elapsed:.1f}s  (p50 {p50_elapsed:.1f}s, p95 {p95_elapsed:.1f}s)")
     print(f"    Ort. Yanıt Uzunluğu: {avg_length:.0f} karakter")
     print()
 
-    # Kategoriye göre breakdown
-    cat_stats: dict[str, dict] = {}
-    for r in results:
-        c = r["category"]
-        if c not in cat_stats:
-            cat_stats[c] = {"pass": 0, "fail": 0, "avg_time": []}
-        if r["pass"]:
-            cat_stats[c]["pass"] += 1
-        else:
-            cat_stats[c]["fail"] += 1
-        cat_stats[c]["avg_time"].append(r["elapsed_sec"])
+    # Kategoriye / zorluğa göre breakdown — sayaçlar koşu sırasında dolduruldu
+    cat_stats = {c: {"pass": cat_pass[c], "fail": cat_fail[c]} for c in cat_order}
+    diff_stats = {d: {"pass": diff_pass[d], "fail": diff_fail[d]} for d in diff_order}
 
     print("  Kategoriye Göre:")
     for cat, st in sorted(cat_stats.items()):
         tot = st["pass"] + st["fail"]
-        avg = sum(st["avg_time"]) / len(st["avg_time"])
+        avg = cat_time[cat] / tot
         print(f"    {cat:22s}  {st['pass']}/{tot}  avg {avg:.1f}s  {'✅' * st['pass']}{'❌' * st['fail']}")
     print()
 
-    # Zorluk seviyesine göre
-    diff_stats: dict[str, dict] = {}
-    for r in results:
-        d = r["difficulty"]
-        if d not in diff_stats:
-            diff_stats[d] = {"pass": 0, "fail": 0}
-        if r["pass"]:
-            diff_stats[d]["pass"] += 1
-        else:
-            diff_stats[d]["fail"] += 1
-
     print("  Zorluk Seviyesine Göre:")
     for diff in ["easy", "medium", "hard"]:
         if diff in diff_stats:
@@ -394,18 +932,24 @@ def run_all():
     print()
 
     # Başarısız senaryolar
-    failures = [r for r in results if not r["pass"]]
     if failures:
         print("  Başarısız Senaryolar:")
-        for r in failures:
-            reason = r["failed_checks"] if r["failed_checks"] else "error"
-            print(f"    {r['id']} — {r['category']} ({r['difficulty']}) — {reason}")
+        for sid, cat, diff, failed_checks in failures:
+            reason = failed_checks if failed_checks else "error"
+            print(f"    {sid} — {cat} ({diff}) — {reason}")
     else:
         print("  🎉 Tüm senaryolar geçti!")
 
     print(f"\n{'='*74}\n")
 
-    # JSON kaydet
+    # Özet JSON — senaryo sonuçları NDJSON dosyasında. NDJSON önce timestamped
+    # kopyaya linklenir; özet o değişmez kopyayı gösterir, böylece özetin kendisi
+    # de tek yazım + hardlink ile tarihçeye alınabilir.
+    ts = datetime.now().strftime("%Y-%m-%dT%H%M")
+    ts_base = os.path.join(os.path.dirname(__file__), f"itsm-chatbot-test-results-{ts}")
+    ts_nd_file = ts_base + ".ndjson"
+    link_or_copy(RESULTS_ND_F, ts_nd_file)
+
     output = {
         "run_at":     datetime.now().isoformat(),
         "workflow_id": WORKFLOW_ID,
@@ -417,25 +961,31 @@ def run_all():
             "percent": pct,
         },
         "quality_score": quality_score,
-        "category_breakdown": {k: {"pass": v["pass"], "fail": v["fail"]} for k, v in cat_stats.items()},
+        "category_breakdown": cat_stats,
         "difficulty_breakdown": diff_stats,
-        "results": results,
+        "failed_ids": [f[0] for f in failures],
+        "results_file": os.path.basename(ts_nd_file),
     }
 
-    with open(RESULTS_F, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    # Tek serialize + atomik replace; yarım yazılmış sonuç dosyası kalmaz
+    tmp_file = RESULTS_F + ".tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(json_dump_bytes(output))
+    os.replace(tmp_file, RESULTS_F)
 
-    # Also save timestamped copy for history
-    ts = datetime.now().strftime("%Y-%m-%dT%H%M")
-    ts_file = os.path.join(os.path.dirname(__file__), f"itsm-chatbot-test-results-{ts}.json")
-    with open(ts_file, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    # Also save timestamped copy for history (hardlink, olmazsa kopya)
+    ts_file = ts_base + ".json"
+    link_or_copy(RESULTS_F, ts_file)
 
     print(f"  Sonuçlar kaydedildi: {RESULTS_F}")
+    print(f"  Senaryo sonuçları  : {RESULTS_ND_F}")
     print(f"  Kopya: {ts_file}\n")
     return pct
 
 
 if __name__ == "__main__":
-    score = run_all()
+    # --no-cache: cache'i atlayıp tüm senaryoları workflow'a gönderir (otoriter koşu)
+    # --cache-semantic: benzer sorular da cache'ten yanıtlanır (hızlı iterasyon için)
+    args = sys.argv[1:]
+    score = run_all(use_cache="--no-cache" not in args, semantic="--cache-semantic" in args)
     sys.exit(0 if score >= 80 else 1)
@@ -4,346 +4,353 @@ ITSM Form Template Enrichment — adds scenario keywords to form templates
 for better hybrid search (BM25 + semantic) retrieval.
 
 Process:
-1. Fetch all KB docs with source_label = 'ITSM Form Templates'
+1. Fetch not-yet-enriched KB docs with source_label = 'ITSM Form Templates'
 2. For each form, append Turkish scenario keywords based on form name
-3. Re-embed via vLLM embed API, then update doc via KB API (delete + re-add)
+3. Re-embed via vLLM embed API (batched), then update doc in place via KB API (PUT)
 4. The search_vector trigger auto-updates BM25 index
 
-Usage: python itsm-enrich-forms.py
+By default steps 1-3 run inside the KB service (POST /api/kb/documents/enrich-forms,
+one request); the client pipeline is used with --client or when the server
+does not have that endpoint.
+
+Usage: python itsm-enrich-forms.py [--client]
 """
 
-import urllib.request
+import base64
+import hashlib
+import http.client
 import json
+import os
+import queue
+import random
+import re
 import sys
+import threading
 import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+try:
+    import orjson  # embed yanitlari (~30 KB float JSON) icin hizli encode/decode, opsiyonel
+except ImportError:
+    orjson = None
 
 BASE = "http://localhost:8833"
 
 # Embed API URL (read from settings)
 EMBED_URL = None
 EMBED_MODEL = "nomic-ai/nomic-embed-text-v1.5"
+EMBED_BATCH = 64  # vLLM max_num_batched_tokens altinda kalmak icin chunk boyutu
+KB_WORKERS = 8    # Ayni anda calisan KB update sayisi (rate limit gorevi de gorur)
+
+# Kalici embedding cache: sha256(model|text) → vektor; rerun'da degismeyen metinler yeniden embed edilmez
+EMBED_CACHE_F = os.path.join(os.path.dirname(os.path.abspath(__file__)), "itsm-enrich-embed-cache.json")
+
+
+def json_dumps(obj):
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
+
+
+def json_loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
 
-# Form name (exact match from KB) → scenario keywords to append
-# These match the actual form names returned by:
+# Form name (exact match from KB) → scenario keywords to append, grouped by category.
+# Names match the actual form names returned by:
 #   SELECT SUBSTRING(text FROM 'Form: ([^\n]+)') FROM kb_documents WHERE source_label = 'ITSM Form Templates'
-FORM_ENRICHMENTS = {
-    # Identity & Access
-    "Sifre ve MFA Destegi": {
-        "anahtar_kelimeler": "sifre degistirme, sifre sifirlama, parola, MFA, iki faktorlu dogrulama, authentication, giris yapamiyorum, hesap kilitlendi, parola suresi doldu",
-        "senaryolar": "Kullanici sifresini degistirmek istiyor, MFA cihazi kayboldu, sifre unuttum, hesabim kilitlendi",
-    },
-    "Hesap Kilidi Acma Talebi": {
-        "anahtar_kelimeler": "hesap kilidi, kilitlendi, giris yapamiyorum, account lock, sifre denemesi, oturum acma",
-        "senaryolar": "Hesabim kilitlendi, cok fazla yanlis sifre girdim, oturum acamiyorum",
-    },
-    "Erisim Izni Degisikligi": {
-        "anahtar_kelimeler": "erisim, yetki, izin, access, permission, rol degisikligi, yetkilendirme",
-        "senaryolar": "Yetkilerimi degistirin, erisim izni lazim, rol guncellemesi, yetki talebi",
-    },
-    "Dosya ve Klasor Erisim Talebi": {
-        "anahtar_kelimeler": "dosya erisim, klasor, paylasim, network drive, share folder, dizin erisimi",
-        "senaryolar": "Klasore erisemiyorum, dosya paylasimi istiyorum, network drive baglama",
-    },
-    "Yetkili Erisim Gozden Gecirme": {
-        "anahtar_kelimeler": "yetkili erisim, admin erisim, privileged access, erisim gozden gecirme",
-        "senaryolar": "Admin yetkisi kontrolu, yetkili erisim denetimi",
-    },
-    "Erisim Haklari Denetim Talebi": {
-        "anahtar_kelimeler": "erisim denetim, haklar, audit, erisim raporu",
-        "senaryolar": "Erisim haklarini denetleyin, kimler erisebiliyor",
-    },
-
-    # VPN & Remote
-    "VPN Erisim Talebi": {
-        "anahtar_kelimeler": "vpn, uzak erisim, remote access, evden calisma, vpn baglanti, vpn hesap",
-        "senaryolar": "VPN erisimi istiyorum, evden calismak icin VPN lazim, uzaktan baglanma",
-    },
-    "VPN Kullanici Kurulumu": {
-        "anahtar_kelimeler": "vpn kurulum, vpn yapilandirma, vpn setup, vpn konfigurasyonu",
-        "senaryolar": "VPN kurulumu yapin, VPN nasil kurulur, VPN ayarlari",
-    },
-
-    # Hardware
-    "Yeni Laptop Siparisi": {
-        "anahtar_kelimeler": "laptop, dizustu, notebook, yeni bilgisayar, laptop talebi",
-        "senaryolar": "Yeni laptop istiyorum, laptopum eski degistirin, dizustu bilgisayar talebi",
-    },
-    "Yeni Masaustu Siparisi": {
-        "anahtar_kelimeler": "masaustu, desktop, pc, yeni bilgisayar, masa ustu",
-        "senaryolar": "Yeni masaustu istiyorum, bilgisayar talebi, pc degisimi",
-    },
-    "Masaustu / Laptop Arizasi": {
-        "anahtar_kelimeler": "ariza, bozuldu, calismiyor, laptop sorun, masaustu sorun, donanim ariza",
-        "senaryolar": "Laptopum bozuldu, bilgisayar acilmiyor, ekran calismiyor, donanim sorun",
-    },
-    "Donanim Talebi": {
-        "anahtar_kelimeler": "donanim, hardware, ekipman, cihaz talebi, teknik ekipman",
-        "senaryolar": "Donanim istiyorum, yeni ekipman, cihaz talebi",
-    },
-    "Yeni Monitor Siparisi": {
-        "anahtar_kelimeler": "monitor, ekran, display, yeni monitor",
-        "senaryolar": "Yeni monitor istiyorum, ekran talebi, ikinci monitor",
-    },
-    "Tamir": {
-        "anahtar_kelimeler": "tamir, onarim, repair, fix, duzeltme",
-        "senaryolar": "Cihazim bozuldu tamir edin, onarim talebi",
-    },
-    "Yeni Cevre Birimi": {
-        "anahtar_kelimeler": "cevre birimi, peripheral, mouse, klavye, kulaklik, aksesuar",
-        "senaryolar": "Yeni mouse istiyorum, klavye lazim, kulaklik talebi",
-    },
-    "Yeni Telefon Siparisi": {
-        "anahtar_kelimeler": "telefon, cep telefonu, mobile, akilli telefon",
-        "senaryolar": "Yeni telefon istiyorum, cep telefonu talebi",
-    },
-
-    # Printer
-    "Yazici Arizasi": {
-        "anahtar_kelimeler": "yazici, printer, baski, yazdirma, yazici sorun, yazici arizasi",
-        "senaryolar": "Yazici calismiyor, baski alamiyorum, yazici hata veriyor, kagit sikisti",
-    },
-    "Yeni Yazici Talebi": {
-        "anahtar_kelimeler": "yeni yazici, printer talebi, yazici kurulum",
-        "senaryolar": "Yeni yazici istiyorum, yazici ekleyin, printer lazim",
-    },
-    "Toner / Sarf Malzeme Talebi": {
-        "anahtar_kelimeler": "toner, kartus, sarf malzeme, murekkep, yazici sarf",
-        "senaryolar": "Toner bitti, yeni toner istiyorum, sarf malzeme talebi, kartus degisimi",
-    },
-    "Tarayici Destegi": {
-        "anahtar_kelimeler": "tarayici, scanner, tarama, scan, belge tarama",
-        "senaryolar": "Tarayici calismiyor, tarama yapamiyorum, scanner sorun",
-    },
-
-    # Email
-    "E-posta Arizasi": {
-        "anahtar_kelimeler": "eposta, e-posta, mail, outlook, posta, mail sorun",
-        "senaryolar": "Mail gonderemiyorum, outlook calismiyor, e-posta arizasi",
-    },
-    "E-posta Hesap Yonetimi": {
-        "anahtar_kelimeler": "mail hesap, eposta hesap, mail yonetim, posta kutusu",
-        "senaryolar": "Mail hesabi acin, e-posta yonetimi, posta kutusu ayarlari",
-    },
-    "E-posta Dagitim Grubu Yonetimi": {
-        "anahtar_kelimeler": "dagitim grubu, mail grup, distribution list, toplu mail",
-        "senaryolar": "Dagitim grubu olusturun, gruba ekleme, mail listesi",
-    },
-    "Paylasilmis Posta Kutusu Talebi": {
-        "anahtar_kelimeler": "paylasilmis posta, shared mailbox, ortak posta kutusu",
-        "senaryolar": "Ortak posta kutusu istiyorum, paylasilmis mailbox talebi",
-    },
-
-    # Security
-    "Oltalama Bildirimi": {
-        "anahtar_kelimeler": "phishing, oltalama, sahte mail, supheli mail, dolandiricilik, spam",
-        "senaryolar": "Supheli mail aldim, oltalama saldirisi, sahte link, phishing bildirimi",
-    },
-    "Guvenlik Olayi Bildirimi": {
-        "anahtar_kelimeler": "guvenlik olayi, security incident, virus, malware, siber saldiri, ihlal",
-        "senaryolar": "Virus tespit ettim, guvenlik ihlali, siber saldiri bildirimi",
-    },
-    "Guvenlik Duvari Kurallari": {
-        "anahtar_kelimeler": "firewall, guvenlik duvari, port acma, erisim engeli, ag kurali",
-        "senaryolar": "Port acilmasi lazim, firewall kurali degistirin, siteye erisemiyorum",
-    },
-    "Guvenlik Istisna Talebi": {
-        "anahtar_kelimeler": "guvenlik istisna, exception, kural istisna, beyaz liste",
-        "senaryolar": "Guvenlik istisnasi istiyorum, kurali bypasslayin",
-    },
-    "Veri Ihlali Bildirimi": {
-        "anahtar_kelimeler": "veri ihlali, data breach, bilgi sizintisi, gizlilik ihlali",
-        "senaryolar": "Veri sizintisi oldu, bilgiler ifsa edildi",
-    },
-
-    # Network
-    "Ag Sorun Giderme": {
-        "anahtar_kelimeler": "ag, network, internet, baglanti, wifi, ethernet, yavas internet",
-        "senaryolar": "Internete baglanamiyorum, ag yavas, wifi sorun, baglanti kopuyor",
-    },
-    "Ag Kesintisi": {
-        "anahtar_kelimeler": "ag kesintisi, internet kesintisi, network down, baglanti yok",
-        "senaryolar": "Internet yok, ag calismiyor, baglanti kesildi",
-    },
-    "Yeni DNS / IP Talebi": {
-        "anahtar_kelimeler": "dns, ip adresi, ip talebi, dns kaydi, domain",
-        "senaryolar": "Yeni IP lazim, DNS kaydi ekleyin, IP adresi talebi",
-    },
-
-    # Software
-    "Yazilim Kurulumu": {
-        "anahtar_kelimeler": "yazilim kurulum, software install, program yukleme, uygulama kurma",
-        "senaryolar": "Program yukleyin, yazilim kurulumu yapın, uygulama lazim",
-    },
-    "Yazilim Kurma / Guncelleme": {
-        "anahtar_kelimeler": "yazilim guncelleme, software update, program guncelleme, patch",
-        "senaryolar": "Yazilim guncelleyin, program eski, guncelleme lazim",
-    },
-    "Yazilim Kaldirma": {
-        "anahtar_kelimeler": "yazilim kaldirma, uninstall, program silme, kaldir",
-        "senaryolar": "Programi kaldirin, yazilim silinsin",
-    },
-    "Yazilim Lisans Talebi": {
-        "anahtar_kelimeler": "lisans, license, yazilim lisans, aktivasyon, seri numarasi",
-        "senaryolar": "Lisans istiyorum, yazilim lisansi lazim, aktivasyon kodu",
-    },
-    "Yeni Yazilim Talebi": {
-        "anahtar_kelimeler": "yeni yazilim, software talebi, yeni program, uygulama istegi",
-        "senaryolar": "Yeni yazilim istiyorum, programa ihtiyacim var",
-    },
-    "Microsoft Office Destegi": {
-        "anahtar_kelimeler": "office, microsoft, word, excel, powerpoint, teams, office sorun",
-        "senaryolar": "Office calismiyor, Excel sorun, Word acilmiyor, Teams hatasi",
-    },
-    "Windows Kurulumu": {
-        "anahtar_kelimeler": "windows, isletim sistemi, os kurulum, format, windows yeniden kurulum",
-        "senaryolar": "Windows kurun, format atin, isletim sistemi sorun",
-    },
-
-    # Backup
-    "Yedekleme ve Geri Yukleme": {
-        "anahtar_kelimeler": "yedek, backup, yedekleme, geri yukleme, restore, dosya kurtarma",
-        "senaryolar": "Dosyalarimi yedekleyin, silinen dosyayi geri getirin, backup talebi",
-    },
-    "Yedekleme Dogrulama Talebi": {
-        "anahtar_kelimeler": "yedekleme dogrulama, backup verification, yedek kontrol",
-        "senaryolar": "Yedeklerin kontrolu, backup dogrulama",
-    },
-
-    # Collaboration & Video
-    "Video Konferans Destegi": {
-        "anahtar_kelimeler": "video konferans, zoom, teams, toplanti, goruntulu gorusme, kamera, webcam",
-        "senaryolar": "Kamera calismiyor, toplanti baglantisi sorun, video konferans yardim",
-    },
-    "Isbirligi Araclari Destegi": {
-        "anahtar_kelimeler": "isbirligi, collaboration, teams, slack, sharepoint, paylasim",
-        "senaryolar": "Teams sorun, Sharepoint erisim, isbirligi araci yardim",
-    },
-    "Toplanti Odasi Rezervasyon Sorunu": {
-        "anahtar_kelimeler": "toplanti odasi, meeting room, rezervasyon, oda ayirma, konferans odasi",
-        "senaryolar": "Toplanti odasi ayiramiyorum, oda rezervasyon sorun",
-    },
-    "Sunum Ekipmani": {
-        "anahtar_kelimeler": "sunum, projektor, projeksiyon, presentation, ekran paylasim",
-        "senaryolar": "Projektor calismiyor, sunum ekipmani talebi",
-    },
-    "AV Ekipman Talebi": {
-        "anahtar_kelimeler": "av ekipman, ses sistemi, mikrofon, hoparlor, audio visual",
-        "senaryolar": "Ses sistemi talebi, mikrofon lazim, AV ekipman istegi",
-    },
-
-    # Applications & ERP/CRM
-    "CRM Destegi": {
-        "anahtar_kelimeler": "crm, musteri iliskileri, salesforce, crm sorun, crm erisim",
-        "senaryolar": "CRM erisim istiyorum, CRM calismiyor, musteri sistemi sorun",
-    },
-    "ERP Erisim Talebi": {
-        "anahtar_kelimeler": "erp, sap, is uygulamasi, kurumsal kaynak planlama",
-        "senaryolar": "ERP erisimi istiyorum, SAP erisim talebi",
-    },
-    "Uygulama Erisim Talebi": {
-        "anahtar_kelimeler": "uygulama erisim, application access, sistem erisim",
-        "senaryolar": "Uygulamaya erisim istiyorum, sisteme giremiyorum",
-    },
-    "Is Uygulamasi Kurulumu": {
-        "anahtar_kelimeler": "is uygulamasi, business app, kurumsal uygulama, kurulum",
-        "senaryolar": "Is uygulamasi kurulsin, kurumsal yazilim yukleme",
-    },
-    "IK Sistemi Destegi": {
-        "anahtar_kelimeler": "ik sistemi, hr, insan kaynaklari, bordro, izin sistemi",
-        "senaryolar": "IK sistemine erisemiyorum, HR portal sorun",
-    },
-
-    # Onboarding / Offboarding
-    "Yeni / Ayrilan Calisan": {
-        "anahtar_kelimeler": "yeni calisan, ayrilan calisan, onboarding, offboarding, ise giris, isten cikis",
-        "senaryolar": "Yeni calisan hesabi acin, ayrilan kisi hesaplarini kapatin",
-    },
-    "Yeni Calisan BT Oryantasyonu": {
-        "anahtar_kelimeler": "bt oryantasyon, it orientation, yeni calisan egitim, baslangic",
-        "senaryolar": "Yeni calisan IT oryantasyonu, baslangic seti hazirlama",
-    },
-
-    # Server & Cloud
-    "Sunucu / Bulut Arizasi": {
-        "anahtar_kelimeler": "sunucu, server, bulut, cloud, sunucu ariza, server down",
-        "senaryolar": "Sunucu calismiyor, server erisim yok, bulut servisi sorun",
-    },
-    "Sunucu Provizyon": {
-        "anahtar_kelimeler": "sunucu provizyon, server provision, yeni sunucu, vm olusturma",
-        "senaryolar": "Yeni sunucu istiyorum, VM olusturun, server talebi",
-    },
-
-    # Training & Education
-    "BT Egitim Talebi": {
-        "anahtar_kelimeler": "egitim, training, bt egitim, bilgi teknolojileri egitim, kurs",
-        "senaryolar": "BT egitimi istiyorum, teknoloji egitimi, bilgisayar kursu",
-    },
-    "BT Yetkinlik Degerlendirmesi": {
-        "anahtar_kelimeler": "yetkinlik, degerlendirme, bt beceri, skill assessment",
-        "senaryolar": "BT yetkinlik degerlendirmesi, beceri testi",
-    },
-
-    # Mobile
-    "SIM Kilitleme": {
-        "anahtar_kelimeler": "sim kilitleme, sim lock, hat kilitleme, mobil guvenlik",
-        "senaryolar": "SIM kartimi kitleyin, hat guvenlik",
-    },
-    "SIM Acma": {
-        "anahtar_kelimeler": "sim acma, sim unlock, hat acma, sim aktiflestime",
-        "senaryolar": "SIM kartimi acin, hattimi aktiflesirin",
-    },
-
-    # General
-    "Genel IT Destek Talebi": {
-        "anahtar_kelimeler": "genel destek, it yardim, teknik destek, bilgi islem, it talebi",
-        "senaryolar": "IT yardim istiyorum, teknik destek talebi, bilgi islem ile iletisim",
-    },
-    "Sorun Giderme": {
-        "anahtar_kelimeler": "sorun giderme, troubleshooting, hata, problem, cozum",
-        "senaryolar": "Sorunum var, yardim edin, hata alioyrum, problem cozme",
-    },
-    "Degisiklik Talebi": {
-        "anahtar_kelimeler": "degisiklik, change request, konfigurasyon degisikligi, sistem degisikligi",
-        "senaryolar": "Degisiklik talebi, konfigurasyon guncelleyin",
-    },
+# Kept in a data file so keywords can be tweaked without touching the script.
+ENRICHMENTS_F = os.path.join(os.path.dirname(os.path.abspath(__file__)), "itsm-form-enrichments.json")
+
+
+def load_form_enrichments(path=ENRICHMENTS_F):
+    """Read {category: {form_name: {anahtar_kelimeler, senaryolar}}} → flat {form_name: {...}}."""
+    with open(path, "rb") as f:
+        groups = json_loads(f.read())
+    return {name: v for forms in groups.values() for name, v in forms.items()}
+
+
+FORM_ENRICHMENTS = load_form_enrichments()
+
+# Form basina eklenecek metin ve rapordaki karakter sayisi — import sirasinda bir kez
+FORM_SUFFIX = {
+    name: f"\nAnahtar Kelimeler: {v['anahtar_kelimeler']}\nKullanim Senaryolari: {v['senaryolar']}\n"
+    for name, v in FORM_ENRICHMENTS.items()
+}
+FORM_CHAR_COUNT = {
+    name: len(v["anahtar_kelimeler"]) + len(v["senaryolar"])
+    for name, v in FORM_ENRICHMENTS.items()
 }
 
+# "Form: <ad>" satiri ve zenginlestirilmis doc isaretleri — tek geciste regex
+FORM_RE = re.compile(r"^[ \t]*Form:[ \t]*(\S.*?)\s*$", re.MULTILINE)
+ENRICHED_MARKERS = ("Anahtar Kelimeler:", "Kullanim Senaryolari:")
+ENRICHED_RE = re.compile("|".join(map(re.escape, ENRICHED_MARKERS)))
+
+# Zenginlestirilmis doc'lar sunucuda elenir; ENRICHED_RE eski sunucular icin yedek kontrol
+PAGE_SIZE = 100
+DOCS_QUERY = "/api/kb/documents?" + urlencode(
+    [("source_label", "ITSM Form Templates"), ("limit", PAGE_SIZE)]
+    + [("text_not_contains", m) for m in ENRICHED_MARKERS]
+)
+
+
+# Host basina paylasilan keep-alive baglanti havuzu (KB + embed API): producer,
+# ana thread ve worker'lar ayni soketleri kullanir; soket sayisi = en fazla es zamanli istek
+_pool = {}  # netloc -> bosta bekleyen baglantilar
+_pool_lock = threading.Lock()
+
+
+def _checkout(parts, timeout, fresh=False):
+    conn = None
+    if not fresh:
+        with _pool_lock:
+            idle = _pool.get(parts.netloc)
+            if idle:
+                conn = idle.pop()
+    if conn is None:
+        cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        conn = cls(parts.hostname, parts.port, timeout=timeout)
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+    return conn
+
+
+def _checkin(netloc, conn):
+    with _pool_lock:
+        _pool.setdefault(netloc, []).append(conn)
+
+
+class ApiError(RuntimeError):
+    """HTTP status >= 400 from the KB or embed API."""
+
+    def __init__(self, code, body, retry_after=None):
+        super().__init__(f"HTTP {code}: {body}")
+        self.code = code
+        self.retry_after = retry_after
+
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def with_retry(fn, *args, tries=4, base=0.25, **kwargs):
+    """Call fn, retrying transient failures (429/5xx, timeouts, resets) with jittered backoff."""
+    for i in range(tries):
+        try:
+            return fn(*args, **kwargs)
+        except ApiError as e:
+            if e.code not in RETRY_STATUS or i == tries - 1:
+                raise
+            delay = e.retry_after if e.retry_after is not None else base * (2 ** i)
+        except (TimeoutError, ConnectionError, http.client.HTTPException):
+            if i == tries - 1:
+                raise
+            delay = base * (2 ** i)
+        time.sleep(delay + random.random() * 0.1)
+
+
+def request_json(method, url, data=None, timeout=30):
+    """Send method to url over a pooled keep-alive connection; returns decoded JSON (or None)."""
+    parts = urlsplit(url if "://" in url else f"{BASE}{url}")
+    path = f"{parts.path}?{parts.query}" if parts.query else parts.path
+    body = json_dumps(data) if data is not None else None
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    for attempt in range(2):
+        conn = _checkout(parts, timeout, fresh=attempt > 0)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            raw = resp.read()
+        except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                ConnectionResetError, BrokenPipeError):
+            # Sunucu bosta bekleyen baglantiyi kapatmis — bir kez yeni baglantiyla dene
+            conn.close()
+            if attempt == 1:
+                raise
+            continue
+        except Exception:
+            conn.close()
+            raise
+        if resp.will_close:
+            conn.close()
+        else:
+            _checkin(parts.netloc, conn)
+        break
+    if resp.status >= 400:
+        retry_after = resp.getheader("Retry-After")
+        raise ApiError(resp.status, raw[:200].decode("utf-8", "replace"),
+                       float(retry_after) if retry_after and retry_after.isdigit() else None)
+    return json_loads(raw) if raw else None
+
 
 def api_get(path):
-    req = urllib.request.Request(f"{BASE}{path}", method="GET")
-    with urllib.request.urlopen(req, timeout=30) as r:
-        return json.loads(r.read().decode())
+    return request_json("GET", f"{BASE}{path}", timeout=30)
 
 
 def api_post(path, data):
-    payload = json.dumps(data).encode()
-    req = urllib.request.Request(
-        f"{BASE}{path}",
-        data=payload,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    with urllib.request.urlopen(req, timeout=120) as r:
-        return json.loads(r.read().decode())
+    return request_json("POST", f"{BASE}{path}", data, timeout=120)
+
+
+def api_put(path, data):
+    return request_json("PUT", f"{BASE}{path}", data, timeout=120)
 
 
 def api_delete(path):
-    req = urllib.request.Request(f"{BASE}{path}", method="DELETE")
-    urllib.request.urlopen(req, timeout=10)
+    request_json("DELETE", f"{BASE}{path}", timeout=10)
+
+
+def embed_texts_batch(texts, embed_url, batch_size=EMBED_BATCH):
+    """Embed many texts with one /embeddings call per chunk of `batch_size`.
+
+    vLLM batches the whole `input` list in a single forward pass. Texts are
+    sent in length order so each chunk holds similar-length sequences (less
+    padding); results are returned in the original input order.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    embeddings = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        resp = with_retry(request_json, "POST", f"{embed_url}/embeddings",
+                          {"model": EMBED_MODEL, "input": [texts[i] for i in idx]}, timeout=120)
+        data = sorted(resp["data"], key=lambda d: d.get("index", 0))
+        if len(data) != len(idx):
+            raise RuntimeError(f"embed returned {len(data)} vectors for {len(idx)} inputs")
+        for i, d in zip(idx, data):
+            embeddings[i] = d["embedding"]
+    return embeddings
+
+
+
+def embedding_b64(embedding):
+    """Pack a vector as base64 little-endian float32 — KB API `embedding_b64` field."""
+    vec = array("f", embedding)
+    if sys.byteorder == "big":
+        vec.byteswap()
+    return base64.b64encode(vec.tobytes()).decode("ascii")
+
+
+def cache_key(text):
+    return hashlib.sha256(f"{EMBED_MODEL}|{text}".encode()).hexdigest()
+
+
+def load_embed_cache():
+    try:
+        with open(EMBED_CACHE_F, "rb") as f:
+            return json_loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+
+def save_embed_cache(cache):
+    tmp = EMBED_CACHE_F + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(json_dumps(cache))
+    os.replace(tmp, EMBED_CACHE_F)
+
+
+def embed_texts_cached(texts, embed_url, cache):
+    """Like embed_texts_batch, but only cache misses hit the embed API.
+
+    Returns (embeddings, n_hits); new vectors are added to `cache`.
+    """
+    keys = [cache_key(t) for t in texts]
+    misses = [i for i, k in enumerate(keys) if k not in cache]
+    if misses:
+        fresh = embed_texts_batch([texts[i] for i in misses], embed_url)
+        for i, emb in zip(misses, fresh):
+            cache[keys[i]] = emb
+    return [cache[k] for k in keys], len(texts) - len(misses)
+
+def update_doc(item, embedding):
+    """Replace one KB doc with its enriched version. Returns (ok, message)."""
+    doc, form_name, enriched_text = item
+    doc_id = doc.get("id", "")
+    emb_b64 = embedding_b64(embedding)
+
+    # Update text + embedding in place (single UPDATE, trigger fires once)
+    try:
+        with_retry(api_put, f"/api/kb/documents/{doc_id}", {"text": enriched_text, "embedding_b64": emb_b64})
+    except ApiError as e:
+        if e.code not in (404, 405):
+            return False, f"UPDATE FAILED: {e}"
+        # Doc gone or PUT unsupported — fall back to delete + re-add
+        try:
+            with_retry(api_delete, f"/api/kb/documents/{doc_id}")
+        except Exception:
+            pass  # May 404
+        try:
+            with_retry(api_post, "/api/kb/documents", {
+                "documents": [{
+                    "text": enriched_text,
+                    "embedding_b64": emb_b64,
+                    "source": doc.get("source", "dataset"),
+                    "source_label": "ITSM Form Templates",
+                }]
+            })
+        except Exception as e2:
+            return False, f"ADD FAILED: {e2}"
+    except Exception as e:
+        return False, f"UPDATE FAILED: {e}"
+    return True, f"ENRICHED (+{FORM_CHAR_COUNT[form_name]} chars)"
+
 
+def fetch_pages(out):
+    """Producer: put each page of un-enriched docs on `out`, then None (or the exception).
 
-def embed_text(text, embed_url):
-    """Get embedding vector for text via vLLM embed API."""
-    payload = json.dumps({"model": EMBED_MODEL, "input": text}).encode()
-    req = urllib.request.Request(
-        f"{embed_url}/embeddings",
-        data=payload,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    with urllib.request.urlopen(req, timeout=60) as r:
-        resp = json.loads(r.read().decode())
-        return resp["data"][0]["embedding"]
+    Uses keyset pagination (`cursor` = last doc id), so docs updated while paging
+    do not shift later pages. Servers without cursor support return a single page.
+    """
+    cursor = ""
+    try:
+        while True:
+            resp = api_get(f"{DOCS_QUERY}&{urlencode({'cursor': cursor})}")
+            out.put(resp.get("data", resp.get("documents", [])))
+            cursor = resp.get("next_cursor")
+            if not cursor:
+                break
+    except Exception as e:
+        out.put(e)
+        return
+    out.put(None)
+
+
+def enrich_on_server():
+    """Run the whole enrichment in the KB service. Returns exit code, or None if unsupported."""
+    print("\n  Running server-side enrichment...")
+    try:
+        resp = api_post("/api/kb/documents/enrich-forms", {
+            "source_label": "ITSM Form Templates",
+            "suffixes": FORM_SUFFIX,
+            "skip_markers": list(ENRICHED_MARKERS),
+            "embed_model": EMBED_MODEL,
+        })
+    except ApiError as e:
+        if e.code in (404, 405):
+            return None
+        print(f"  ERROR: {e}")
+        return 1
+    except Exception as e:
+        print(f"  ERROR: {e}")
+        return 1
+
+    for name in resp["enriched_forms"]:
+        print(f"  {name} — ENRICHED (+{FORM_CHAR_COUNT.get(name, 0)} chars)")
+
+    print(f"\n{'='*60}")
+    print("  SUMMARY (server-side)")
+    print(f"{'='*60}")
+    print(f"  Un-enriched docs : {resp['total']}")
+    print(f"  Enriched         : {resp['enriched']}")
+    print(f"  Already done     : {resp.get('skipped', 0)}")
+    print(f"  No match (OK)    : {resp['no_match']}")
+    print(f"  Elapsed          : {resp['elapsed_ms']} ms")
+    print()
+    if resp["enriched"] == 0:
+        print("  All forms already enriched — nothing to do.")
+    else:
+        print(f"  {resp['enriched']} forms enriched successfully.")
+    return 0
 
 
 def main():
@@ -353,6 +360,12 @@ def main():
     print("  ITSM Form Template Enrichment")
     print("=" * 60)
 
+    if "--client" not in sys.argv:
+        rc = enrich_on_server()
+        if rc is not None:
+            return rc
+        print("  Server has no enrich-forms endpoint — using client pipeline")
+
     # Get embed URL from settings
     print("\n  Reading settings...")
     settings = api_get("/api/kb/settings")
@@ -364,118 +377,123 @@ def main():
     print(f"  Embed URL: {EMBED_URL}")
     print(f"  Fallback:  {fallback}")
 
-    # Test embed API
-    print("  Testing embed API...")
+    # Embed API is verified by the first real batch (fallback tried on failure)
     urls_to_try = [EMBED_URL]
     if fallback:
         urls_to_try.append(fallback)
-    embed_ok = False
-    for url in urls_to_try:
-        try:
-            test_emb = embed_text("test", url)
-            EMBED_URL = url
-            print(f"  Embed API OK: {url} (dim={len(test_emb)})")
-            embed_ok = True
-            break
-        except Exception as e:
-            print(f"  {url} — failed: {e}")
-    if not embed_ok:
-        print("  ERROR: No embed API reachable!")
-        return 1
 
-    # 1. Fetch all KB docs for form templates
-    print("\n  Fetching form template documents from KB...")
-    try:
-        docs_resp = api_get("/api/kb/documents?source_label=ITSM%20Form%20Templates&limit=200")
-        docs = docs_resp.get("data", docs_resp.get("documents", []))
-    except Exception as e:
-        print(f"  ERROR fetching docs: {e}")
-        return 1
-
-    if not docs:
-        print("  No form template documents found!")
-        return 1
-
-    print(f"  Found {len(docs)} form template documents")
+    # 1. Stream un-enriched KB docs page by page (cursor pagination, filter runs
+    #    server-side); the next page is fetched while the current one is processed
+    print("\n  Fetching un-enriched form template documents from KB...")
     print(f"  Enrichment dict covers {len(FORM_ENRICHMENTS)} form names\n")
+    pages = queue.Queue(maxsize=2)
+    threading.Thread(target=fetch_pages, args=(pages,), daemon=True).start()
 
+    total_docs = 0
     enriched_count = 0
     skipped_count = 0
     no_match_count = 0
     failed_count = 0
-
-    for doc in docs:
-        doc_id = doc.get("id", "")
-        text = doc.get("text", "")
-
-        # Extract form name from text (look for "Form:" line)
-        form_name = None
-        for line in text.split("\n"):
-            line_stripped = line.strip()
-            if line_stripped.startswith("Form:"):
-                form_name = line_stripped.replace("Form:", "").strip()
+    fetch_failed = False
+    embed_checked = False
+    cache = load_embed_cache()
+    cache_dirty = False
+    pending = []  # (doc, form_name, future) — printed in original doc order at the end
+
+    with ThreadPoolExecutor(max_workers=KB_WORKERS) as pool:
+        while True:
+            docs = pages.get()
+            if docs is None:
                 break
-
-        if not form_name:
-            skipped_count += 1
-            continue
-
-        # Check if already enriched
-        if "Anahtar Kelimeler:" in text or "Kullanim Senaryolari:" in text:
-            print(f"  [{doc_id[:8]}] {form_name} — already enriched, SKIP")
-            skipped_count += 1
-            continue
-
-        # Find enrichment data (exact match)
-        enrichment = FORM_ENRICHMENTS.get(form_name)
-
-        if not enrichment:
-            no_match_count += 1
-            continue
-
-        # Build enriched text
-        enriched_text = text.rstrip() + "\n"
-        enriched_text += f"Anahtar Kelimeler: {enrichment['anahtar_kelimeler']}\n"
-        enriched_text += f"Kullanim Senaryolari: {enrichment['senaryolar']}\n"
-
-        # Embed the enriched text
-        try:
-            embedding = embed_text(enriched_text, EMBED_URL)
-        except Exception as e:
-            print(f"  [{doc_id[:8]}] {form_name} — EMBED FAILED: {e}")
-            failed_count += 1
-            continue
-
-        # Delete old document
-        try:
-            api_delete(f"/api/kb/documents/{doc_id}")
-        except Exception:
-            pass  # May 404
-
-        # Add enriched version with embedding
-        try:
-            api_post("/api/kb/documents", {
-                "documents": [{
-                    "text": enriched_text,
-                    "embedding": embedding,
-                    "source": doc.get("source", "dataset"),
-                    "source_label": "ITSM Form Templates",
-                }]
-            })
-            added = len(enrichment['anahtar_kelimeler']) + len(enrichment['senaryolar'])
-            print(f"  [{doc_id[:8]}] {form_name} — ENRICHED (+{added} chars)")
+            if isinstance(docs, Exception):
+                print(f"  ERROR fetching docs: {docs}")
+                fetch_failed = True
+                break
+            total_docs += len(docs)
+
+            # Pass 1: filter docs and build enriched texts
+            to_embed = []  # (doc, form_name, enriched_text)
+            for doc in docs:
+                doc_id = doc.get("id", "")
+                text = doc.get("text", "")
+
+                # Extract form name from text (look for "Form:" line)
+                m = FORM_RE.search(text)
+                if not m:
+                    skipped_count += 1
+                    continue
+                form_name = m.group(1)
+
+                # Check if already enriched
+                if ENRICHED_RE.search(text):
+                    print(f"  [{doc_id[:8]}] {form_name} — already enriched, SKIP")
+                    skipped_count += 1
+                    continue
+
+                # Find precomputed enrichment suffix (exact match)
+                suffix = FORM_SUFFIX.get(form_name)
+
+                if suffix is None:
+                    no_match_count += 1
+                    continue
+
+                to_embed.append((doc, form_name, text.rstrip() + suffix))
+
+            if not to_embed:
+                continue
+
+            # Embed this page's enriched texts in batched calls
+            print(f"  Embedding {len(to_embed)} enriched texts (batch={EMBED_BATCH})...")
+            errors = []
+            for url in urls_to_try:
+                try:
+                    embeddings, hits = embed_texts_cached([t[2] for t in to_embed], url, cache)
+                except Exception as e:
+                    print(f"  {url} — failed: {e}")
+                    errors.append(e)
+                    continue
+                if len(urls_to_try) > 1 or not embed_checked:
+                    print(f"  Embed API OK: {url} (dim={len(embeddings[0])})")
+                EMBED_URL = url
+                urls_to_try = [url]
+                embed_checked = True
+                if hits:
+                    print(f"  Embed cache: {hits}/{len(to_embed)} hits")
+                cache_dirty |= hits < len(to_embed)
+                break
+            else:
+                print(f"  ERROR: No embed API reachable ({len(errors)} URLs failed)")
+                failed_count += len(to_embed)
+                continue
+
+            # Pass 2: replace each doc with its enriched version (bounded concurrency)
+            for item, embedding in zip(to_embed, embeddings):
+                pending.append((item[0], item[1], pool.submit(update_doc, item, embedding)))
+
+    if cache_dirty:
+        save_embed_cache(cache)
+
+    # Print in original doc order
+    for doc, form_name, fut in pending:
+        ok, msg = fut.result()
+        print(f"  [{doc.get('id', '')[:8]}] {form_name} — {msg}")
+        if ok:
             enriched_count += 1
-        except Exception as e:
-            print(f"  [{doc_id[:8]}] {form_name} — ADD FAILED: {e}")
+        else:
             failed_count += 1
 
-        # Small delay to not overwhelm embed API
-        time.sleep(0.1)
+    if fetch_failed and total_docs == 0:
+        return 1
+    if total_docs == 0:
+        print("  No un-enriched form template documents found — nothing to do.")
+        return 0
+    if fetch_failed:
+        failed_count += 1
 
     print(f"\n{'='*60}")
     print("  SUMMARY")
     print(f"{'='*60}")
-    print(f"  Total docs     : {len(docs)}")
+    print(f"  Total docs     : {total_docs}")
     print(f"  Enriched       : {enriched_count}")
     print(f"  Already done   : {skipped_count}")
     print(f"  No match (OK)  : {no_match_count}")
@@ -485,7 +503,7 @@ def main():
     if failed_count > 0:
         print("  Some enrichments failed — check output above.")
         return 1
-    elif enriched_count == 0 and skipped_count == len(docs):
+    elif enriched_count == 0 and skipped_count + no_match_count == total_docs:
         print("  All forms already enriched — nothing to do.")
     else:
         print(f"  {enriched_count} forms enriched successfully.")
@@ -11,30 +11,134 @@ Changes:
 Usage: python itsm-improve.py
 """
 
-import urllib.request
+import gzip
+import http.client
 import json
+import re
 import sys
-import copy
+import unicodedata
+from urllib.parse import urlsplit
+
+try:
+    import orjson  # hızlı JSON, opsiyonel
+except ImportError:
+    orjson = None
 
 BASE = "http://localhost:8833"
 
+# Bilinen agent adları — önce isim index'inde birebir aranır
+KB_AGENT_NAME = "ITSM KB Araştırmacı"
+RESPONSE_AGENT_NAME = "ITSM Pipeline Yanıtlayıcı"
+
+# İndex'te yoksa ad eşleştirme — öncelik sırasıyla denenir (diakritikli/diakritiksiz yazımlar)
+KB_AGENT_RES = (
+    re.compile(r"KB.*Ara[sş]t[ıi]rmac[ıi]"),
+    re.compile(r"KB", re.IGNORECASE),
+)
+RESPONSE_AGENT_RES = (
+    re.compile(r"Yan[ıi]tlay[ıi]c[ıi]|Pipeline.*ITSM|ITSM.*Pipeline"),
+    re.compile(r"yan[ıi]t|response", re.IGNORECASE),
+)
+
+def json_bytes(obj) -> bytes:
+    return orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode()
+
+
+def json_loads(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+# Tüm API çağrıları tek keep-alive bağlantı üzerinden
+_BASE_URL = urlsplit(BASE)
+_conn = None
+
+
+def api_request(method, path, data=None, timeout=10):
+    global _conn
+    body = json_bytes(data) if data is not None else None
+    headers = {"Accept-Encoding": "gzip"}
+    if body is not None:
+        headers["Content-Type"] = "application/json"
+    for attempt in range(2):
+        if _conn is None:
+            _conn = http.client.HTTPConnection(_BASE_URL.hostname, _BASE_URL.port, timeout=timeout)
+        try:
+            _conn.request(method, f"{_BASE_URL.path}{path}", body=body, headers=headers)
+            resp = _conn.getresponse()
+            raw = resp.read()
+        except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                ConnectionResetError, BrokenPipeError):
+            # Sunucu boştaki bağlantıyı kapatmış — bir kez yeniden bağlan
+            _conn.close()
+            _conn = None
+            if attempt == 1:
+                raise
+            continue
+        except Exception:
+            _conn.close()
+            _conn = None
+            raise
+        break
+    if resp.status >= 400:
+        raise RuntimeError(f"HTTP Error {resp.status}: {resp.reason}")
+    if resp.getheader("Content-Encoding") == "gzip":
+        raw = gzip.decompress(raw)
+    return json_loads(raw)
+
 
 def api_get(path):
-    req = urllib.request.Request(f"{BASE}{path}", method="GET")
-    with urllib.request.urlopen(req, timeout=10) as r:
-        return json.loads(r.read().decode())
+    return api_request("GET", path)
 
 
 def api_put(path, data):
-    payload = json.dumps(data).encode()
-    req = urllib.request.Request(
-        f"{BASE}{path}",
-        data=payload,
-        headers={"Content-Type": "application/json"},
-        method="PUT",
-    )
-    with urllib.request.urlopen(req, timeout=10) as r:
-        return json.loads(r.read().decode())
+    return api_request("PUT", path, data)
+
+
+def save_agent_config(agent, config):
+    """
+    Sadece değişen üst seviye anahtarları config_patch ile gönderir.
+    Hiçbir şey değişmediyse PUT atılmaz. config_patch'i tanımayan eski bir
+    sunucu alanı sessizce yok sayar; yanıtta değişiklik görünmezse tam config gönderilir.
+    """
+    old = agent["config"]
+    patch = {k: v for k, v in config.items() if k not in old or old[k] != v}
+    if not patch:
+        print("  NO-OP: config already up to date.")
+        return
+    saved = api_put(f"/api/kb/agents/{agent['id']}", {"config_patch": patch})
+    if any(saved.get("config", {}).get(k) != v for k, v in patch.items()):
+        api_put(f"/api/kb/agents/{agent['id']}", {"config": config})
+    print(f"  SAVED: {sorted(patch)}")
+
+
+def fold_name(name):
+    """Diakritikleri atıp küçük harfe çevirir: 'ITSM KB Araştırmacı' → 'itsm kb arastirmaci'."""
+    name = name.replace("ı", "i").replace("İ", "I")
+    return unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode().lower()
+
+
+def build_agent_index(agents):
+    """Agent adı → agent; hem orijinal hem fold_name edilmiş ad ile."""
+    index = {}
+    for a in agents:
+        index.setdefault(a["name"], a)
+        index.setdefault(fold_name(a["name"]), a)
+    return index
+
+
+def find_agent(agents, index, name, patterns):
+    """
+    Önce index'te ad (orijinal veya diakritiksiz) ile O(1) arar;
+    bulunamazsa ilk eşleşen pattern'e göre listeyi tarar.
+    """
+    agent = index.get(name) or index.get(fold_name(name))
+    if agent:
+        return agent
+    for pat in patterns:
+        agent = next((a for a in agents if pat.search(a["name"])), None)
+        if agent:
+            return agent
+    return None
 
 
 # ────────────────────────────────────────────────────────────────────
@@ -76,30 +180,12 @@ def fix_workflow():
 # ────────────────────────────────────────────────────────────────────
 # 2. Update ITSM KB Araştırmacı agent
 # ────────────────────────────────────────────────────────────────────
-def fix_kb_agent():
+def fix_kb_agent(agents, index):
     print(f"\n{'='*60}")
     print("  2. Agent Fix — ITSM KB Araştırmacı")
     print(f"{'='*60}")
 
-    agents_resp = api_get("/api/kb/agents")
-    agents = agents_resp["data"]
-
-    agent = None
-    for a in agents:
-        if "KB" in a["name"] and "Araştırmacı" in a["name"]:
-            agent = a
-            break
-        if "KB" in a["name"] and "Arastirmaci" in a["name"]:
-            agent = a
-            break
-
-    if not agent:
-        # Try broader match
-        for a in agents:
-            if "KB" in a["name"].upper():
-                agent = a
-                break
-
+    agent = find_agent(agents, index, KB_AGENT_NAME, KB_AGENT_RES)
     if not agent:
         print("  ERROR: Agent not found!")
         print(f"  Available agents: {[a['name'] for a in agents]}")
@@ -108,7 +194,8 @@ def fix_kb_agent():
     print(f"  Agent ID  : {agent['id']}")
     print(f"  Agent Name: {agent['name']}")
 
-    config = copy.deepcopy(agent["config"])
+    # Sadece üst seviye anahtarlar yeni değerlerle değiştiriliyor; shallow copy yeterli
+    config = dict(agent["config"])
 
     # 2a. Add ragSourceAliases
     old_aliases = config.get("ragSourceAliases", {})
@@ -189,38 +276,19 @@ FORM EŞLEŞTIRME KURALLARI (ÖNCELİKLİ):
 - Form adı UYDURMA — sadece verilen form listesinden seç."""
     print("  systemPrompt: Replaced with improved form matching rules")
 
-    api_put(f"/api/kb/agents/{agent['id']}", {"config": config})
-    print("  SAVED.")
+    save_agent_config(agent, config)
     return True
 
 
 # ────────────────────────────────────────────────────────────────────
 # 3. Update ITSM Pipeline Yanıtlayıcı agent
 # ────────────────────────────────────────────────────────────────────
-def fix_response_agent():
+def fix_response_agent(agents, index):
     print(f"\n{'='*60}")
     print("  3. Agent Fix — ITSM Pipeline Yanıtlayıcı")
     print(f"{'='*60}")
 
-    agents_resp = api_get("/api/kb/agents")
-    agents = agents_resp["data"]
-
-    agent = None
-    for a in agents:
-        if "Yanıtlayıcı" in a["name"] or "Yanitlayici" in a["name"]:
-            agent = a
-            break
-        if "Pipeline" in a["name"] and "ITSM" in a["name"]:
-            agent = a
-            break
-
-    if not agent:
-        # Try broader match
-        for a in agents:
-            if "yanit" in a["name"].lower() or "response" in a["name"].lower():
-                agent = a
-                break
-
+    agent = find_agent(agents, index, RESPONSE_AGENT_NAME, RESPONSE_AGENT_RES)
     if not agent:
         print("  ERROR: Agent not found!")
         print(f"  Available agents: {[a['name'] for a in agents]}")
@@ -229,7 +297,8 @@ def fix_response_agent():
     print(f"  Agent ID  : {agent['id']}")
     print(f"  Agent Name: {agent['name']}")
 
-    config = copy.deepcopy(agent["config"])
+    # Sadece systemPrompt değişiyor; shallow copy yeterli
+    config = dict(agent["config"])
 
     old_sys = config.get("systemPrompt", "")
     form_copy_rule = """
@@ -244,8 +313,7 @@ def fix_response_agent():
         config["systemPrompt"] = old_sys.rstrip() + form_copy_rule
         print(f"  systemPrompt: Added form copy rule ({len(form_copy_rule)} chars)")
 
-    api_put(f"/api/kb/agents/{agent['id']}", {"config": config})
-    print("  SAVED.")
+    save_agent_config(agent, config)
     return True
 
 
@@ -265,17 +333,26 @@ def main():
         print(f"  ERROR in workflow fix: {e}")
         results["workflow"] = False
 
+    # Agent listesi bir kez çekilir, iki fixer da aynı liste ve isim index'ini kullanır
     try:
-        results["kb_agent"] = fix_kb_agent()
-    except Exception as e:
-        print(f"  ERROR in KB agent fix: {e}")
-        results["kb_agent"] = False
-
-    try:
-        results["response_agent"] = fix_response_agent()
+        agents = api_get("/api/kb/agents")["data"]
+        index = build_agent_index(agents)
     except Exception as e:
-        print(f"  ERROR in response agent fix: {e}")
-        results["response_agent"] = False
+        print(f"\n  ERROR fetching agents: {e}")
+        agents = None
+
+    for key, label, fixer in (
+        ("kb_agent", "KB agent", fix_kb_agent),
+        ("response_agent", "response agent", fix_response_agent),
+    ):
+        if agents is None:
+            results[key] = False
+            continue
+        try:
+            results[key] = fixer(agents, index)
+        except Exception as e:
+            print(f"  ERROR in {label} fix: {e}")
+            results[key] = False
 
     print(f"\n{'='*60}")
     print("  SUMMARY")
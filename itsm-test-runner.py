@@ -1,43 +1,96 @@
 #!/usr/bin/env python3
 """
 ITSM Agent Test Runner — 50 Senaryo
-Çıktı: itsm-test-results.json + terminale özet
+Çıktı: itsm-test-results.json (+ koşu sırasında itsm-test-results.ndjson) + terminale özet
 """
 
-import urllib.request
+import gzip
+import hashlib
+import http.client
 import json
+import logging
 import re
+import sqlite3
 import time
 import sys
 import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from urllib.parse import urlsplit
+
+try:
+    import orjson  # SSE parse + sonuç yazımı için hızlı JSON, opsiyonel
+except ImportError:
+    orjson = None
 
 # ─── Config ────────────────────────────────────────────────────────────────
 BASE        = "http://localhost:8833"
 AGENT_ID    = "633417ad-767c-47e6-b77d-db035d663706"
 SCENARIOS_F = os.path.join(os.path.dirname(__file__), "itsm-scenarios.json")
 RESULTS_F   = os.path.join(os.path.dirname(__file__), "itsm-test-results.json")
+RESULTS_ND_F = os.path.join(os.path.dirname(__file__), "itsm-test-results.ndjson")
+CACHE_F     = os.path.join(os.path.dirname(__file__), "itsm-test-cache.sqlite")
 TIMEOUT     = 90   # saniye / istek
-DELAY       = 0.5  # istek arası bekleme (rate-limit koruması)
+DELAY       = 0.5  # token bucket: RATE_BURST istek / DELAY saniye; aynı zamanda backoff tabanı
+CONCURRENCY = 4    # aynı anda çalışan agent isteği sayısı
+RATE_BURST  = 4    # token bucket kapasitesi (art arda gönderilebilecek istek)
+LATENCY_SLO = 30.0 # saniye; ortalama yanıt süresi bunu aşarsa sunucu dolu sayılır
+MAX_DELAY   = 5.0  # backoff üst sınırı (Retry-After hariç)
+
+# ─── JSON helpers ──────────────────────────────────────────────────────────
+def json_loads(data: str | bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def json_dump_bytes(obj) -> bytes:
+    """Pretty-printed UTF-8 JSON (ensure_ascii=False, indent=2 eşdeğeri)."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+def json_line_bytes(obj) -> bytes:
+    """Tek satır UTF-8 JSON + newline (NDJSON kaydı)."""
+    if orjson is not None:
+        return orjson.dumps(obj) + b"\n"
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
 
 # ─── Check fonksiyonları ────────────────────────────────────────────────────
-CHECKS = {
-    "no_email": lambda t: not bool(
-        re.search(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', t)
-    ),
-    "no_chinese": lambda t: not bool(
-        re.search(r'[\u4e00-\u9fff\u3400-\u4dbf\U00020000-\U0002a6df]', t)
-    ),
-    "has_turkish": lambda t: bool(
-        re.search(r'[ğüşöçıİĞÜŞÖÇ]', t)
-    ),
-    "has_content": lambda t: len(t.strip()) > 30,
-    "no_url": lambda t: not bool(re.search(r'https?://', t)),
-    "fallback": lambda t: any(k in t.lower() for k in [
-        "bilgi tabanımda", "bulamadım", "yeterli bilgi",
-        "kapsam", "it destek", "ilgili değil"
-    ]),
-}
+# Email / Çince / URL / Türkçe karakter aramaları tek bir alternation'da birleşir:
+# yanıt bir kez taranır, hangi grubun eşleştiğine göre check sonuçları çıkarılır
+_SCAN_RE = re.compile(
+    r'(?P<email>[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,})'
+    r'|(?P<cjk>[\u4e00-\u9fff\u3400-\u4dbf\U00020000-\U0002a6df])'
+    r'|(?P<url>https?://)'
+    r'|(?P<tr>[ğüşöçıİĞÜŞÖÇ])'
+)
+_SCAN_GROUPS = len(_SCAN_RE.groupindex)
+_FALLBACK_TOKENS = (
+    "bilgi tabanımda", "bulamadım", "yeterli bilgi",
+    "kapsam", "it destek", "ilgili değil",
+)
+
+
+def scan_answer(t: str) -> dict[str, bool]:
+    """Tüm check'lerin sonucunu döner (check adı → bool); regex kısmı tek geçiş."""
+    hits = set()
+    for m in _SCAN_RE.finditer(t):
+        hits.add(m.lastgroup)
+        if len(hits) == _SCAN_GROUPS:
+            break
+    tl = t.lower()
+    return {
+        "no_email":    "email" not in hits,
+        "no_chinese":  "cjk" not in hits,
+        "has_turkish": "tr" in hits,
+        "has_content": len(t.strip()) > 30,
+        "no_url":      "url" not in hits,
+        "fallback":    any(k in tl for k in _FALLBACK_TOKENS),
+    }
+
 
 CHECK_LABELS = {
     "no_email":   "Email yok",
@@ -48,172 +101,479 @@ CHECK_LABELS = {
     "fallback":   "Fallback mesajı",
 }
 
+# ─── HTTP (keep-alive) ──────────────────────────────────────────────────────
+# Her senaryo için yeni TCP bağlantısı açmak yerine thread başına tek bağlantı
+_BASE_URL = urlsplit(BASE)
+_conn_local = threading.local()
+
+
+def _get_conn() -> http.client.HTTPConnection:
+    conn = getattr(_conn_local, "conn", None)
+    if conn is None:
+        conn = http.client.HTTPConnection(_BASE_URL.hostname, _BASE_URL.port, timeout=TIMEOUT)
+        _conn_local.conn = conn
+    return conn
+
+
+def _drop_conn() -> None:
+    conn = getattr(_conn_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _conn_local.conn = None
+
+
+class HttpError(RuntimeError):
+    def __init__(self, status: int, body: str, retry_after: str | None = None):
+        super().__init__(f"HTTP {status}: {body}")
+        self.status = status
+        # Sadece saniye biçimi desteklenir; HTTP-date gelirse yok sayılır
+        self.retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+
+
+def http_post(path: str, payload: bytes, headers: dict) -> http.client.HTTPResponse:
+    """
+    Thread'in kalıcı bağlantısı üzerinden POST atar.
+    Sunucu boşta bağlantıyı kapattıysa bir kez yeniden bağlanır.
+    Yanıt tamamen okunmalı (veya _drop_conn çağrılmalı) ki bağlantı tekrar kullanılabilsin.
+    """
+    headers = {"Content-Type": "application/json", **headers}
+    for attempt in range(2):
+        conn = _get_conn()
+        try:
+            conn.request("POST", path, body=payload, headers=headers)
+            resp = conn.getresponse()
+        except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                ConnectionResetError, BrokenPipeError):
+            _drop_conn()
+            if attempt == 1:
+                raise
+            continue
+        if resp.status >= 400:
+            body = resp.read()[:200].decode("utf-8", "replace")
+            raise HttpError(resp.status, body, resp.getheader("Retry-After"))
+        return resp
+
+
+def http_get_json(path: str):
+    """Thread'in kalıcı bağlantısı üzerinden GET atar, JSON döner."""
+    for attempt in range(2):
+        conn = _get_conn()
+        try:
+            conn.request("GET", path, headers={"Accept-Encoding": "gzip"})
+            resp = conn.getresponse()
+            raw = resp.read()
+        except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                ConnectionResetError, BrokenPipeError):
+            _drop_conn()
+            if attempt == 1:
+                raise
+            continue
+        if resp.status >= 400:
+            raise RuntimeError(f"HTTP {resp.status}: {raw[:200].decode('utf-8', 'replace')}")
+        if resp.getheader("Content-Encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        return json_loads(raw)
+
+
 # ─── SSE okuyucu ────────────────────────────────────────────────────────────
-def run_agent(question: str) -> tuple[str, float]:
-    payload = json.dumps({
+SSE_READ_SIZE = 65536  # tek read'de alınacak maksimum byte
+
+
+def parse_sse_event(record: bytes) -> tuple[bytes | None, bytes]:
+    """Tek SSE kaydını (event, data) byte çiftine ayırır; çok satırlı data b"\n" ile birleşir."""
+    event = None
+    data = []
+    for line in record.split(b"\n"):
+        if line.startswith(b"event: "):
+            event = line[7:].rstrip()
+        elif line.startswith(b"data: "):
+            data.append(line[6:].rstrip())
+    return event, b"\n".join(data)
+
+
+def iter_sse_events(resp):
+    """
+    SSE yanıtını kayıt kayıt (event, data) olarak döner (decode yok).
+    read1 ile gelen chunk'lar kayıt ayracı b"\n\n" üzerinden bölünür;
+    yarım kayıt bir sonraki chunk'a kalır.
+    """
+    buf = b""
+    while True:
+        chunk = resp.read1(SSE_READ_SIZE)
+        if not chunk:
+            break
+        buf += chunk
+        *records, buf = buf.split(b"\n\n")
+        for record in records:
+            yield parse_sse_event(record)
+    if buf.strip():
+        yield parse_sse_event(buf)
+
+
+def run_agent(question: str, limiter: "TokenBucket | None" = None) -> tuple[str, float]:
+    payload = json_line_bytes({
         "agentId": AGENT_ID,
         "messages": [{"role": "user", "content": question}],
         "variables": {}
-    }).encode()
-
-    req = urllib.request.Request(
-        f"{BASE}/api/kb/agents/{AGENT_ID}/run",
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "Accept": "text/event-stream"
-        },
-        method="POST"
-    )
+    })
 
-    full = ""
-    current_event = None
+    parts: list[str] = []
     t0 = time.time()
 
+    done = False
     try:
-        with urllib.request.urlopen(req, timeout=TIMEOUT) as r:
-            for line in r:
-                decoded = line.decode("utf-8").strip()
-                if decoded.startswith("event: "):
-                    current_event = decoded[7:]
-                elif decoded.startswith("data: "):
-                    chunk = decoded[6:]
-                    if chunk == "[DONE]":
-                        break
-                    try:
-                        obj = json.loads(chunk)
-                        if current_event == "stream" and "content" in obj:
-                            full += obj["content"]
-                        elif "choices" in obj:
-                            delta = obj["choices"][0].get("delta", {}).get("content", "")
-                            full += delta
-                    except Exception:
-                        pass
+        r = http_post(
+            f"{_BASE_URL.path}/api/kb/agents/{AGENT_ID}/run",
+            payload,
+            # SSE sıkıştırılmaz: gzip buffer'ı event'leri geciktirir
+            {"Accept": "text/event-stream", "Accept-Encoding": "identity"},
+        )
+        try:
+            # Event adı byte üzerinde karşılaştırılır; sadece JSON payload parse edilir
+            for event, data in iter_sse_events(r):
+                if not data:
+                    continue
+                if data == b"[DONE]":
+                    done = True
+                    break
+                try:
+                    obj = json_loads(data)
+                    if event == b"stream" and "content" in obj:
+                        parts.append(obj["content"])
+                    elif "choices" in obj:
+                        parts.append(obj["choices"][0].get("delta", {}).get("content", ""))
+                except Exception:
+                    pass
+        finally:
+            # Stream sonuna kadar okunmadıysa bağlantı tekrar kullanılamaz
+            if done:
+                r.read()
+            if not r.isclosed():
+                _drop_conn()
+    except HttpError as e:
+        elapsed = time.time() - t0
+        if limiter is not None:
+            limiter.feedback(elapsed, error=e.status in (429, 502, 503, 504),
+                             retry_after=e.retry_after)
+        return f"[ERROR: {e}]", elapsed
     except Exception as e:
-        return f"[ERROR: {e}]", time.time() - t0
+        _drop_conn()
+        elapsed = time.time() - t0
+        if limiter is not None:
+            limiter.feedback(elapsed, error=True)
+        return f"[ERROR: {e}]", elapsed
+
+    elapsed = time.time() - t0
+    if limiter is not None:
+        limiter.feedback(elapsed)
+    return "".join(parts), elapsed
+
+
+# ─── Rate limit ──────────────────────────────────────────────────────────────
+class TokenBucket:
+    """
+    Thread-safe token bucket: capacity kadar istek art arda geçer,
+    sonra saniyede rate token dolar. Sabit sleep'in aksine hızlı biten
+    istekler boşuna beklemez.
+
+    Adaptif backoff: feedback() ile her isteğin süresi ve hata durumu bildirilir.
+    Sunucu dolu görünürse (429/5xx, bağlantı hatası veya ortalama süre
+    LATENCY_SLO'yu aşarsa) tüm worker'lar bir süre bekletilir:
+    base * (1 + ardışık hata) * (1.5 yavaşsa, yoksa 1), MAX_DELAY ile sınırlı.
+    Retry-After gelirse aynen uygulanır.
+    """
+
+    def __init__(self, rate: float, capacity: float, base_delay: float = DELAY):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+        self.lock = threading.Lock()
+        self.base_delay = base_delay
+        self.ema_latency: float | None = None
+        self.consecutive_errors = 0
+        self.paused_until = 0.0
+
+    def feedback(self, elapsed: float, error: bool = False,
+                 retry_after: float | None = None) -> None:
+        with self.lock:
+            if self.ema_latency is None:
+                self.ema_latency = elapsed
+            else:
+                self.ema_latency = 0.2 * elapsed + 0.8 * self.ema_latency
+            self.consecutive_errors = self.consecutive_errors + 1 if error else 0
+
+            slow = self.ema_latency > LATENCY_SLO
+            if retry_after is not None:
+                delay = retry_after
+            elif self.consecutive_errors or slow:
+                multiplier = 1.5 if slow else 1.0
+                delay = min(MAX_DELAY, self.base_delay * (1 + self.consecutive_errors) * multiplier)
+            else:
+                return
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    # Backoff bitince birikmiş token'larla burst yapılmasın
+                    wait = self.paused_until - now
+                    self.tokens = min(self.tokens, 1)
+                    self.ts = self.paused_until
+                else:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+                    self.ts = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# ─── Yanıt cache ─────────────────────────────────────────────────────────────
+class AnswerCache:
+    """
+    sqlite'ta kalıcı (agent, soru, agent config) → yanıt cache'i.
+    Agent config'i değişince anahtar değişir, eski yanıtlar kullanılmaz.
+    Hatalı yanıtlar cache'lenmez.
+    """
+
+    def __init__(self, path: str, cfg_hash: str):
+        self.cfg_hash = cfg_hash
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, answer TEXT, elapsed REAL)"
+        )
+        self.lock = threading.Lock()
 
-    return full, time.time() - t0
+    def key(self, question: str) -> str:
+        return hashlib.sha256(f"{AGENT_ID}|{question}|{self.cfg_hash}".encode()).hexdigest()
 
+    def get(self, question: str) -> str | None:
+        with self.lock:
+            row = self.db.execute(
+                "SELECT answer FROM answers WHERE key = ?", (self.key(question),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, question: str, answer: str, elapsed: float) -> None:
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, elapsed) VALUES (?, ?, ?)",
+                (self.key(question), answer, elapsed),
+            )
+
+    def close(self) -> None:
+        with self.lock:
+            self.db.commit()
+            self.db.close()
 
-# ─── Ana test döngüsü ────────────────────────────────────────────────────────
-def run_all():
-    with open(SCENARIOS_F, encoding="utf-8") as f:
-        scenarios = json.load(f)
 
-    print(f"\n{'='*70}")
-    print(f"  ITSM Agent Test Runner — {len(scenarios)} senaryo")
-    print(f"  Agent  : {AGENT_ID}")
-    print(f"  Başlangıç: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"{'='*70}\n")
+def agent_config_hash() -> str | None:
+    """Agent config'inin hash'i; alınamazsa None (cache devre dışı kalır)."""
+    try:
+        agent = http_get_json(f"{_BASE_URL.path}/api/kb/agents/{AGENT_ID}")
+    except Exception:
+        return None
+    cfg = json.dumps(agent.get("config", {}), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(cfg.encode()).hexdigest()
+
+
+def run_agent_cached(question: str, cache: AnswerCache | None,
+                     limiter: TokenBucket | None) -> tuple[str, float, bool]:
+    """run_agent'ın önüne cache ve rate limit koyar. Returns: (yanıt, süre, cache'ten mi)."""
+    if cache is not None:
+        t0 = time.time()
+        hit = cache.get(question)
+        if hit is not None:
+            return hit, time.time() - t0, True
+    if limiter is not None:
+        limiter.acquire()
+    answer, elapsed = run_agent(question, limiter)
+    if cache is not None and not answer.startswith("[ERROR:"):
+        cache.put(question, answer, elapsed)
+    return answer, elapsed, False
+
+
+# ─── Çıktı ───────────────────────────────────────────────────────────────────
+# Tüm ilerleme çıktısı tek logger'dan geçer. StreamHandler her kayıttan sonra
+# flush eder; bu yüzden her senaryo bloğu tek kayıt olarak basılır (blok başına
+# bir write + bir flush) ve stdout'un satır tamponu kapatılır.
+log = logging.getLogger("itsm")
+
+
+def _setup_log() -> None:
+    if log.handlers:
+        return
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(line_buffering=False)
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+
+# ─── Tek senaryo ─────────────────────────────────────────────────────────────
+def run_scenario(i: int, total: int, sc: dict, cache: AnswerCache | None = None,
+                 limiter: TokenBucket | None = None) -> tuple[dict, list[str]]:
+    """
+    Tek senaryoyu çalıştırır ve check'leri uygular.
+    Returns: (result kaydı, terminale basılacak satırlar)
+    Satırlar toplu döner ki paralel worker'ların çıktısı birbirine karışmasın.
+    """
+    sid      = sc["id"]
+    cat      = sc["category"]
+    question = sc["question"]
+    checks   = sc["checks"]
+
+    lines = [
+        f"[{i:02d}/{total}] {sid} — {cat}",
+        f"  Soru: {question[:80]}{'...' if len(question) > 80 else ''}",
+    ]
+
+    answer, elapsed, cached = run_agent_cached(question, cache, limiter)
+
+    # Her check'i uygula (yanıt bir kez taranır). Agent hatası veya boş yanıt
+    # kullanılamaz: tarama atlanır, istenen tüm check'ler başarısız sayılır.
+    if answer.startswith("[ERROR:") or not answer.strip():
+        scanned = dict.fromkeys(CHECK_LABELS, False)
+    else:
+        scanned = scan_answer(answer)
+    check_results = {}
+    failed_checks = []
+    for ck in checks:
+        ok = scanned.get(ck)
+        check_results[ck] = ok
+        if ok is False:
+            failed_checks.append(ck)
+
+    scenario_pass = len(failed_checks) == 0
+    status = "✅ PASS" if scenario_pass else "❌ FAIL"
+
+    # Terminale özet
+    check_str = "  ".join(
+        f"{'✓' if v else '✗'} {CHECK_LABELS.get(k, k)}"
+        for k, v in check_results.items()
+    )
+    lines.append(f"  {status}  ({elapsed:.1f}s{', cache' if cached else ''})  {check_str}")
+
+    if not scenario_pass:
+        lines.append(f"  ⚠️  Başarısız: {failed_checks}")
+        # İlk 200 karakter göster
+        snippet = answer[:200].replace("\n", " ")
+        lines.append(f"  Yanıt: {snippet}{'...' if len(answer) > 200 else ''}")
+
+    record = {
+        "id":           sid,
+        "category":     cat,
+        "question":     question,
+        "answer":       answer,
+        "answer_len":   len(answer),
+        "elapsed_sec":  round(elapsed, 2),
+        "checks":       check_results,
+        "failed_checks":failed_checks,
+        "pass":         scenario_pass,
+        "cached":       cached,
+    }
+    return record, lines
+
+
+# ─── Ana test döngüsü ────────────────────────────────────────────────────────
+def run_all(use_cache: bool = True, force: frozenset = frozenset()):
+    with open(SCENARIOS_F, "rb") as f:
+        scenarios = json_loads(f.read())
+
+    cfg_hash = agent_config_hash() if use_cache else None
+    cache = AnswerCache(CACHE_F, cfg_hash) if cfg_hash else None
+
+    _setup_log()
+    log.info("\n".join([
+        f"\n{'='*70}",
+        f"  ITSM Agent Test Runner — {len(scenarios)} senaryo",
+        f"  Agent  : {AGENT_ID}",
+        f"  Paralel: {CONCURRENCY} worker",
+        f"  Cache  : {'açık' if cache else 'kapalı'}"
+        f"{'' if cache or not use_cache else ' (agent config alınamadı)'}"
+        f"{f' (force: {sorted(force)})' if cache and force else ''}",
+        f"  Başlangıç: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        f"{'='*70}\n",
+    ]))
 
-    results = []
     passed  = 0
     failed  = 0
-
-    for i, sc in enumerate(scenarios, 1):
-        sid      = sc["id"]
-        cat      = sc["category"]
-        question = sc["question"]
-        checks   = sc["checks"]
-
-        print(f"[{i:02d}/{len(scenarios)}] {sid} — {cat}")
-        print(f"  Soru: {question[:80]}{'...' if len(question) > 80 else ''}")
-
-        answer, elapsed = run_agent(question)
-
-        # Her check'i uygula
-        check_results = {}
-        failed_checks = []
-        for ck in checks:
-            fn = CHECKS.get(ck)
-            if fn is None:
-                check_results[ck] = None
-                continue
-            ok = fn(answer)
-            check_results[ck] = ok
-            if not ok:
-                failed_checks.append(ck)
-
-        scenario_pass = len(failed_checks) == 0
-
-        if scenario_pass:
-            passed += 1
-            status = "✅ PASS"
-        else:
-            failed += 1
-            status = "❌ FAIL"
-
-        # Terminale özet
-        check_str = "  ".join(
-            f"{'✓' if v else '✗'} {CHECK_LABELS.get(k, k)}"
-            for k, v in check_results.items()
-        )
-        print(f"  {status}  ({elapsed:.1f}s)  {check_str}")
-
-        if not scenario_pass:
-            print(f"  ⚠️  Başarısız: {failed_checks}")
-            # İlk 200 karakter göster
-            snippet = answer[:200].replace("\n", " ")
-            print(f"  Yanıt: {snippet}{'...' if len(answer) > 200 else ''}")
-
-        print()
-
-        # Sonucu kaydet
-        results.append({
-            "id":           sid,
-            "category":     cat,
-            "question":     question,
-            "answer":       answer,
-            "answer_len":   len(answer),
-            "elapsed_sec":  round(elapsed, 2),
-            "checks":       check_results,
-            "failed_checks":failed_checks,
-            "pass":         scenario_pass,
-        })
-
-        time.sleep(DELAY)
+    cat_stats: dict[str, dict] = defaultdict(lambda: {"pass": 0, "fail": 0})
+    failures: list[dict] = []
+
+    limiter = TokenBucket(rate=RATE_BURST / DELAY, capacity=RATE_BURST) if DELAY > 0 else None
+
+    # Senaryolar bounded pool'da paralel koşar; çıktı tamamlanma sırasıyla basılır.
+    # Her sonuç tamamlanınca NDJSON'a bir satır yazılır: crash'te kısmi sonuçlar korunur.
+    with open(RESULTS_ND_F, "wb") as nd, \
+            ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        futures = [
+            pool.submit(run_scenario, i, len(scenarios), sc,
+                        None if sc["id"] in force else cache, limiter)
+            for i, sc in enumerate(scenarios, 1)
+        ]
+        for fut in as_completed(futures):
+            record, lines = fut.result()
+            log.info("\n".join(lines) + "\n")
+            nd.write(json_line_bytes(record))
+            nd.flush()
+            if record["pass"]:
+                passed += 1
+                cat_stats[record["category"]]["pass"] += 1
+            else:
+                failed += 1
+                cat_stats[record["category"]]["fail"] += 1
+                failures.append(record)
+
+    if cache:
+        cache.close()
+
+    # Toplu JSON için NDJSON tek geçişte geri okunur; rapor senaryo sırasını korusun
+    order = {sc["id"]: n for n, sc in enumerate(scenarios)}
+    with open(RESULTS_ND_F, "rb") as nd:
+        results = [json_loads(line) for line in nd]
+    results.sort(key=lambda r: order[r["id"]])
+    failures.sort(key=lambda r: order[r["id"]])
 
     # ─── Özet ──────────────────────────────────────────────────────────────
     total = len(scenarios)
     pct   = 100 * passed // total
 
-    print(f"{'='*70}")
-    print(f"  ÖZET")
-    print(f"{'='*70}")
-    print(f"  Toplam   : {total}")
-    print(f"  Geçti    : {passed}  ✅")
-    print(f"  Kaldı    : {failed}  ❌")
-    print(f"  Başarı   : %{pct}")
-    print()
-
-    # Kategorilere göre breakdown
-    cat_stats: dict[str, dict] = {}
-    for r in results:
-        c = r["category"]
-        if c not in cat_stats:
-            cat_stats[c] = {"pass": 0, "fail": 0}
-        if r["pass"]:
-            cat_stats[c]["pass"] += 1
-        else:
-            cat_stats[c]["fail"] += 1
-
-    print("  Kategoriye Göre:")
+    out = [
+        f"{'='*70}",
+        f"  ÖZET",
+        f"{'='*70}",
+        f"  Toplam   : {total}",
+        f"  Geçti    : {passed}  ✅",
+        f"  Kaldı    : {failed}  ❌",
+        f"  Başarı   : %{pct}",
+        "",
+    ]
+
+    # Kategorilere göre breakdown (tamamlanma döngüsünde biriktirildi)
+    out.append("  Kategoriye Göre:")
     for cat, st in sorted(cat_stats.items()):
         tot = st["pass"] + st["fail"]
-        print(f"    {cat:30s}  {st['pass']}/{tot}  {'✅' * st['pass']}{'❌' * st['fail']}")
+        out.append(f"    {cat:30s}  {st['pass']}/{tot}  {'✅' * st['pass']}{'❌' * st['fail']}")
 
-    print()
+    out.append("")
 
     # Başarısız senaryolar
-    failures = [r for r in results if not r["pass"]]
     if failures:
-        print("  Başarısız Senaryolar:")
+        out.append("  Başarısız Senaryolar:")
         for r in failures:
-            print(f"    {r['id']} — {r['category']} — Başarısız: {r['failed_checks']}")
+            out.append(f"    {r['id']} — {r['category']} — Başarısız: {r['failed_checks']}")
     else:
-        print("  🎉 Tüm senaryolar geçti!")
+        out.append("  🎉 Tüm senaryolar geçti!")
 
-    print(f"{'='*70}\n")
+    out.append(f"{'='*70}\n")
+    log.info("\n".join(out))
 
     # JSON kaydet
     output = {
@@ -229,13 +589,27 @@ def run_all():
         "results": results,
     }
 
-    with open(RESULTS_F, "w", encoding="utf-8") as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    with open(RESULTS_F, "wb") as f:
+        f.write(json_dump_bytes(output))
 
-    print(f"  Sonuçlar kaydedildi: {RESULTS_F}\n")
+    log.info(f"  Sonuçlar kaydedildi: {RESULTS_F}  (satır satır: {RESULTS_ND_F})\n")
     return pct
 
 
+def _arg_value(flag: str) -> str | None:
+    """`--flag value` veya `--flag=value` biçimindeki argümanı döner."""
+    args = sys.argv[1:]
+    for n, a in enumerate(args):
+        if a == flag and n + 1 < len(args):
+            return args[n + 1]
+        if a.startswith(flag + "="):
+            return a.split("=", 1)[1]
+    return None
+
+
 if __name__ == "__main__":
-    score = run_all()
+    # --no-cache: tüm senaryolar agent'a gider
+    # --force S01,S07: sadece bu senaryolar cache'i atlar
+    force = frozenset(x for x in (_arg_value("--force") or "").split(",") if x)
+    score = run_all(use_cache="--no-cache" not in sys.argv[1:], force=force)
     sys.exit(0 if score == 100 else 1)
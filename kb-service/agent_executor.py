@@ -10,12 +10,23 @@ Supports:
 - Simple mode fallback for non-agentic agents
 """
 
+import asyncio
+import hashlib
 import json
 import logging
 import time
 import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import islice
 import httpx
-from typing import AsyncGenerator
+import numpy as np
+from typing import AsyncGenerator, NamedTuple
+
+try:
+    import orjson  # fast JSON for the SSE/LLM hot paths, optional
+except ImportError:
+    orjson = None
 
 from sqlalchemy import text as sql_text
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -24,12 +35,15 @@ import re
 
 logger = logging.getLogger("agent_executor")
 
-from tools import get_tool_schemas, get_tool_handler
+from database import async_session, vector_literal
+from tools import get_tool_schemas, get_tool_handler, get_tool_pool
 
 
 # Module-level compiled regex and reserved variable names
 _VARIABLE_PATTERN = re.compile(r'\{\{(\w+)\}\}')
 _RESERVED_VARS = {"context"}
+# websearch_to_tsquery operators a query word must not carry: quotes (phrase) and a leading '-' (NOT)
+_WEBSEARCH_OPS_RE = re.compile(r'"|^-+')
 
 # Turkish synonym expansion for BM25 keyword search
 _TURKISH_SYNONYMS = {
@@ -55,37 +69,462 @@ _TURKISH_SYNONYMS = {
 }
 
 
-def _expand_query_with_synonyms(query_text: str) -> str:
-    """Expand a query string with Turkish synonyms for better BM25 recall."""
-    words = [w.strip().lower() for w in query_text.split() if len(w.strip()) >= 2]
+# Synonyms pre-split into individual tokens (multi-word synonyms → words)
+_SYN_EXPANDED = {
+    key: tuple(tok for syn in syns for tok in syn.split())
+    for key, syns in _TURKISH_SYNONYMS.items()
+}
+
+
+# BM25 recall stops improving well before this many query words
+_SYN_MAX_TOKENS = 64
+
+
+@lru_cache(maxsize=4096)
+def _synonym_tokens(word: str) -> tuple[str, ...]:
+    """Synonym tokens for a word: its own synonyms plus keys containing it (and theirs)."""
+    tokens = list(_SYN_EXPANDED.get(word, ()))
+    for key, syn_tokens in _SYN_EXPANDED.items():
+        if key != word and word in key:
+            tokens.append(key)
+            tokens.extend(syn_tokens)
+    return tuple(tokens)
+
+
+def _expand_query_with_synonyms(query_text: str, max_tokens: int = _SYN_MAX_TOKENS) -> str:
+    """Expand a query string with Turkish synonyms for better BM25 recall.
+
+    Only the first max_tokens words are used, so whole documents passed as
+    variables don't make the expansion (and the tsquery) grow without bound.
+    """
+    words = list(islice((w for w in query_text.lower().split() if len(w) >= 2), max_tokens))
     expanded = list(words)
     for word in words:
-        if word in _TURKISH_SYNONYMS:
-            for syn in _TURKISH_SYNONYMS[word]:
-                # Split multi-word synonyms into individual tokens
-                expanded.extend(syn.split())
-        # Also check if any synonym key contains the word
-        for key, syns in _TURKISH_SYNONYMS.items():
-            if key != word and word in key:
-                expanded.append(key)
-                expanded.extend(s for syn in syns for s in syn.split())
-    return " ".join(set(expanded))
+        expanded.extend(_synonym_tokens(word))
+    # Order-preserving dedup — the same query always yields the same tsquery string
+    return " ".join(dict.fromkeys(expanded))
+
+
+# Shared HTTP client for vLLM chat/embed calls — keeps connections alive across
+# requests instead of a new pool (and TCP handshake) per call.
+_CHAT_CLIENT: httpx.AsyncClient | None = None
+
+
+def get_chat_client() -> httpx.AsyncClient:
+    """Lazily create the process-wide pooled AsyncClient."""
+    global _CHAT_CLIENT
+    if _CHAT_CLIENT is None or _CHAT_CLIENT.is_closed:
+        _CHAT_CLIENT = httpx.AsyncClient(
+            timeout=httpx.Timeout(300.0, connect=10.0),
+            limits=httpx.Limits(max_connections=128, max_keepalive_connections=64),
+        )
+    return _CHAT_CLIENT
+
+
+async def warm_chat_client(*base_urls: str) -> None:
+    """Open a keep-alive connection to each vLLM server ahead of the first request.
+
+    Best effort: a server that is down at startup is simply skipped.
+    """
+    client = get_chat_client()
+
+    async def ping(url: str) -> None:
+        try:
+            await client.get(f"{url}/models", timeout=5.0)
+        except Exception as e:  # also InvalidURL from a malformed app_settings value
+            logger.debug("vLLM warm-up skipped for %s: %s", url, e)
+
+    await asyncio.gather(*(ping(url) for url in dict.fromkeys(base_urls) if url))
+
+
+async def close_chat_client() -> None:
+    """Close the shared client (app shutdown)."""
+    global _CHAT_CLIENT
+    if _CHAT_CLIENT is not None:
+        await _CHAT_CLIENT.aclose()
+        _CHAT_CLIENT = None
+
+
+# search_vector column presence — schema is fixed once init_db ran, so checked once per process
+_HAS_TSVECTOR: bool | None = None
+
+# Query embedding cache: (embed_model, blake2b(query)) → pgvector literal, LRU-evicted
+_EMBED_CACHE: "OrderedDict[tuple[str, bytes], str]" = OrderedDict()
+_EMBED_CACHE_MAX = 512
+
+# Non-streaming LLM responses at temperature 0: blake2b(request body) → response dict, LRU-evicted
+_LLM_CACHE: "OrderedDict[bytes, dict]" = OrderedDict()
+_LLM_CACHE_MAX = 256
+
+# saved_agents rows for sub-agent calls and workflow steps: id → AgentRow, LRU-evicted.
+# The agent update/delete endpoints call invalidate_agent(); the generation counter keeps
+# a load that raced with an invalidation from storing the stale row.
+_AGENT_CACHE: "OrderedDict[str, AgentRow]" = OrderedDict()
+_AGENT_CACHE_MAX = 256
+_AGENT_CACHE_GEN = 0
+
+
+# Reciprocal Rank Fusion constant (k in 1 / (k + rank))
+_RRF_K = 60.0
+
+# Tool router: (embed_model, tool_name) → unit-norm description embedding (float32)
+_TOOL_VEC_CACHE: dict[tuple[str, str], np.ndarray] = {}
+# Below this score spread the prompt doesn't favour any tool — keep them all
+_TOOL_ROUTER_MIN_STD = 0.02
+
+
+class AgentRow(NamedTuple):
+    """Cached saved_agents row; config is parsed and shared — treat it as read-only."""
+    id: str
+    name: str
+    config: dict
+
+
+class RagHit(NamedTuple):
+    """One fused hybrid-search result; same fields as the semantic-only SQL rows."""
+    text: str
+    source_label: str
+    similarity: float
+    kw_score: float
+    rrf_score: float
+
+
+def _rrf_fuse(rows: list, top_k_by_source: dict) -> list[RagHit]:
+    """Fuse raw semantic/keyword rank rows via RRF, keeping top_k rows per source.
+
+    Each row carries either sem_rank + similarity or kw_rank + kw_score; a document
+    matched by both arrives twice and is merged by id. A missing rank contributes 0.
+    """
+    if not rows:
+        return []
+    index: dict = {}
+    docs = []  # (text, source_label) per unique id
+    for row in rows:
+        if row.id not in index:
+            index[row.id] = len(docs)
+            docs.append((row.text, row.source_label))
+
+    n = len(docs)
+    sem_ranks = np.full(n, np.inf)
+    kw_ranks = np.full(n, np.inf)
+    similarity = np.zeros(n)
+    kw_score = np.zeros(n)
+    for row in rows:
+        i = index[row.id]
+        if row.sem_rank is not None:
+            sem_ranks[i] = row.sem_rank
+            similarity[i] = row.similarity
+        else:
+            kw_ranks[i] = row.kw_rank
+            kw_score[i] = row.kw_score
+
+    rrf = np.reciprocal(_RRF_K + sem_ranks) + np.reciprocal(_RRF_K + kw_ranks)
+    # UNION ALL row order is unspecified, so equal scores are broken by document id
+    ids = np.array([str(doc_id) for doc_id in index])
+
+    fused = []
+    taken: dict = {}
+    for i in np.lexsort((ids, -rrf)).tolist():
+        text, source = docs[i]
+        if taken.get(source, 0) >= top_k_by_source.get(source, 0):
+            continue
+        taken[source] = taken.get(source, 0) + 1
+        fused.append(RagHit(text, source, float(similarity[i]), float(kw_score[i]), float(rrf[i])))
+    return fused
+
+
+# ── Search SQL ──────────────────────────────────────────────────────────
+# Built once so every request sends byte-identical statement text, which is
+# what asyncpg's prepared-statement cache keys on (see database.engine).
+# Every ranking ends with an id tiebreaker: equal ts_rank/distance rows would otherwise
+# come back in arbitrary order, so the same query could yield a differently ordered RAG
+# context — a different prompt, and a miss in vLLM's prefix cache.
+
+_SQL_HAS_TSVECTOR = sql_text(
+    "SELECT 1 FROM information_schema.columns "
+    "WHERE table_name = 'kb_documents' AND column_name = 'search_vector' LIMIT 1"
+)
+
+_SQL_LOAD_AGENT = sql_text("SELECT id, name, config FROM saved_agents WHERE id = :id")
+
+_SQL_SEMANTIC = sql_text("""
+    SELECT text, source_label,
+           1 - (embedding <=> CAST(:embedding AS vector)) AS similarity,
+           0.0 AS kw_score,
+           0.0 AS rrf_score
+    FROM kb_documents
+    WHERE 1 - (embedding <=> CAST(:embedding AS vector)) >= :threshold
+    ORDER BY similarity DESC, id
+    LIMIT :top_k
+""")
+
+
+@lru_cache(maxsize=32)
+def _multi_search_sql(n_sources: int, hybrid: bool):
+    """Multi-source search statement for n_sources cfg rows (:src_i, :thr_i, :k_i)."""
+    cfg_rows = ", ".join(
+        f"(CAST(:src_{i} AS text), CAST(:thr_{i} AS float8), CAST(:k_{i} AS int))"
+        for i in range(n_sources)
+    )
+    semantic_cte = f"""semantic AS (
+            SELECT * FROM (
+                SELECT d.id, d.text, d.source_label, c.top_k,
+                       1 - (d.embedding <=> CAST(:embedding AS vector)) AS similarity,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY d.source_label
+                           ORDER BY d.embedding <=> CAST(:embedding AS vector), d.id
+                       ) AS sem_rank
+                FROM kb_documents d JOIN cfg c ON c.source_label = d.source_label
+                WHERE 1 - (d.embedding <=> CAST(:embedding AS vector)) >= c.threshold
+            ) s
+            WHERE sem_rank <= top_k * {3 if hybrid else 1}
+        )"""
+
+    if not hybrid:
+        return sql_text(f"""
+        WITH cfg (source_label, threshold, top_k) AS (VALUES {cfg_rows}),
+        {semantic_cte}
+        SELECT text, source_label, similarity,
+               0.0 AS kw_score,
+               0.0 AS rrf_score
+        FROM semantic
+        ORDER BY source_label, similarity DESC, id
+    """)
+
+    return sql_text(f"""
+        WITH cfg (source_label, threshold, top_k) AS (VALUES {cfg_rows}),
+        {semantic_cte},
+        keyword AS (
+            SELECT * FROM (
+                SELECT d.id, d.text, d.source_label, c.top_k,
+                       ts_rank(d.search_vector, websearch_to_tsquery('simple', :raw_query)) AS kw_score,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY d.source_label
+                           ORDER BY ts_rank(d.search_vector, websearch_to_tsquery('simple', :raw_query)) DESC, d.id
+                       ) AS kw_rank
+                FROM kb_documents d JOIN cfg c ON c.source_label = d.source_label
+                WHERE d.search_vector @@ websearch_to_tsquery('simple', :raw_query)
+            ) k
+            WHERE kw_rank <= top_k * 3
+        )
+        SELECT id, text, source_label, similarity, sem_rank,
+               CAST(NULL AS float8) AS kw_score, CAST(NULL AS bigint) AS kw_rank
+        FROM semantic
+        UNION ALL
+        SELECT id, text, source_label, NULL, NULL, kw_score, kw_rank
+        FROM keyword
+    """)
+
+
+# JSON helpers — orjson when installed, stdlib otherwise (same output: UTF-8, no ASCII escaping)
+
+def json_dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False)
 
 
-# SSE event helpers
+def json_dumps_bytes(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode()
 
-def sse_event(event_type: str, data: dict) -> str:
+
+def json_loads(data: str | bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+# SSE event helpers — frames are bytes, so StreamingResponse sends them without re-encoding
+
+_SSE_PREFIX = {
+    name: f"event: {name}\ndata: ".encode()
+    for name in (
+        "agent_start", "iteration_start", "tool_call", "tool_result",
+        "stream", "final_answer_start", "agent_done", "error",
+    )
+}
+_SSE_DONE = b"data: [DONE]\n\n"
+
+
+def sse_event(event_type: str, data: dict) -> bytes:
     """Format an SSE event with event type and JSON data."""
-    return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    prefix = _SSE_PREFIX.get(event_type) or f"event: {event_type}\ndata: ".encode()
+    return prefix + json_dumps_bytes(data) + b"\n\n"
 
 
-def sse_data(data: dict) -> str:
+def sse_data(data: dict) -> bytes:
     """Format a standard SSE data line (for backward compat with stream chunks)."""
-    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return b"data: " + json_dumps_bytes(data) + b"\n\n"
+
+
+def sse_done() -> bytes:
+    return _SSE_DONE
 
 
-def sse_done() -> str:
-    return "data: [DONE]\n\n"
+class SSEByteParser:
+    """Incremental SSE parser over raw bytes.
+
+    Chunks are appended to a bytearray and split on the blank-line record
+    separator with bytes.find, so no per-line str decode happens. Each complete
+    record yields (event_type, data) as bytes; multi-line data is joined with b"\n".
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, chunk: bytes) -> list[tuple[bytes | None, bytes]]:
+        return [self._parse_record(frame[:-2]) for frame in self.feed_frames(chunk)]
+
+    def feed_frames(self, chunk: bytes) -> list[bytes]:
+        """Complete records as raw bytes, trailing blank line included (forwardable as-is)."""
+        buf = self._buf
+        buf += chunk
+        frames = []
+        start = 0
+        while True:
+            end = buf.find(b"\n\n", start)
+            if end < 0:
+                break
+            frames.append(bytes(buf[start:end + 2]))
+            start = end + 2
+        if start:
+            del buf[:start]
+        return frames
+
+    @staticmethod
+    def iter_chunks(resp: httpx.Response):
+        """Response body chunks; aiter_raw() skips the decoder pass unless the body is encoded."""
+        return resp.aiter_bytes() if "content-encoding" in resp.headers else resp.aiter_raw()
+
+    @staticmethod
+    def _parse_record(record: bytes) -> tuple[bytes | None, bytes]:
+        event_type = None
+        data = []
+        for line in record.split(b"\n"):
+            if line.startswith(b"data: "):
+                data.append(line[6:].rstrip(b"\r"))
+            elif line.startswith(b"event: "):
+                event_type = line[7:].rstrip(b"\r")
+        return event_type, b"\n".join(data)
+
+
+class EmbedBatcher:
+    """Dynamic batching for single-text embedding requests.
+
+    Texts submitted within WINDOW seconds of each other (or until MAX_BATCH are
+    pending) go out as one /embeddings call with input=[...], so concurrent agent
+    runs don't each send their own tiny request. One instance per (url, model).
+    """
+
+    WINDOW = 0.005
+    MAX_BATCH = 32
+    _instances: dict[tuple[str, str], "EmbedBatcher"] = {}
+
+    def __init__(self, embed_url: str, embed_model: str):
+        self.embed_url = embed_url
+        self.embed_model = embed_model
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set = set()  # in-flight batch requests (keeps references alive)
+
+    @classmethod
+    def get(cls, embed_url: str, embed_model: str) -> "EmbedBatcher":
+        batcher = cls._instances.get((embed_url, embed_model))
+        if batcher is None:
+            batcher = cls._instances[(embed_url, embed_model)] = cls(embed_url, embed_model)
+        return batcher
+
+    async def embed(self, text: str) -> list[float]:
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((text, fut))
+        if len(self._pending) >= self.MAX_BATCH:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.WINDOW, self._flush)
+        return await fut
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        try:
+            resp = await get_chat_client().post(
+                f"{self.embed_url}/embeddings",
+                json={"model": self.embed_model, "input": [text for text, _ in batch]},
+                timeout=30.0,
+            )
+            data = sorted(json_loads(resp.content)["data"], key=lambda d: d["index"])
+            if len(data) != len(batch):
+                raise ValueError(f"embedding server returned {len(data)} vectors for {len(batch)} inputs")
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), item in zip(batch, data):
+            if not fut.done():
+                fut.set_result(item["embedding"])
+
+
+async def embed_query_literal(embed_url: str, embed_model: str, query: str) -> str:
+    """Embed a search query and return its pgvector literal; repeated queries hit an LRU cache.
+
+    Shared by RAG resolution and the kb_search tool so both reuse the batcher and
+    the formatted literal instead of re-embedding and re-formatting per call.
+    """
+    key = (embed_model, hashlib.blake2b(query.encode(), digest_size=16).digest())
+    cached = _EMBED_CACHE.get(key)
+    if cached is not None:
+        _EMBED_CACHE.move_to_end(key)
+        return cached
+
+    # Coalesced with concurrent runs' queries into one /embeddings call
+    embedding = await EmbedBatcher.get(embed_url, embed_model).embed(query)
+    embedding_str = vector_literal(embedding)
+
+    _EMBED_CACHE[key] = embedding_str
+    if len(_EMBED_CACHE) > _EMBED_CACHE_MAX:
+        _EMBED_CACHE.popitem(last=False)
+    return embedding_str
+
+
+async def load_agent(session: AsyncSession, agent_id: str) -> AgentRow | None:
+    """saved_agents row (id, name, parsed config) by id; cached until the agent changes."""
+    key = str(agent_id)
+    cached = _AGENT_CACHE.get(key)
+    if cached is not None:
+        _AGENT_CACHE.move_to_end(key)
+        return cached
+
+    gen = _AGENT_CACHE_GEN
+    result = await session.execute(_SQL_LOAD_AGENT, {"id": key})
+    row = result.fetchone()
+    if not row:
+        return None
+    config = row.config
+    if isinstance(config, str):
+        config = json_loads(config)
+    agent = AgentRow(str(row.id), row.name, config)
+
+    if gen == _AGENT_CACHE_GEN:
+        _AGENT_CACHE[key] = agent
+        if len(_AGENT_CACHE) > _AGENT_CACHE_MAX:
+            _AGENT_CACHE.popitem(last=False)
+    return agent
+
+
+def invalidate_agent(agent_id: str) -> None:
+    """Drop a cached agent row after it was updated or deleted."""
+    global _AGENT_CACHE_GEN
+    _AGENT_CACHE_GEN += 1
+    _AGENT_CACHE.pop(str(agent_id), None)
 
 
 class AgentExecutor:
@@ -144,6 +583,12 @@ class AgentExecutor:
         self.agent_mode = config.get("agentMode", "simple")
         self.enabled_tools = config.get("enabledTools", [])
         self.max_iterations = config.get("maxIterations", 10)
+        # Upper bound on tool calls from one LLM turn running at the same time
+        self.max_parallel_tools = max(1, config.get("maxParallelTools") or 8)
+        # JIT tool router: send only the top-K tools by description similarity (0 = all tools)
+        self.tool_router_top_k = config.get("toolRouterTopK", 0)
+        # ReAct history window: tool turns sent verbatim to the LLM (0 = full history)
+        self.history_window = max(0, config.get("historyWindow", 0) or 0)
 
         # RAG config
         self.rag_enabled = config.get("ragEnabled", False)
@@ -154,37 +599,130 @@ class AgentExecutor:
         self.rag_source_config = config.get("ragSourceConfig", {})
         self.rag_debug = {}  # Populated during _resolve_rag for history
 
+        # Source → template alias ('ITSM Knowledge Base' → 'itsm_knowledge_base' unless aliased)
+        self._source_alias: dict[str, str] = {
+            source: self.rag_source_aliases.get(source) or self._source_to_var(source)
+            for source in self.rag_sources
+        }
+
         # Per-instance reserved vars: "context" + all alias values
         self._rag_vars: set = set()
         if self.rag_enabled:
             self._rag_vars.add("context")
-            for source in self.rag_sources:
-                alias = self.rag_source_aliases.get(source) or self._source_to_var(source)
-                self._rag_vars.add(alias)
+            self._rag_vars.update(self._source_alias.values())
+        self._reserved_vars = _RESERVED_VARS | self._rag_vars
+        # All RAG placeholders ({{context}} + source aliases) matched in one pass
+        self._rag_placeholder_re = re.compile(
+            r"\{\{(" + "|".join(re.escape(v) for v in sorted(self._rag_vars, key=len, reverse=True)) + r")\}\}"
+        ) if self._rag_vars else None
+
+        # Templates are split into literal/variable segments once; each run only joins
+        self._prompt_segments = self._compile_template(self.prompt_template)
+        self._system_segments = self._compile_template(self.system_prompt)
+        # Templates without any {{...}} are returned as-is (typical for system prompts)
+        self._prompt_has_vars = any(is_var for is_var, _ in self._prompt_segments)
+        self._system_has_vars = any(is_var for is_var, _ in self._system_segments)
 
         # Guard: thinking + jsonMode conflict — thinking tags break JSON output
         if self.json_mode and self.thinking:
             self.thinking = False
 
+        # Serialized body minus messages, per (stream, tool names) — sampling params and
+        # tool schemas are built/encoded once on first use, not on every LLM call
+        self._body_prefixes: dict[tuple, bytes] = {}
+        # id(message) → (message, its JSON) — ReAct history is append-only and messages are
+        # never mutated once appended, so large tool results are encoded once, not every turn
+        self._message_json: dict[int, tuple[dict, bytes]] = {}
+
         # Runtime state
         self.messages = []
-        self.full_text = ""
+        self._text_parts: list[str] = []  # streamed output; joined on read (see full_text)
         self.tool_calls_made = []
         self.iterations_used = 0
         self.start_time = 0
 
-    def _resolve_template(self, template: str, vars_dict: dict) -> str:
-        """Resolve {{variable}} placeholders in a template string.
+    @property
+    def full_text(self) -> str:
+        """Generated output so far. Stream deltas are appended to a list and joined here
+        (once per read), instead of += on an attribute, which copies the whole string per token."""
+        parts = self._text_parts
+        if len(parts) > 1:
+            parts[:] = ["".join(parts)]
+        return parts[0] if parts else ""
+
+    @full_text.setter
+    def full_text(self, value: str) -> None:
+        self._text_parts = [value] if value else []
+
+    @staticmethod
+    @lru_cache(maxsize=512)
+    def _compile_template(template: str) -> tuple[tuple[bool, str], ...]:
+        """Split a template into (is_var, text) segments: literal text or a variable name.
+
+        Cached per template string — executors are built per request, templates rarely change.
+        """
+        segments = []
+        pos = 0
+        for m in _VARIABLE_PATTERN.finditer(template):
+            if m.start() > pos:
+                segments.append((False, template[pos:m.start()]))
+            segments.append((True, m.group(1)))
+            pos = m.end()
+        if pos < len(template):
+            segments.append((False, template[pos:]))
+        return tuple(segments)
+
+    def _render_segments(self, segments: tuple[tuple[bool, str], ...], vars_dict: dict) -> str:
+        """Render compiled template segments with {{variable}} values.
 
         Reserved vars (e.g. {{context}}) are preserved for RAG injection UNLESS
         they are explicitly provided in vars_dict (e.g. injected by a workflow step).
         """
-        def replacer(m):
-            name = m.group(1)
-            if name in (_RESERVED_VARS | self._rag_vars) and name not in vars_dict:
-                return m.group(0)
-            return vars_dict.get(name, "")
-        return _VARIABLE_PATTERN.sub(replacer, template)
+        out = []
+        for is_var, value in segments:
+            if not is_var:
+                out.append(value)
+            elif value in self._reserved_vars and value not in vars_dict:
+                out.append("{{" + value + "}}")
+            else:
+                out.append(vars_dict.get(value, ""))
+        return "".join(out)
+
+    def _render_templates(self, vars_dict: dict) -> tuple[str, str]:
+        """Render (prompt, system); a template with no variables skips rendering."""
+        prompt = (
+            self._render_segments(self._prompt_segments, vars_dict)
+            if self._prompt_has_vars else self.prompt_template
+        )
+        system = (
+            self._render_segments(self._system_segments, vars_dict)
+            if self._system_has_vars else self.system_prompt
+        )
+        return prompt, system
+
+    def _fill_rag_placeholders(self, prompt: str, system: str, values: dict) -> tuple[str, str, set]:
+        """Replace every RAG placeholder in one regex pass per string.
+
+        A placeholder present in the prompt is filled there and blanked in the system
+        prompt; unknown/empty values become "". Returns (prompt, system, names found).
+        """
+        if self._rag_placeholder_re is None or ("{{" not in prompt and "{{" not in system):
+            return prompt, system, set()
+        in_prompt: set = set()
+        found: set = set()
+
+        def fill_prompt(m):
+            in_prompt.add(m.group(1))
+            return values.get(m.group(1), "")
+
+        def fill_system(m):
+            found.add(m.group(1))
+            return "" if m.group(1) in in_prompt else values.get(m.group(1), "")
+
+        # Prompt first: its matches decide which system placeholders are blanked
+        prompt = self._rag_placeholder_re.sub(fill_prompt, prompt)
+        system = self._rag_placeholder_re.sub(fill_system, system)
+        return prompt, system, in_prompt | found
 
     @staticmethod
     def _source_to_var(source: str) -> str:
@@ -236,22 +774,14 @@ class AgentExecutor:
         sess = parent_session or self.session
 
         # Load sub-agent
-        result = await sess.execute(
-            sql_text("SELECT id, name, config FROM saved_agents WHERE id = :id"),
-            {"id": agent_id}
-        )
-        row = result.fetchone()
+        row = await load_agent(sess, agent_id)
         if not row:
             return f"Error: Sub-agent {agent_id} not found"
 
-        sub_config = row.config
-        if isinstance(sub_config, str):
-            sub_config = json.loads(sub_config)
-
         # Force simple mode for sub-agents to prevent deep recursion with tools
         sub_executor = AgentExecutor(
-            config=sub_config,
-            agent_id=str(row.id),
+            config=row.config,
+            agent_id=row.id,
             agent_name=row.name,
             session=sess,
             chat_url=self.chat_url,
@@ -260,155 +790,294 @@ class AgentExecutor:
             depth=depth,
         )
 
-        # Run non-streaming and collect text
-        collected = ""
+        # Run non-streaming: execute_simple yields a single data frame (response or error),
+        # so only the last event is parsed
+        last = None
         async for event in sub_executor.execute_simple(variables, stream=False):
-            # event is an SSE string; parse it to get content
-            if event.startswith("data: ") and "[DONE]" not in event:
-                try:
-                    payload = json.loads(event[6:].strip())
-                    content = payload.get("choices", [{}])[0].get("message", {}).get("content", "")
-                    if content:
-                        collected = content
-                except Exception:
-                    pass
-            elif event.startswith("event: final_answer"):
-                # Extract from next data line
+            last = event
+
+        collected = ""
+        if last is not None:
+            try:
+                payload = json_loads(last.removeprefix(b"data: ").strip())
+                collected = payload.get("choices", [{}])[0].get("message", {}).get("content", "")
+            except Exception:
                 pass
 
         return collected or sub_executor.full_text or "(Sub-agent returned no output)"
 
+    async def _run_tool(self, tool_name: str, tool_args: dict, tool_context: dict) -> str:
+        """Run one tool handler; errors and unknown tools become result strings."""
+        handler = get_tool_handler(tool_name)
+        if not handler:
+            return f"Unknown tool: {tool_name}"
+        try:
+            # Waits here when the tool's process-wide pool is full (backpressure across runs)
+            async with get_tool_pool(tool_name):
+                return await handler(tool_args, tool_context)
+        except Exception as e:
+            return f"Tool execution error: {str(e)}"
+
+    async def _run_tool_calls(self, calls: list[tuple[str, dict, str]], tool_context: dict) -> list[str]:
+        """Run one LLM turn's tool calls concurrently (at most max_parallel_tools at once).
+
+        An AsyncSession can't run concurrent statements, so with more than one call each
+        gets its own session; a single call keeps the executor's session.
+        """
+        if len(calls) == 1:
+            tool_name, tool_args, _ = calls[0]
+            return [await self._run_tool(tool_name, tool_args, tool_context)]
+
+        sem = asyncio.Semaphore(self.max_parallel_tools)
+
+        async def run_one(tool_name: str, tool_args: dict) -> str:
+            async with sem:
+                async with async_session() as tool_session:
+                    return await self._run_tool(tool_name, tool_args, {**tool_context, "session": tool_session})
+
+        return await asyncio.gather(*(run_one(tool_name, tool_args) for tool_name, tool_args, _ in calls))
+
+    @staticmethod
+    def _answer_begun(text: str) -> bool:
+        """True once streamed turn text has non-blank content past an optional <think> block."""
+        text = text.lstrip()
+        if "<think>".startswith(text) or text.startswith("<think>"):
+            _, sep, rest = text.partition("</think>")
+            return bool(sep and rest.strip())
+        return bool(text)
+
+    @staticmethod
+    def _merge_tool_call_deltas(acc: dict[int, dict], deltas: list) -> None:
+        """Merge streamed tool_call fragments by index: id/name set once, arguments concatenated."""
+        for d in deltas:
+            tc = acc.get(d.get("index", 0))
+            if tc is None:
+                tc = acc[d.get("index", 0)] = {
+                    "id": "", "type": "function", "function": {"name": "", "arguments": ""},
+                }
+            if d.get("id"):
+                tc["id"] = d["id"]
+            func = d.get("function") or {}
+            if func.get("name"):
+                tc["function"]["name"] = func["name"]
+            if func.get("arguments"):
+                tc["function"]["arguments"] += func["arguments"]
+
+    @staticmethod
+    def _summarize_tool_turn(turn: list[dict]) -> list[str]:
+        """One line per tool call of an assistant turn: name(args) → start of the result."""
+        names = {
+            tc["id"]: (tc["function"]["name"], tc["function"]["arguments"][:200])
+            for tc in turn[0].get("tool_calls") or []
+        }
+        lines = []
+        for msg in turn[1:]:
+            name, args = names.get(msg.get("tool_call_id"), ("?", ""))
+            result = " ".join((msg.get("content") or "")[:300].split())
+            lines.append(f"- {name}({args}) → {result}")
+        return lines
+
+    def _window_messages(self) -> list[dict]:
+        """Messages for the next ReAct LLM call.
+
+        Without historyWindow this is the full history. With it, the system prompt and
+        user prompt are kept, plus the most recent tool turns; older turns are folded into
+        a short summary appended to the user prompt. Compaction happens in batches (down
+        to half the window) so the summarized prefix stays identical — and in vLLM's
+        prefix cache — for several iterations instead of changing every turn.
+        """
+        starts = self._turn_starts
+        if not self.history_window or not starts:
+            return self.messages
+
+        if len(starts) - self._compacted_turns > self.history_window:
+            keep = max(1, self.history_window // 2)
+            for i in range(self._compacted_turns, len(starts) - keep):
+                self._history_summary += self._summarize_tool_turn(self.messages[starts[i]:starts[i + 1]])
+            self._compacted_turns = len(starts) - keep
+
+        if not self._compacted_turns:
+            return self.messages
+        head = self.messages[:starts[0]]
+        prompt = head[-1]
+        summary = {
+            "role": prompt["role"],
+            "content": prompt["content"] + "\n\n[Earlier tool calls, summarized]\n" + "\n".join(self._history_summary),
+        }
+        return head[:-1] + [summary] + self.messages[starts[self._compacted_turns]:]
+
+    def _encode_body(self, messages: list, tools: list | None, stream: bool) -> bytes:
+        """JSON request body: cached '{...params, tools,"messages":' prefix + messages."""
+        key = (stream, tuple(t["function"]["name"] for t in tools) if tools else ())
+        prefix = self._body_prefixes.get(key)
+        if prefix is None:
+            body = self._build_base_body(stream=stream)
+            if tools:
+                body["tools"] = tools
+                body["tool_choice"] = "auto"
+            prefix = json_dumps_bytes(body)[:-1] + b',"messages":'
+            self._body_prefixes[key] = prefix
+
+        cache = self._message_json
+        parts = []
+        for msg in messages:
+            entry = cache.get(id(msg))
+            if entry is None or entry[0] is not msg:
+                entry = cache[id(msg)] = (msg, json_dumps_bytes(msg))
+            parts.append(entry[1])
+        return prefix + b"[" + b",".join(parts) + b"]}"
+
     async def _call_llm(self, messages: list, tools: list | None = None, stream: bool = False) -> dict | AsyncGenerator:
-        """Make a single LLM call. Returns full response dict for non-streaming."""
-        body = self._build_base_body(stream=stream)
-        body["messages"] = messages
-        if tools:
-            body["tools"] = tools
-            body["tool_choice"] = "auto"
-
-        async with httpx.AsyncClient(timeout=300.0) as client:
-            if stream:
-                return client.stream(
-                    "POST",
-                    f"{self.chat_url}/chat/completions",
-                    json=body,
-                    headers={"Content-Type": "application/json"},
-                )
-            else:
-                resp = await client.post(
-                    f"{self.chat_url}/chat/completions",
-                    json=body,
-                    headers={"Content-Type": "application/json"},
-                )
-                if resp.status_code != 200:
-                    raise Exception(f"vLLM returned {resp.status_code}: {resp.text}")
-                return resp.json()
+        """Make a single LLM call. Returns full response dict for non-streaming.
+
+        With stream=True returns the httpx stream context manager; use it as
+        `async with await self._call_llm(..., stream=True) as resp:` so the response
+        is closed even when the consumer stops early.
+        """
+        content = self._encode_body(messages, tools, stream)
+
+        # Greedy decoding is deterministic: an identical request body (model, params,
+        # tools, messages) gets the same answer, so it is served from the cache
+        cache_key = None
+        if not stream and self.temperature == 0:
+            cache_key = hashlib.blake2b(content, digest_size=16).digest()
+            cached = _LLM_CACHE.get(cache_key)
+            if cached is not None:
+                _LLM_CACHE.move_to_end(cache_key)
+                return cached
+
+        client = get_chat_client()
+        if stream:
+            return client.stream(
+                "POST",
+                f"{self.chat_url}/chat/completions",
+                content=content,
+                headers={"Content-Type": "application/json"},
+            )
+        else:
+            resp = await client.post(
+                f"{self.chat_url}/chat/completions",
+                content=content,
+                headers={"Content-Type": "application/json"},
+            )
+            if resp.status_code != 200:
+                raise Exception(f"vLLM returned {resp.status_code}: {resp.text}")
+            data = json_loads(resp.content)
+            if cache_key is not None:
+                _LLM_CACHE[cache_key] = data
+                if len(_LLM_CACHE) > _LLM_CACHE_MAX:
+                    _LLM_CACHE.popitem(last=False)
+            return data
 
     async def _check_tsvector_exists(self) -> bool:
-        """Check if search_vector column exists in kb_documents (for backward compat)."""
+        """Check if search_vector column exists in kb_documents (for backward compat).
+
+        The first successful check is memoized for the process; failures are retried.
+        """
+        global _HAS_TSVECTOR
+        if _HAS_TSVECTOR is not None:
+            return _HAS_TSVECTOR
         try:
-            result = await self.session.execute(sql_text(
-                "SELECT 1 FROM information_schema.columns "
-                "WHERE table_name = 'kb_documents' AND column_name = 'search_vector' LIMIT 1"
-            ))
-            return result.fetchone() is not None
+            result = await self.session.execute(_SQL_HAS_TSVECTOR)
+            _HAS_TSVECTOR = result.fetchone() is not None
+            return _HAS_TSVECTOR
         except Exception:
             return False
 
-    async def _hybrid_search(
+    async def _embed_query(self, query: str) -> str:
+        """Embed a RAG query and return its pgvector literal (cached, batched)."""
+        return await embed_query_literal(self.embed_url, self.embed_model, query)
+
+    async def _route_tools(self, query: str, tool_schemas: list[dict]) -> list[dict]:
+        """Keep the toolRouterTopK schemas whose descriptions best match the query.
+
+        Tool description embeddings are cached per process; the query and any uncached
+        descriptions go out in one /embeddings call. Returns all schemas when routing is
+        off, unnecessary, inconclusive (near-uniform scores) or fails.
+        """
+        k = self.tool_router_top_k
+        if not k or k < 1 or len(tool_schemas) <= k or not self.embed_url or not self.embed_model:
+            return tool_schemas
+
+        names = [s["function"]["name"] for s in tool_schemas]
+        missing = [i for i, name in enumerate(names) if (self.embed_model, name) not in _TOOL_VEC_CACHE]
+        try:
+            resp = await get_chat_client().post(
+                f"{self.embed_url}/embeddings",
+                json={
+                    "model": self.embed_model,
+                    "input": [query] + [tool_schemas[i]["function"].get("description", names[i]) for i in missing],
+                },
+                timeout=30.0,
+            )
+            data = sorted(json_loads(resp.content)["data"], key=lambda d: d["index"])
+        except Exception as e:
+            logger.warning("Tool routing failed for agent=%s, sending all tools: %s", self.agent_name, e)
+            return tool_schemas
+
+        vecs = np.array([d["embedding"] for d in data], dtype=np.float32)
+        vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        for row, i in enumerate(missing, start=1):
+            _TOOL_VEC_CACHE[(self.embed_model, names[i])] = vecs[row]
+
+        tools_mat = np.stack([_TOOL_VEC_CACHE[(self.embed_model, name)] for name in names])
+        scores = tools_mat @ vecs[0]
+        if float(scores.std()) < _TOOL_ROUTER_MIN_STD:
+            return tool_schemas
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [tool_schemas[i] for i in sorted(top.tolist())]
+
+    @staticmethod
+    def _build_websearch_query(query_text: str) -> str:
+        """Synonym-expanded OR query for websearch_to_tsquery ("" if no usable words).
+
+        Tokenizing and punctuation handling happen in Postgres; websearch_to_tsquery
+        never raises on odd input, unlike to_tsquery. Only its operators are stripped here.
+        """
+        expanded = _expand_query_with_synonyms(query_text)
+        words = (_WEBSEARCH_OPS_RE.sub('', w) for w in expanded.split())
+        # Deduplicate while preserving order; "or" is the operator itself
+        unique_words = dict.fromkeys(w for w in words if len(w) >= 2 and w != "or")
+        return " or ".join(unique_words)
+
+    async def _semantic_search(self, embedding_str: str, threshold: float, top_k: int) -> list:
+        """Pure vector cosine search over all sources (no sources configured)."""
+        result = await self.session.execute(_SQL_SEMANTIC, {
+            "embedding": embedding_str,
+            "threshold": threshold,
+            "top_k": top_k,
+        })
+        return result.fetchall()
+
+    async def _hybrid_search_multi(
         self,
         embedding_str: str,
-        source_label: str,
-        threshold: float,
-        top_k: int,
+        plans: list[tuple[str, int, float]],
         query_text: str,
         use_bm25: bool = True,
     ) -> list:
-        """Hybrid: vector cosine + BM25 keyword, merged via Reciprocal Rank Fusion.
+        """Hybrid search (vector cosine + BM25 keyword, RRF) for several sources in one statement.
 
-        Falls back to pure semantic search if use_bm25=False or tsquery is empty.
+        plans: (source_label, top_k, threshold) per source. Each source keeps its own
+        threshold and over-fetch (top_k * 3) via PARTITION BY source_label. The hybrid
+        statement returns raw semantic/keyword ranks; _rrf_fuse merges them and keeps at
+        most top_k rows per source.
         """
-        # Build expanded keyword query
-        expanded = _expand_query_with_synonyms(query_text)
-        # Sanitize: only keep alphanumeric + Turkish chars, strip punctuation
-        sanitize_re = re.compile(r'[^a-zA-Z0-9çğıöşüÇĞİÖŞÜ]')
-        words = [sanitize_re.sub('', w).strip() for w in expanded.split()]
-        words = [w for w in words if len(w) >= 2]
-        # Deduplicate while preserving order
-        seen = set()
-        unique_words = []
-        for w in words:
-            wl = w.lower()
-            if wl not in seen:
-                seen.add(wl)
-                unique_words.append(wl)
-        ts_query_str = " | ".join(unique_words) if unique_words else ""
-
-        fetch_limit = top_k * 3  # Over-fetch for better RRF fusion
-
-        if use_bm25 and ts_query_str:
-            sql = sql_text("""
-                WITH semantic AS (
-                    SELECT id, text, source_label,
-                           1 - (embedding <=> CAST(:embedding AS vector)) AS similarity,
-                           ROW_NUMBER() OVER (ORDER BY embedding <=> CAST(:embedding AS vector)) AS sem_rank
-                    FROM kb_documents
-                    WHERE source_label = :source
-                      AND 1 - (embedding <=> CAST(:embedding AS vector)) >= :threshold
-                    LIMIT :fetch_limit
-                ),
-                keyword AS (
-                    SELECT id, text, source_label,
-                           ts_rank(search_vector, to_tsquery('simple', :tsquery)) AS kw_score,
-                           ROW_NUMBER() OVER (ORDER BY ts_rank(search_vector, to_tsquery('simple', :tsquery)) DESC) AS kw_rank
-                    FROM kb_documents
-                    WHERE source_label = :source
-                      AND search_vector @@ to_tsquery('simple', :tsquery)
-                    LIMIT :fetch_limit
-                ),
-                combined AS (
-                    SELECT COALESCE(s.id, k.id) AS id,
-                           COALESCE(s.text, k.text) AS text,
-                           COALESCE(s.source_label, k.source_label) AS source_label,
-                           COALESCE(s.similarity, 0) AS similarity,
-                           COALESCE(k.kw_score, 0) AS kw_score,
-                           COALESCE(1.0/(60 + s.sem_rank), 0) + COALESCE(1.0/(60 + k.kw_rank), 0) AS rrf_score
-                    FROM semantic s FULL OUTER JOIN keyword k ON s.id = k.id
-                )
-                SELECT text, source_label, similarity, kw_score, rrf_score
-                FROM combined ORDER BY rrf_score DESC LIMIT :top_k
-            """)
-            params = {
-                "embedding": embedding_str,
-                "source": source_label,
-                "threshold": threshold,
-                "tsquery": ts_query_str,
-                "fetch_limit": fetch_limit,
-                "top_k": top_k,
-            }
-        else:
-            # Pure semantic fallback
-            source_filter = "AND source_label = :source" if source_label else ""
-            sql = sql_text(f"""
-                SELECT text, source_label,
-                       1 - (embedding <=> CAST(:embedding AS vector)) AS similarity,
-                       0.0 AS kw_score,
-                       0.0 AS rrf_score
-                FROM kb_documents
-                WHERE 1 - (embedding <=> CAST(:embedding AS vector)) >= :threshold
-                {source_filter}
-                ORDER BY similarity DESC
-                LIMIT :top_k
-            """)
-            params = {
-                "embedding": embedding_str,
-                "threshold": threshold,
-                "top_k": top_k,
-            }
-            if source_label:
-                params["source"] = source_label
+        raw_query = self._build_websearch_query(query_text) if use_bm25 else ""
+
+        params = {"embedding": embedding_str}
+        for i, (source, top_k, threshold) in enumerate(plans):
+            params[f"src_{i}"] = source
+            params[f"thr_{i}"] = threshold
+            params[f"k_{i}"] = top_k
+
+        if raw_query:
+            params["raw_query"] = raw_query
+            result = await self.session.execute(_multi_search_sql(len(plans), True), params)
+            return _rrf_fuse(result.fetchall(), {source: top_k for source, top_k, _ in plans})
 
-        result = await self.session.execute(sql, params)
+        # Pure semantic fallback
+        result = await self.session.execute(_multi_search_sql(len(plans), False), params)
         return result.fetchall()
 
     async def _resolve_rag(self, resolved_prompt: str, resolved_system: str, variables: dict | None = None) -> tuple[str, str, int]:
@@ -433,19 +1102,14 @@ class AgentExecutor:
             if not rag_query.strip():
                 rag_query = resolved_prompt
 
-            # Embed the semantic query
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                embed_resp = await client.post(
-                    f"{self.embed_url}/embeddings",
-                    json={"model": self.embed_model, "input": rag_query}
-                )
-                embed_data = embed_resp.json()
-                query_embedding = embed_data["data"][0]["embedding"]
-
-            embedding_str = "[" + ",".join(str(v) for v in query_embedding) + "]"
-
-            # Check if hybrid search (BM25) is available
-            has_tsvector = await self._check_tsvector_exists()
+            # Embed the semantic query while checking if hybrid search (BM25) is available —
+            # the embedding round-trip and the catalog lookup are independent. An embed error
+            # cancels the check and waits for it, so the rollback below never races it.
+            async with asyncio.TaskGroup() as tg:
+                embed_task = tg.create_task(self._embed_query(rag_query))
+                tsvector_task = tg.create_task(self._check_tsvector_exists())
+            embedding_str = embed_task.result()
+            has_tsvector = tsvector_task.result()
 
             # Per-source hybrid search with configurable quotas via ragSourceConfig
             #
@@ -462,6 +1126,7 @@ class AgentExecutor:
                 default_secondary_k = 3
                 default_primary_k = max(1, self.rag_top_k - default_secondary_k * n_secondary)
 
+                plans = []  # (source, top_k, threshold)
                 for src_idx, source in enumerate(self.rag_sources):
                     src_cfg = self.rag_source_config.get(source, {})
                     if src_idx == 0:
@@ -469,26 +1134,34 @@ class AgentExecutor:
                     else:
                         src_top_k = src_cfg.get("topK", default_secondary_k)
                     src_threshold = src_cfg.get("threshold", self.rag_threshold if src_idx == 0 else max(0.15, self.rag_threshold - 0.15))
+                    plans.append((source, src_top_k, src_threshold))
 
+                # All sources in one statement; hybrid failure falls back to pure semantic
+                try:
+                    all_rows = await self._hybrid_search_multi(
+                        embedding_str, plans, rag_query, use_bm25=has_tsvector,
+                    )
+                except Exception as search_err:
+                    logger.warning("Hybrid search failed for sources=%s, falling back to semantic: %s",
+                                   self.rag_sources, search_err)
+                    try:
+                        await self.session.rollback()
+                    except Exception:
+                        pass
                     try:
-                        rows = await self._hybrid_search(
-                            embedding_str, source, src_threshold, src_top_k,
-                            rag_query, use_bm25=has_tsvector,
+                        all_rows = await self._hybrid_search_multi(
+                            embedding_str, plans, rag_query, use_bm25=False,
                         )
-                    except Exception as src_err:
-                        logger.warning("Hybrid search failed for source=%s, falling back to semantic: %s", source, src_err)
-                        try:
-                            await self.session.rollback()
-                        except Exception:
-                            pass
-                        # Fallback to pure semantic for this source
-                        try:
-                            rows = await self._hybrid_search(
-                                embedding_str, source, src_threshold, src_top_k,
-                                rag_query, use_bm25=False,
-                            )
-                        except Exception:
-                            rows = []
+                    except Exception:
+                        all_rows = []
+
+                grouped: dict = {}
+                for row in all_rows:
+                    grouped.setdefault(row.source_label, []).append(row)
+
+                # Dedup and debug capture in source order (primary first)
+                for source, src_top_k, src_threshold in plans:
+                    rows = grouped.get(source, [])
 
                     # Dedup across sources
                     deduped = []
@@ -522,53 +1195,36 @@ class AgentExecutor:
                 search_rows = search_rows[:self.rag_top_k]
             else:
                 # No sources configured — use threshold-only search
-                rows = await self._hybrid_search(
-                    embedding_str, "", self.rag_threshold, self.rag_top_k,
-                    rag_query, use_bm25=False,
-                )
+                rows = await self._semantic_search(embedding_str, self.rag_threshold, self.rag_top_k)
                 search_rows = list(rows)
 
             if search_rows:
                 count = len(search_rows)
 
-                # 1. Per-source injection: each source's rows into its alias placeholder
-                per_source_injected = False
+                # 1. Per-source text for each alias placeholder (first source wins an alias)
+                values = {}
                 for source in self.rag_sources:
-                    alias = self.rag_source_aliases.get(source) or self._source_to_var(source)
                     rows = per_source_rows.get(source, [])
-                    placeholder = "{{" + alias + "}}"
-                    if rows:
-                        source_text = "\n\n---\n\n".join(r.text for r in rows)
-                        if placeholder in resolved_prompt:
-                            resolved_prompt = resolved_prompt.replace(placeholder, source_text)
-                            per_source_injected = True
-                        elif placeholder in resolved_system:
-                            resolved_system = resolved_system.replace(placeholder, source_text)
-                            per_source_injected = True
-                    # Clean up unfilled alias placeholders
-                    resolved_prompt = resolved_prompt.replace(placeholder, "")
-                    resolved_system = resolved_system.replace(placeholder, "")
+                    values.setdefault(self._source_alias[source], "\n\n---\n\n".join(r.text for r in rows))
 
                 # 2. {{context}} catch-all (backward compat — combined results)
                 context_text = "\n\n---\n\n".join(r.text for r in search_rows)
-                if "{{context}}" in resolved_prompt:
-                    resolved_prompt = resolved_prompt.replace("{{context}}", context_text)
-                elif "{{context}}" in resolved_system:
-                    resolved_system = resolved_system.replace("{{context}}", context_text)
-                elif not per_source_injected:
+                values["context"] = context_text
+
+                resolved_prompt, resolved_system, found = self._fill_rag_placeholders(
+                    resolved_prompt, resolved_system, values
+                )
+                per_source_injected = any(values.get(name) for name in found if name != "context")
+                if "context" not in found and not per_source_injected:
                     # Auto-inject only when no per-source injection was done
                     resolved_system += f"\n\n[Retrieved Context]\n{context_text}"
 
                 return resolved_prompt, resolved_system, count
             else:
                 # No results — clean up all RAG placeholders
-                for source in self.rag_sources:
-                    alias = self.rag_source_aliases.get(source) or self._source_to_var(source)
-                    placeholder = "{{" + alias + "}}"
-                    resolved_prompt = resolved_prompt.replace(placeholder, "")
-                    resolved_system = resolved_system.replace(placeholder, "")
-                resolved_prompt = resolved_prompt.replace("{{context}}", "")
-                resolved_system = resolved_system.replace("{{context}}", "")
+                resolved_prompt, resolved_system, _ = self._fill_rag_placeholders(
+                    resolved_prompt, resolved_system, {}
+                )
 
         except Exception as e:
             logger.error("RAG failed for agent=%s: %s", self.agent_name, e, exc_info=True)
@@ -578,13 +1234,9 @@ class AgentExecutor:
             except Exception:
                 pass
             # Clean up placeholders on error too
-            for source in self.rag_sources:
-                alias = self.rag_source_aliases.get(source) or self._source_to_var(source)
-                placeholder = "{{" + alias + "}}"
-                resolved_prompt = resolved_prompt.replace(placeholder, "")
-                resolved_system = resolved_system.replace(placeholder, "")
-            resolved_prompt = resolved_prompt.replace("{{context}}", "")
-            resolved_system = resolved_system.replace("{{context}}", "")
+            resolved_prompt, resolved_system, _ = self._fill_rag_placeholders(
+                resolved_prompt, resolved_system, {}
+            )
 
         return resolved_prompt, resolved_system, 0
 
@@ -592,10 +1244,10 @@ class AgentExecutor:
         self,
         variables: dict,
         stream: bool = True,
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """
         Simple mode: single LLM call with streaming (backward compatible).
-        Yields SSE strings.
+        Yields SSE frames (bytes).
         """
         # Merge variables
         config_vars = self.config.get("variables", [])
@@ -606,8 +1258,7 @@ class AgentExecutor:
                 merged[name] = v.get("defaultValue", "")
         merged.update(variables)
 
-        resolved_prompt = self._resolve_template(self.prompt_template, merged)
-        resolved_system = self._resolve_template(self.system_prompt, merged)
+        resolved_prompt, resolved_system = self._render_templates(merged)
 
         # RAG — pass variables for semantic query extraction
         resolved_prompt, resolved_system, rag_count = await self._resolve_rag(resolved_prompt, resolved_system, merged)
@@ -621,32 +1272,34 @@ class AgentExecutor:
         self.start_time = time.time()
 
         if stream:
-            body = self._build_base_body(stream=True)
-            body["messages"] = self.messages
-
             try:
-                async with httpx.AsyncClient(timeout=300.0) as client:
-                    async with client.stream(
-                        "POST", f"{self.chat_url}/chat/completions",
-                        json=body, headers={"Content-Type": "application/json"},
-                    ) as resp:
-                        if resp.status_code != 200:
-                            error_body = await resp.aread()
-                            yield sse_data({"error": error_body.decode()})
-                            return
-                        async for line in resp.aiter_lines():
-                            if line.startswith("data: "):
-                                yield line + "\n\n"
-                                payload = line[6:]
-                                if payload.strip() == "[DONE]":
+                async with await self._call_llm(self.messages, stream=True) as resp:
+                    if resp.status_code != 200:
+                        error_body = await resp.aread()
+                        yield sse_data({"error": error_body.decode()})
+                        return
+                    parser = SSEByteParser()
+                    # No chunk_size: chunks are forwarded as they arrive
+                    async for raw in parser.iter_chunks(resp):
+                        for frame in parser.feed_frames(raw):
+                            if frame.startswith(b"data: ") and frame.count(b"\n") == 2:
+                                # vLLM's usual single-line record — forwarded unchanged
+                                payload = frame[6:-2].rstrip(b"\r")
+                            else:
+                                _, payload = parser._parse_record(frame[:-2])
+                                if not payload:
                                     continue
-                                try:
-                                    chunk = json.loads(payload)
-                                    delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
-                                    if delta:
-                                        self.full_text += delta
-                                except Exception:
-                                    pass
+                                frame = b"data: " + payload + b"\n\n"
+                            yield frame
+                            if payload.strip() == b"[DONE]":
+                                continue
+                            try:
+                                chunk = json_loads(payload)
+                                delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
+                                if delta:
+                                    self._text_parts.append(delta)
+                            except Exception:
+                                pass
             except httpx.RequestError as e:
                 yield sse_data({"error": str(e)})
         else:
@@ -660,7 +1313,7 @@ class AgentExecutor:
     async def execute_react(
         self,
         variables: dict,
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """
         ReAct mode: iterative reasoning + tool calling loop.
         Yields SSE events with typed events (thinking, tool_call, tool_result, stream, done, error).
@@ -674,29 +1327,38 @@ class AgentExecutor:
                 merged[name] = v.get("defaultValue", "")
         merged.update(variables)
 
-        resolved_prompt = self._resolve_template(self.prompt_template, merged)
-        resolved_system = self._resolve_template(self.system_prompt, merged)
-
-        # RAG (pre-loop) — pass variables for semantic query extraction
-        resolved_prompt, resolved_system, rag_count = await self._resolve_rag(resolved_prompt, resolved_system, merged)
+        resolved_prompt, resolved_system = self._render_templates(merged)
 
-        # Prepare tool schemas
-        tool_schemas = get_tool_schemas(self.enabled_tools) if self.enabled_tools else []
-        tool_context = self._get_tool_context()
+        # RAG (pre-loop) — pass variables for semantic query extraction.
+        # Runs as a task so tool-schema prep (and routing) overlaps the embedding/search
+        # round-trips; the group awaits (or on error cancels) it before anything else happens.
+        async with asyncio.TaskGroup() as tg:
+            rag_task = tg.create_task(self._resolve_rag(resolved_prompt, resolved_system, merged))
 
-        # Build initial messages
-        agentic_system = resolved_system
-        if tool_schemas:
-            agentic_system += (
+            # Prepare tool schemas — routed against the prompt before RAG context is added
+            tool_schemas = get_tool_schemas(self.enabled_tools) if self.enabled_tools else []
+            route_task = tg.create_task(self._route_tools(resolved_prompt, tool_schemas))
+            tool_context = self._get_tool_context()
+            tools_hint = (
                 "\n\nYou have access to tools. Use them when you need external information or actions. "
                 "When you have enough information to answer, respond directly without calling tools. "
                 "Think step by step about what information you need and which tools to use."
-            )
+            ) if tool_schemas else ""
+
+        resolved_prompt, resolved_system, rag_count = rag_task.result()
+        tool_schemas = route_task.result()
+
+        # Build initial messages
+        agentic_system = resolved_system + tools_hint
 
         self.messages = []
         if agentic_system.strip():
             self.messages.append({"role": "system", "content": agentic_system})
         self.messages.append({"role": "user", "content": resolved_prompt})
+        # self.messages keeps the full history (logged); _window_messages() bounds what is sent
+        self._turn_starts: list[int] = []
+        self._compacted_turns = 0
+        self._history_summary: list[str] = []
 
         self.start_time = time.time()
 
@@ -713,38 +1375,78 @@ class AgentExecutor:
 
             yield sse_event("iteration_start", {"iteration": iteration + 1})
 
-            # Call LLM with tools (non-streaming for tool detection)
+            # Call LLM with tools, streaming: tool_call deltas are merged as they arrive.
+            # Text is held back only until it is past a <think> block and non-blank, then
+            # streamed live. Qwen sometimes emits a preamble ("Let me search the KB…")
+            # before its tool_calls; if one arrives after text was sent, `stream_reset`
+            # tells the client to drop what it showed for this turn.
+            content_parts: list[str] = []
+            tool_acc: dict[int, dict] = {}
+            answer_started = False
             try:
-                response = await self._call_llm(
-                    self.messages,
+                async with await self._call_llm(
+                    self._window_messages(),
                     tools=tool_schemas if tool_schemas else None,
-                    stream=False,
-                )
+                    stream=True,
+                ) as resp:
+                    if resp.status_code != 200:
+                        error_body = await resp.aread()
+                        raise Exception(f"vLLM returned {resp.status_code}: {error_body.decode(errors='replace')}")
+                    parser = SSEByteParser()
+                    async for raw in parser.iter_chunks(resp):
+                        for _, payload in parser.feed(raw):
+                            if not payload or payload.strip() == b"[DONE]":
+                                continue
+                            try:
+                                chunk = json_loads(payload)
+                            except ValueError:
+                                continue
+                            delta = (chunk.get("choices") or [{}])[0].get("delta") or {}
+                            if delta.get("tool_calls"):
+                                self._merge_tool_call_deltas(tool_acc, delta["tool_calls"])
+                                if answer_started:
+                                    answer_started = False
+                                    yield sse_event("stream_reset", {"iteration": iteration + 1})
+                            text = delta.get("content")
+                            if text:
+                                content_parts.append(text)
+                                if answer_started:
+                                    yield sse_event("stream", {"content": text})
+                                elif not tool_acc and self._answer_begun("".join(content_parts)):
+                                    answer_started = True
+                                    yield sse_event("final_answer_start", {"iteration": iteration + 1})
+                                    yield sse_event("stream", {"content": "".join(content_parts)})
             except Exception as e:
                 yield sse_event("error", {"message": str(e), "iteration": iteration + 1})
                 return
 
-            choice = response.get("choices", [{}])[0]
-            message = choice.get("message", {})
-            finish_reason = choice.get("finish_reason", "")
-
             # Check for tool calls
-            tool_calls = message.get("tool_calls", [])
+            tool_calls = [tool_acc[i] for i in sorted(tool_acc)]
+            for tc in tool_calls:
+                # Same id in the assistant message and the tool result message
+                tc["id"] = tc["id"] or f"call_{uuid.uuid4().hex[:8]}"
 
             if tool_calls:
                 # Agent wants to use tools
                 # Add assistant message with tool calls to history
-                self.messages.append(message)
+                self._turn_starts.append(len(self.messages))
+                self.messages.append({
+                    "role": "assistant",
+                    "content": "".join(content_parts) or None,
+                    "tool_calls": tool_calls,
+                })
 
+                # 1. Announce every call, 2. run them concurrently, 3. report in call order
+                calls = []  # (tool_name, tool_args, tool_call_id)
                 for tc in tool_calls:
                     func = tc.get("function", {})
                     tool_name = func.get("name", "")
                     tool_args_str = func.get("arguments", "{}")
-                    tool_call_id = tc.get("id", f"call_{uuid.uuid4().hex[:8]}")
+                    tool_call_id = tc["id"]
 
                     try:
-                        tool_args = json.loads(tool_args_str) if isinstance(tool_args_str, str) else tool_args_str
-                    except json.JSONDecodeError:
+                        tool_args = json_loads(tool_args_str) if isinstance(tool_args_str, str) else tool_args_str
+                    except ValueError:
                         tool_args = {}
 
                     # Emit tool_call event
@@ -754,21 +1456,18 @@ class AgentExecutor:
                         "args": tool_args,
                         "call_id": tool_call_id,
                     })
+                    calls.append((tool_name, tool_args, tool_call_id))
 
-                    # Execute tool
-                    handler = get_tool_handler(tool_name)
-                    if handler:
-                        try:
-                            result = await handler(tool_args, tool_context)
-                        except Exception as e:
-                            result = f"Tool execution error: {str(e)}"
-                    else:
-                        result = f"Unknown tool: {tool_name}"
+                # Execute tools
+                results = await self._run_tool_calls(calls, tool_context)
 
+                for (tool_name, tool_args, tool_call_id), result in zip(calls, results):
+                    # One slice of the (possibly large) result; the history preview is cut from it
+                    preview = result[:2000]
                     self.tool_calls_made.append({
                         "tool": tool_name,
                         "args": tool_args,
-                        "result": result[:500],
+                        "result": preview[:500],
                         "iteration": iteration + 1,
                     })
 
@@ -777,7 +1476,7 @@ class AgentExecutor:
                         "iteration": iteration + 1,
                         "tool": tool_name,
                         "call_id": tool_call_id,
-                        "result": result[:2000],  # truncate for SSE
+                        "result": preview,  # truncate for SSE
                     })
 
                     # Add tool result to messages
@@ -792,14 +1491,14 @@ class AgentExecutor:
 
             else:
                 # No tool calls - this is the final answer
-                content = message.get("content", "")
+                content = "".join(content_parts)
                 self.full_text = content
 
-                yield sse_event("final_answer_start", {"iteration": iteration + 1})
-
-                # Emit existing content directly — no second LLM call
-                if content:
-                    yield sse_event("stream", {"content": content})
+                if not answer_started:
+                    # Whole turn was held back (empty or only a <think> block)
+                    yield sse_event("final_answer_start", {"iteration": iteration + 1})
+                    if content:
+                        yield sse_event("stream", {"content": content})
 
                 # Done
                 yield sse_event("agent_done", {
@@ -821,7 +1520,7 @@ class AgentExecutor:
         self,
         variables: dict,
         stream: bool = True,
-    ) -> AsyncGenerator[str, None]:
+    ) -> AsyncGenerator[bytes, None]:
         """
         Main entry point. Routes to simple or react mode based on config.
         """
@@ -867,10 +1566,11 @@ class AgentExecutor:
                 "step": self.workflow_step,
             }
 
-        res_text = self.full_text[:50000]
+        full_text = self.full_text
+        res_text = full_text[:50000]
         res_payload = {
             "text": res_text,
-            "truncated": len(self.full_text) > 50000,
+            "truncated": len(full_text) > 50000,
         }
         if self.tool_calls_made:
             res_payload["tool_calls"] = self.tool_calls_made
@@ -8,13 +8,15 @@ from typing import Optional
 import httpx
 from fastapi import FastAPI, Depends, Query, HTTPException, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.responses import StreamingResponse
 from sqlalchemy import text, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from database import init_db, get_session, async_session
+from database import init_db, get_session, async_session, vector_literal, warm_pool
 from models import (
     DocumentsAddRequest, DocumentUpdate, DocumentResponse, DocumentsListResponse,
+    EnrichFormsRequest, EnrichFormsResponse,
     BulkDeleteRequest, BulkDeleteResponse,
     SearchRequest, SearchResponse, SearchResultItem,
     StatsResponse, MessageResponse,
@@ -28,18 +30,40 @@ from models import (
     WorkflowCreate, WorkflowUpdate, WorkflowResponse, WorkflowListResponse,
     WorkflowRunRequest,
 )
-from agent_executor import AgentExecutor
+from agent_executor import AgentExecutor, get_chat_client, close_chat_client, warm_chat_client, invalidate_agent, load_agent, json_dumps, json_dumps_bytes, json_loads
 from tools import get_available_tool_names, TOOL_REGISTRY
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    # Warm-up: DB pool connections and vLLM keep-alive connections before the first request
+    await warm_pool()
+    async with async_session() as session:
+        chat_url = await resolve_vllm_url(session, "forge_chat_url", "forge_chat_fallback_url", VLLM_CHAT_DEFAULT)
+        embed_url = await resolve_vllm_url(session, "forge_embed_url", "forge_embed_fallback_url", VLLM_EMBED_DEFAULT)
+    await warm_chat_client(chat_url, embed_url)
     yield
+    await close_chat_client()
+
+
+class JSONGZipMiddleware(GZipMiddleware):
+    """GZip for regular responses; SSE endpoints (agent/workflow run, chat proxy)
+    pass through untouched since gzip buffering would hold back streamed events."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (
+            scope["path"].endswith("/run") or scope["path"].startswith("/api/chat/")
+        ):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
 
 
 app = FastAPI(title="Forge KB Service", version="1.0.0", lifespan=lifespan)
 
+app.add_middleware(JSONGZipMiddleware, minimum_size=1024)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -57,7 +81,7 @@ async def add_documents(req: DocumentsAddRequest, session: AsyncSession = Depend
     params = {}
     for i, doc in enumerate(req.documents):
         doc_id = str(uuid.uuid4())
-        embedding_str = "[" + ",".join(str(v) for v in doc.embedding) + "]"
+        embedding_str = vector_literal(doc.embedding)
         values.append(
             f"(:id_{i}, :text_{i}, CAST(:embedding_{i} AS vector), :source_{i}, :source_label_{i})"
         )
@@ -88,10 +112,21 @@ async def add_documents(req: DocumentsAddRequest, session: AsyncSession = Depend
 async def list_documents(
     source: Optional[str] = Query(None),
     source_label: Optional[str] = Query(None),
+    text_not_contains: Optional[list[str]] = Query(None),
+    cursor: Optional[str] = Query(None),
     page: int = Query(1, ge=1),
     limit: int = Query(50, ge=1, le=200),
     session: AsyncSession = Depends(get_session),
 ):
+    """List docs. Passing `cursor` (empty for the first page) switches to keyset
+    pagination by id: rows after the cursor, plus `next_cursor` for the next call.
+    In cursor mode `total` is only counted on the first page."""
+    if cursor:
+        try:
+            cursor = str(uuid.UUID(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
     conditions = []
     params = {}
 
@@ -101,30 +136,53 @@ async def list_documents(
     if source_label:
         conditions.append("source_label = :source_label")
         params["source_label"] = source_label
+    # Exclude docs containing any of the given substrings (literal match, no LIKE wildcards)
+    for i, needle in enumerate(text_not_contains or []):
+        conditions.append(f"strpos(text, :not_contains_{i}) = 0")
+        params[f"not_contains_{i}"] = needle
 
     where_clause = ""
     if conditions:
         where_clause = "WHERE " + " AND ".join(conditions)
 
-    # Count
-    count_query = f"SELECT COUNT(*) FROM kb_documents {where_clause}"
-    result = await session.execute(text(count_query), params)
-    total = result.scalar()
+    # Count — later cursor pages skip the full scan
+    total = None
+    if not cursor:
+        count_query = f"SELECT COUNT(*) FROM kb_documents {where_clause}"
+        result = await session.execute(text(count_query), params)
+        total = result.scalar()
 
     # Fetch (without embedding for performance)
-    offset = (page - 1) * limit
-    fetch_query = f"""
-        SELECT id, text, source, source_label, created_at
-        FROM kb_documents
-        {where_clause}
-        ORDER BY created_at DESC
-        LIMIT :limit OFFSET :offset
-    """
-    params["limit"] = limit
-    params["offset"] = offset
+    next_cursor = None
+    if cursor is not None:
+        if cursor:
+            conditions.append("id > CAST(:cursor AS uuid)")
+            params["cursor"] = cursor
+        fetch_query = f"""
+            SELECT id, text, source, source_label, created_at
+            FROM kb_documents
+            WHERE {' AND '.join(conditions) or 'TRUE'}
+            ORDER BY id
+            LIMIT :limit
+        """
+        params["limit"] = limit + 1
+    else:
+        offset = (page - 1) * limit
+        fetch_query = f"""
+            SELECT id, text, source, source_label, created_at
+            FROM kb_documents
+            {where_clause}
+            ORDER BY created_at DESC
+            LIMIT :limit OFFSET :offset
+        """
+        params["limit"] = limit
+        params["offset"] = offset
 
     result = await session.execute(text(fetch_query), params)
     rows = result.fetchall()
+    if cursor is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1].id)
 
     data = [
         DocumentResponse(
@@ -137,7 +195,7 @@ async def list_documents(
         for row in rows
     ]
 
-    return DocumentsListResponse(data=data, total=total, page=page, limit=limit)
+    return DocumentsListResponse(data=data, total=total, page=page, limit=limit, next_cursor=next_cursor)
 
 
 @app.put("/api/kb/documents/{doc_id}", response_model=DocumentResponse)
@@ -161,7 +219,7 @@ async def update_document(doc_id: str, req: DocumentUpdate, session: AsyncSessio
         updates["text"] = "text = :text"
         params["text"] = req.text
     if req.embedding is not None:
-        embedding_str = "[" + ",".join(str(v) for v in req.embedding) + "]"
+        embedding_str = vector_literal(req.embedding)
         updates["embedding"] = "embedding = CAST(:embedding AS vector)"
         params["embedding"] = embedding_str
     if req.source is not None:
@@ -228,11 +286,104 @@ async def bulk_delete(req: BulkDeleteRequest, session: AsyncSession = Depends(ge
     return BulkDeleteResponse(deleted=result.rowcount)
 
 
+FORM_LINE_RE = re.compile(r"^[ \t]*Form:[ \t]*(\S.*?)\s*$", re.MULTILINE)
+ENRICH_EMBED_BATCH = 64
+
+
+@app.post("/api/kb/documents/enrich-forms", response_model=EnrichFormsResponse)
+async def enrich_forms(req: EnrichFormsRequest, session: AsyncSession = Depends(get_session)):
+    """Append per-form suffixes to matching docs, re-embed them in batches and update each batch
+    as it returns (one transaction, committed at the end)."""
+    start = time.time()
+
+    conditions = ["source_label = :source_label"]
+    params = {"source_label": req.source_label}
+    for i, marker in enumerate(req.skip_markers):
+        conditions.append(f"strpos(text, :marker_{i}) = 0")
+        params[f"marker_{i}"] = marker
+    result = await session.execute(
+        text(f"SELECT id, text FROM kb_documents WHERE {' AND '.join(conditions)}"), params
+    )
+    rows = result.fetchall()
+
+    targets = []  # (id, form_name, enriched_text)
+    skipped = 0   # no "Form:" line (the client pipeline reports these as skipped too)
+    for row in rows:
+        m = FORM_LINE_RE.search(row.text)
+        if not m:
+            skipped += 1
+            continue
+        suffix = req.suffixes.get(m.group(1))
+        if suffix is not None:
+            targets.append((str(row.id), m.group(1), row.text.rstrip() + suffix))
+
+    if targets:
+        # Length-sorted so each embed batch holds similar-length texts (less padding)
+        targets.sort(key=lambda t: len(t[2]))
+        embed_url = await resolve_vllm_url(session, "forge_embed_url", "forge_embed_fallback_url", VLLM_EMBED_DEFAULT)
+        try:
+            client = get_chat_client()  # shared pool; per-request timeout below
+            embed_model = req.embed_model
+            if not embed_model:
+                model_data = (await client.get(f"{embed_url}/models", timeout=120.0)).json()
+                embed_model = model_data["data"][0]["id"] if model_data.get("data") else ""
+            # Each batch is written as soon as its vectors return: bind parameters stay
+            # at 3 * ENRICH_EMBED_BATCH per statement (asyncpg caps at 32767) and no
+            # embeddings accumulate in memory
+            for b in range(0, len(targets), ENRICH_EMBED_BATCH):
+                batch = targets[b:b + ENRICH_EMBED_BATCH]
+                try:
+                    resp = await client.post(
+                        f"{embed_url}/embeddings",
+                        json={"model": embed_model, "input": [t[2] for t in batch]},
+                        timeout=120.0,
+                    )
+                    resp.raise_for_status()
+                    data = sorted(resp.json()["data"], key=lambda d: d.get("index", 0))
+                    vectors = [d["embedding"] for d in data]
+                except (httpx.HTTPError, KeyError, ValueError) as e:
+                    raise HTTPException(status_code=502, detail=f"Embed API error: {e}")
+                if len(vectors) != len(batch):
+                    raise HTTPException(status_code=502, detail="Embed API returned wrong number of vectors")
+
+                values = []
+                params = {}
+                for i, ((doc_id, _, enriched_text), emb) in enumerate(zip(batch, vectors)):
+                    values.append(f"(CAST(:id_{i} AS uuid), :text_{i}, CAST(:embedding_{i} AS vector))")
+                    params[f"id_{i}"] = doc_id
+                    params[f"text_{i}"] = enriched_text
+                    params[f"embedding_{i}"] = vector_literal(emb)
+                await session.execute(text(f"""
+                    UPDATE kb_documents AS d
+                    SET text = v.text, embedding = v.embedding
+                    FROM (VALUES {', '.join(values)}) AS v(id, text, embedding)
+                    WHERE d.id = v.id
+                """), params)
+            await session.commit()
+        except HTTPException:
+            await session.rollback()
+            raise
+        except Exception as e:
+            await session.rollback()
+            if "idx_kb_text_unique" in str(e) or "unique" in str(e).lower():
+                raise HTTPException(status_code=409, detail="Duplicate text: an enriched text already exists")
+            raise
+
+    return EnrichFormsResponse(
+        total=len(rows),
+        enriched=len(targets),
+        skipped=skipped,
+        no_match=len(rows) - skipped - len(targets),
+        enriched_forms=[t[1] for t in targets],
+        elapsed_ms=int((time.time() - start) * 1000),
+    )
+
+
 @app.post("/api/kb/search", response_model=SearchResponse)
 async def search_documents(req: SearchRequest, session: AsyncSession = Depends(get_session)):
     start = time.time()
 
-    embedding_str = "[" + ",".join(str(v) for v in req.embedding) + "]"
+    embedding_str = vector_literal(req.embedding)
 
     conditions = []
     params = {
@@ -898,9 +1049,15 @@ async def update_agent(agent_id: str, req: AgentUpdate, session: AsyncSession =
     if req.description is not None:
         updates["description"] = "description = :description"
         params["description"] = req.description
-    if req.config is not None:
-        updates["config"] = "config = CAST(:config AS jsonb)"
-        params["config"] = json.dumps(req.config)
+    if req.config is not None or req.config_patch is not None:
+        config_expr = "config"
+        if req.config is not None:
+            config_expr = "CAST(:config AS jsonb)"
+            params["config"] = json.dumps(req.config)
+        if req.config_patch is not None:
+            config_expr = f"{config_expr} || CAST(:config_patch AS jsonb)"
+            params["config_patch"] = json.dumps(req.config_patch)
+        updates["config"] = f"config = {config_expr}"
 
     if not updates:
         raise HTTPException(status_code=400, detail="No fields to update")
@@ -911,6 +1068,7 @@ async def update_agent(agent_id: str, req: AgentUpdate, session: AsyncSession =
         params
     )
     await session.commit()
+    invalidate_agent(agent_id)
 
     if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Agent not found")
@@ -929,6 +1087,7 @@ async def delete_agent(agent_id: str, session: AsyncSession = Depends(get_sessio
         text("DELETE FROM saved_agents WHERE id = :id"), {"id": agent_id}
     )
     await session.commit()
+    invalidate_agent(agent_id)
     if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Agent not found")
     return MessageResponse(message="Agent deleted")
@@ -1075,6 +1234,23 @@ def _evaluate_condition(condition: dict, step_outputs: dict, input_vars: dict) -
     return True  # unknown operator = always run
 
 
+def _tag_step_event(event: bytes, step_id: str, idx: int) -> bytes:
+    """Executor frame 'event: X / data: {...}' → 'event: step_X' with step_id/step_index added.
+
+    The executor already serialized the payload once; the two keys are spliced into the
+    JSON object text instead of a parse + re-dump per event. Frames without an object
+    payload are returned unchanged.
+    """
+    header, sep, data = event.partition(b"\ndata: ")
+    data = data.rstrip(b"\n")
+    if not sep or not data.startswith(b"{"):
+        return event
+    tag = json_dumps_bytes({"step_id": step_id, "step_index": idx})[1:-1]
+    body = data[1:].lstrip()
+    comma = b"" if body.startswith(b"}") else b","
+    return b"event: step_" + header[7:] + b"\ndata: {" + tag + comma + body + b"\n\n"
+
+
 @app.post("/api/kb/workflows/{wf_id}/run")
 async def run_workflow(
     wf_id: str,
@@ -1093,7 +1269,7 @@ async def run_workflow(
 
     steps = row.steps
     if isinstance(steps, str):
-        steps = json.loads(steps)
+        steps = json_loads(steps)
 
     if not steps:
         raise HTTPException(status_code=400, detail="Workflow has no steps")
@@ -1124,7 +1300,7 @@ async def run_workflow(
             step_start_time = time.time()
 
             if not agent_id:
-                yield f"event: step_error\ndata: {json.dumps({'step_id': step_id, 'index': idx, 'error': 'No agent configured'})}\n\n"
+                yield f"event: step_error\ndata: {json_dumps({'step_id': step_id, 'index': idx, 'error': 'No agent configured'})}\n\n"
                 continue
 
             # FR-1: Conditional step execution
@@ -1135,22 +1311,16 @@ async def run_workflow(
                     default_out = step.get("defaultOutput", "")
                     step_outputs[step_id] = default_out
                     prev_output = default_out
-                    yield f"event: step_skip\ndata: {json.dumps({'step_id': step_id, 'index': idx, 'default_output': default_out})}\n\n"
+                    yield f"event: step_skip\ndata: {json_dumps({'step_id': step_id, 'index': idx, 'default_output': default_out})}\n\n"
                     continue
 
             # Load agent
-            agent_result = await session.execute(
-                text("SELECT id, name, config FROM saved_agents WHERE id = :id"),
-                {"id": agent_id}
-            )
-            agent_row = agent_result.fetchone()
+            agent_row = await load_agent(session, agent_id)
             if not agent_row:
-                yield f"event: step_error\ndata: {json.dumps({'step_id': step_id, 'index': idx, 'error': f'Agent {agent_id} not found'})}\n\n"
+                yield f"event: step_error\ndata: {json_dumps({'step_id': step_id, 'index': idx, 'error': f'Agent {agent_id} not found'})}\n\n"
                 continue
 
             config = agent_row.config
-            if isinstance(config, str):
-                config = json.loads(config)
 
             # Resolve variables: apply mappings
             resolved_vars = {}
@@ -1168,7 +1338,7 @@ async def run_workflow(
                     resolved_vars[var_name] = mapping  # literal value
 
             # Emit step start
-            yield f"event: step_start\ndata: {json.dumps({'step_id': step_id, 'index': idx, 'agent_name': agent_row.name, 'agent_id': agent_id})}\n\n"
+            yield f"event: step_start\ndata: {json_dumps({'step_id': step_id, 'index': idx, 'agent_name': agent_row.name, 'agent_id': agent_id})}\n\n"
 
             # Create executor with workflow context
             executor = AgentExecutor(
@@ -1190,31 +1360,20 @@ async def run_workflow(
             try:
                 async for event in executor.execute(resolved_vars, stream=True):
                     # Forward sub-events with step context
-                    if event.startswith("event: "):
+                    # Executor frames are bytes
+                    if event.startswith(b"event: "):
                         # Re-emit agentic events with step prefix
-                        lines = event.strip().split("\n")
-                        event_type = lines[0].replace("event: ", "")
-                        data_line = lines[1] if len(lines) > 1 else ""
-                        if data_line.startswith("data: "):
-                            try:
-                                payload = json.loads(data_line[6:])
-                                payload["step_id"] = step_id
-                                payload["step_index"] = idx
-                                yield f"event: step_{event_type}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
-                            except Exception:
-                                yield event
-                        else:
-                            yield event
-                    elif event.startswith("data: "):
-                        payload_str = event[6:].strip().split("\n")[0]
-                        if payload_str == "[DONE]":
+                        yield _tag_step_event(event, step_id, idx)
+                    elif event.startswith(b"data: "):
+                        payload_str = event[6:].strip().split(b"\n")[0]
+                        if payload_str == b"[DONE]":
                             continue
                         try:
-                            chunk = json.loads(payload_str)
+                            chunk = json_loads(payload_str)
                             delta = chunk.get("choices", [{}])[0].get("delta", {}).get("content", "")
                             if delta:
                                 step_text += delta
-                                yield f"event: step_stream\ndata: {json.dumps({'step_id': step_id, 'index': idx, 'content': delta}, ensure_ascii=False)}\n\n"
+                                yield f"event: step_stream\ndata: {json_dumps({'step_id': step_id, 'index': idx, 'content': delta})}\n\n"
                         except Exception:
                             pass
             except Exception as e:
@@ -1246,8 +1405,8 @@ async def run_workflow(
                                 "duration": duration, "tokens": 0,
                                 "status": 500, "status_text": "Error",
                                 "preview": str(e)[:150],
-                                "request_payload": json.dumps({"variables": resolved_vars, "agent": {"id": str(agent_row.id), "name": agent_row.name}}),
-                                "response_payload": json.dumps({"text": str(e), "truncated": False}),
+                                "request_payload": json_dumps({"variables": resolved_vars, "agent": {"id": str(agent_row.id), "name": agent_row.name}}),
+                                "response_payload": json_dumps({"text": str(e), "truncated": False}),
                                 "workflow_id": wf_id, "workflow_name": wf_name, "workflow_step": idx,
                                 "agent_name": agent_row.name,
                             }
@@ -1255,7 +1414,7 @@ async def run_workflow(
                         await hist_session.commit()
                 except Exception:
                     pass
-                yield f"event: step_error\ndata: {json.dumps({'step_id': step_id, 'index': idx, 'error': str(e)})}\n\n"
+                yield f"event: step_error\ndata: {json_dumps({'step_id': step_id, 'index': idx, 'error': str(e)})}\n\n"
                 continue
 
             # Use executor's collected text if available
@@ -1296,8 +1455,8 @@ async def run_workflow(
                             "duration": duration, "tokens": token_est,
                             "status": step_status, "status_text": "OK",
                             "preview": preview,
-                            "request_payload": json.dumps(req_payload),
-                            "response_payload": json.dumps(res_payload),
+                            "request_payload": json_dumps(req_payload),
+                            "response_payload": json_dumps(res_payload),
                             "workflow_id": wf_id, "workflow_name": wf_name, "workflow_step": idx,
                             "agent_name": agent_row.name,
                         }
@@ -1306,10 +1465,10 @@ async def run_workflow(
             except Exception:
                 pass
 
-            yield f"event: step_done\ndata: {json.dumps({'step_id': step_id, 'index': idx, 'output_preview': final_text, 'output_length': len(final_text)})}\n\n"
+            yield f"event: step_done\ndata: {json_dumps({'step_id': step_id, 'index': idx, 'output_preview': final_text, 'output_length': len(final_text)})}\n\n"
 
         # All steps done
-        yield f"event: workflow_done\ndata: {json.dumps({'total_steps': len(steps), 'step_outputs': {k: v[:200] for k, v in step_outputs.items()}})}\n\n"
+        yield f"event: workflow_done\ndata: {json_dumps({'total_steps': len(steps), 'step_outputs': {k: v[:200] for k, v in step_outputs.items()}})}\n\n"
         yield "data: [DONE]\n\n"
 
     return StreamingResponse(workflow_generator(), media_type="text/event-stream")
@@ -1356,7 +1515,7 @@ async def run_agent(agent_id: str, req: AgentRunRequest = None, session: AsyncSe
 
     config = row.config
     if isinstance(config, str):
-        config = json.loads(config)
+        config = json_loads(config)
 
     agent_name = row.name
     model = config.get("selectedModel", "")
@@ -1415,7 +1574,7 @@ async def run_agent(agent_id: str, req: AgentRunRequest = None, session: AsyncSe
                 yield event
         except Exception as e:
             status_code = 500
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            yield f"data: {json_dumps({'error': str(e)})}\n\n"
         finally:
             # Log to history
             elapsed_ms = int((time.time() - start_time) * 1000)
@@ -1440,8 +1599,8 @@ async def run_agent(agent_id: str, req: AgentRunRequest = None, session: AsyncSe
                             "duration": duration, "tokens": token_est,
                             "status": status_code, "status_text": "OK" if status_code == 200 else "Error",
                             "preview": preview,
-                            "request_payload": json.dumps(req_payload),
-                            "response_payload": json.dumps(res_payload),
+                            "request_payload": json_dumps(req_payload),
+                            "response_payload": json_dumps(res_payload),
                             "agent_name": agent_name,
                         }
                     )
@@ -1,14 +1,40 @@
-from pydantic import BaseModel, Field
+import base64
+import sys
+from array import array
+
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, Any
 from datetime import datetime
 
 
+def decode_embedding_b64(data: str) -> list[float]:
+    """Decode base64 little-endian float32 bytes (as sent in `embedding_b64`) into floats."""
+    raw = base64.b64decode(data, validate=True)
+    if len(raw) % 4:
+        raise ValueError("embedding_b64 length is not a multiple of 4 bytes")
+    vec = array("f")
+    vec.frombytes(raw)
+    if sys.byteorder == "big":
+        vec.byteswap()
+    return vec.tolist()
+
+
 class DocumentInput(BaseModel):
     text: str
-    embedding: list[float]
+    embedding: Optional[list[float]] = None
+    embedding_b64: Optional[str] = None  # base64(float32 LE bytes), ~3x smaller than a JSON float list
     source: str = "manual"
     source_label: str = ""
 
+    @model_validator(mode="after")
+    def _decode_embedding(self):
+        if self.embedding_b64 is not None:
+            self.embedding = decode_embedding_b64(self.embedding_b64)
+            self.embedding_b64 = None
+        if self.embedding is None:
+            raise ValueError("embedding or embedding_b64 is required")
+        return self
+
 
 class DocumentsAddRequest(BaseModel):
     documents: list[DocumentInput]
@@ -24,17 +50,42 @@ class DocumentResponse(BaseModel):
 
 class DocumentsListResponse(BaseModel):
     data: list[DocumentResponse]
-    total: int
+    total: Optional[int] = None  # None on cursor pages after the first
     page: int
     limit: int
+    next_cursor: Optional[str] = None  # set in cursor mode when more rows follow
 
 
 class DocumentUpdate(BaseModel):
     text: Optional[str] = None
     embedding: Optional[list[float]] = None
+    embedding_b64: Optional[str] = None
     source: Optional[str] = None
     source_label: Optional[str] = None
 
+    @model_validator(mode="after")
+    def _decode_embedding(self):
+        if self.embedding_b64 is not None:
+            self.embedding = decode_embedding_b64(self.embedding_b64)
+            self.embedding_b64 = None
+        return self
+
+
+class EnrichFormsRequest(BaseModel):
+    source_label: str = "ITSM Form Templates"
+    suffixes: dict[str, str]           # form name ("Form: <name>" line) -> text appended to the doc
+    skip_markers: list[str] = []       # docs already containing any of these are left alone
+    embed_model: str = ""              # empty = first model reported by the embed API
+
+
+class EnrichFormsResponse(BaseModel):
+    total: int
+    enriched: int
+    no_match: int                      # "Form:" docs with no suffix for their form name
+    enriched_forms: list[str]
+    elapsed_ms: int
+    skipped: int = 0                   # docs without a "Form:" line
+
 
 class BulkDeleteRequest(BaseModel):
     ids: list[str]
@@ -231,6 +282,8 @@ class AgentUpdate(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
     config: Optional[dict] = None
+    # Top-level keys merged into the stored config (applied after `config`)
+    config_patch: Optional[dict] = None
 
 
 class AgentResponse(BaseModel):
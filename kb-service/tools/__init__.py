@@ -1,30 +1,45 @@
 """
 Tool Registry for Agentic Architecture.
-Each tool has: name, description, parameters schema (OpenAI function format), and an async handler.
+Each tool has: name, description, parameters schema (OpenAI function format), an async handler,
+and the concurrency pool its calls run in.
 """
 
+import asyncio
+
 from tools.kb_search import KB_SEARCH_TOOL, execute_kb_search
 from tools.dataset_query import DATASET_QUERY_TOOL, execute_dataset_query
 from tools.web_fetch import WEB_FETCH_TOOL, execute_web_fetch
 from tools.sub_agent import SUB_AGENT_TOOL, execute_sub_agent
 
-# Master registry: tool_name -> { schema, handler }
+# Process-wide caps on concurrently running tool calls, across all agent runs.
+# "llm" tools start further model calls (sub-agents), so their cap is kept well below
+# what the vLLM server admits; "io" tools only wait on the DB or HTTP.
+TOOL_POOLS = {
+    "io": asyncio.Semaphore(64),
+    "llm": asyncio.Semaphore(8),
+}
+
+# Master registry: tool_name -> { schema, handler, pool }
 TOOL_REGISTRY = {
     "kb_search": {
         "schema": KB_SEARCH_TOOL,
         "handler": execute_kb_search,
+        "pool": "io",
     },
     "dataset_query": {
         "schema": DATASET_QUERY_TOOL,
         "handler": execute_dataset_query,
+        "pool": "io",
     },
     "web_fetch": {
         "schema": WEB_FETCH_TOOL,
         "handler": execute_web_fetch,
+        "pool": "io",
     },
     "sub_agent": {
         "schema": SUB_AGENT_TOOL,
         "handler": execute_sub_agent,
+        "pool": "llm",
     },
 }
 
@@ -45,6 +60,12 @@ def get_tool_handler(tool_name: str):
     return entry["handler"] if entry else None
 
 
+def get_tool_pool(tool_name: str) -> asyncio.Semaphore:
+    """Return the concurrency pool (semaphore) a tool's calls run in."""
+    entry = TOOL_REGISTRY.get(tool_name)
+    return TOOL_POOLS[entry["pool"] if entry else "io"]
+
+
 def get_available_tool_names() -> list[str]:
     """Return all registered tool names."""
     return list(TOOL_REGISTRY.keys())
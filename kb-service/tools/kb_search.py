@@ -2,7 +2,6 @@
 KB Search Tool - Semantic search in the Knowledge Base using pgvector.
 """
 
-import httpx
 from sqlalchemy import text
 
 KB_SEARCH_TOOL = {
@@ -59,18 +58,14 @@ async def execute_kb_search(args: dict, context: dict) -> str:
     if not session or not embed_url or not embed_model:
         return "Error: KB search context not configured (session, embed_url, embed_model required)"
 
+    # Imported here: agent_executor imports the tools package at module load
+    from agent_executor import embed_query_literal
+
     try:
-        # 1. Embed the query
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            embed_resp = await client.post(
-                f"{embed_url}/embeddings",
-                json={"model": embed_model, "input": query}
-            )
-            embed_data = embed_resp.json()
-            query_embedding = embed_data["data"][0]["embedding"]
+        # 1. Embed the query — shared client, batcher and literal cache with RAG
+        embedding_str = await embed_query_literal(embed_url, embed_model, query)
 
         # 2. Search pgvector
-        embedding_str = "[" + ",".join(str(v) for v in query_embedding) + "]"
         search_params = {
             "embedding": embedding_str,
             "threshold": threshold,
@@ -93,7 +88,7 @@ async def execute_kb_search(args: dict, context: dict) -> str:
             FROM kb_documents
             WHERE 1 - (embedding <=> CAST(:embedding AS vector)) >= :threshold
             {where_clause}
-            ORDER BY similarity DESC
+            ORDER BY similarity DESC, id
             LIMIT :top_k
         """
         result = await session.execute(text(search_query), search_params)